@@ -0,0 +1,364 @@
+"""
+Evaluate many results files against one dataset in a single batch.
+
+Comparing runs (different limits, configs or providers) used to take one
+evaluation per file, each loading and normalizing the qrels again. Here the
+qrels are indexed once, shared with the worker processes through
+memory-mapped arrays (see sharded_evaluator.shared_qrels), and the runs are
+evaluated in parallel, one file per task. Each file is streamed, so memory
+per worker is bounded by the qrels and one batch of queries.
+
+The result is a leaderboard sorted by one metric plus the metrics of every
+run, with the latency percentiles, QPS and error rate of runs whose results
+carry per-query timings (see latency_metrics). Files that cannot be
+evaluated are reported as errors without failing the rest of the batch.
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+from py_metrics.beir_evaluator import ENGINES, create_empty_metrics
+from py_metrics.fast_evaluator import (
+    METRIC_PREFIXES,
+    PerQueryMetrics,
+    aggregate_metrics,
+)
+from py_metrics.per_query_metrics import per_query_path_for, save_per_query_metrics
+from py_metrics.qrels_cache import qrels_cache
+from py_metrics.sharded_evaluator import (
+    SHARD_BATCH_QUERIES,
+    iter_shard_tasks,
+    shared_qrels,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Number of runs evaluated at once
+BATCH_EVAL_WORKERS = int(os.getenv("BATCH_EVAL_WORKERS", str(os.cpu_count() or 1)))
+
+
+def metric_labels(k_values):
+    """Leaderboard column labels, e.g. NDCG@10, in display order"""
+    return [f"{prefix}@{k}" for prefix in METRIC_PREFIXES.values() for k in k_values]
+
+
+def expand_result_paths(patterns):
+    """
+    Expand result file paths and glob patterns.
+
+    Returns:
+        Tuple of (paths, errors): the matching files in pattern order without
+        duplicates, and {pattern: message} for paths and patterns matching
+        no file
+    """
+    paths = []
+    errors = {}
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = sorted(
+                path
+                for path in glob.glob(pattern, recursive=True)
+                if os.path.isfile(path)
+            )
+            if not matches:
+                errors[pattern] = "No results files match this pattern"
+        elif os.path.isfile(pattern):
+            matches = [pattern]
+        else:
+            matches = []
+            errors[pattern] = "Results file not found"
+        paths.extend(path for path in matches if path not in paths)
+    return paths, errors
+
+
+def build_leaderboard(runs, k_values, sort_by):
+    """
+    Rank evaluated runs by one metric.
+
+    Args:
+        runs: {path: {"metrics": ..., "stats": ...}} of the evaluated runs,
+            with a "latency" summary for runs that have timings
+        k_values: List of k values the runs were evaluated at
+        sort_by: Metric label to rank by, e.g. "NDCG@10"
+
+    Returns:
+        List of rows, best first (ties by path), each holding the rank, the
+        run's path and name, its query count and time, one column per
+        metric label, and the P50/P95 latency, QPS and error rate of runs
+        with timings
+    """
+    rows = []
+    for path, run in runs.items():
+        row = {
+            "run": path,
+            "name": os.path.basename(path),
+            "queries_evaluated": run["stats"]["queries_evaluated"],
+            "seconds": run["stats"]["seconds"],
+        }
+        for group in run["metrics"].values():
+            row.update(group)
+        latency = run.get("latency") or {}
+        if "latency_ms" in latency:
+            row["latency_p50_ms"] = latency["latency_ms"]["P50"]
+            row["latency_p95_ms"] = latency["latency_ms"]["P95"]
+        if "throughput" in latency:
+            row["qps"] = latency["throughput"]["qps"]
+        if latency:
+            row["error_rate"] = latency["error_rate"]
+        rows.append(row)
+    rows.sort(key=lambda row: (-row.get(sort_by, 0.0), row["run"]))
+    return [{"rank": rank, **row} for rank, row in enumerate(rows, start=1)]
+
+
+def format_leaderboard(leaderboard, columns):
+    """Plain-text table of a leaderboard with the given metric columns"""
+    headers = ["#", "run", "queries"] + list(columns)
+    lines = [
+        [str(row["rank"]), row["name"], str(row["queries_evaluated"])]
+        + [f"{row[column]:.5f}" if column in row else "-" for column in columns]
+        for row in leaderboard
+    ]
+    widths = [
+        max(len(cells[i]) for cells in [headers] + lines) for i in range(len(headers))
+    ]
+    return "\n".join(
+        "  ".join(cell.ljust(width) for cell, width in zip(cells, widths))
+        for cells in [headers] + lines
+    )
+
+
+def evaluate_result_files(
+    result_paths,
+    qrels_index,
+    k_values,
+    engine="beir",
+    sort_by=None,
+    workers=None,
+    progress=None,
+    per_query_paths=None,
+    dataset_name=None,
+    batch_queries=None,
+):
+    """
+    Evaluate results files in parallel against one QrelsIndex.
+
+    Args:
+        result_paths: Results files in any format read by results_format
+        qrels_index: QrelsIndex of the dataset, shared by all runs
+        k_values: List of k values for evaluation
+        engine: "beir" or "numpy"
+        sort_by: Metric label ranking the leaderboard (default NDCG at the
+            largest k value)
+        workers: Runs evaluated at once (default BATCH_EVAL_WORKERS); 1
+            evaluates them in the calling process
+        progress: Optional callback receiving runs_done and runs_total
+            keyword arguments whenever a run finishes
+        per_query_paths: Optional {results path: .npz path} of runs whose
+            per-query metrics should be saved
+        dataset_name: Dataset recorded in the per-query files
+        batch_queries: Queries scored together (default SHARD_BATCH_QUERIES)
+
+    Returns:
+        Dict with the "leaderboard" rows, the "runs" {path: {"metrics",
+        "stats", "latency"}} and the "errors" {path: message} of runs that
+        failed
+    """
+    if engine not in ENGINES:
+        raise ValueError(
+            f"Unknown evaluation engine '{engine}', expected one of {ENGINES}"
+        )
+    k_values = list(k_values)
+    sort_by = sort_by or f"NDCG@{max(k_values)}"
+    if sort_by not in metric_labels(k_values):
+        raise ValueError(
+            f"Cannot sort by '{sort_by}', expected one of {metric_labels(k_values)}"
+        )
+    per_query_paths = per_query_paths or {}
+    workers = max(1, min(len(result_paths), workers or BATCH_EVAL_WORKERS))
+    batch_queries = batch_queries or SHARD_BATCH_QUERIES
+    runs = {}
+    errors = {}
+    started = time.perf_counter()
+
+    with shared_qrels(qrels_index) as qrels_dir:
+        tasks = [
+            (position, ("file", str(path)), qrels_dir, k_values, engine, batch_queries)
+            for position, path in enumerate(result_paths)
+        ]
+        if progress is not None:
+            progress(runs_done=0, runs_total=len(result_paths))
+        finished = iter_shard_tasks(tasks, workers)
+        try:
+            for done, (position, future) in enumerate(finished, start=1):
+                path = result_paths[position]
+                try:
+                    output = future.result()
+                except Exception as e:
+                    logger.error(f"Error evaluating {path}: {e}")
+                    errors[path] = str(e)
+                else:
+                    runs[path] = _merge_run(
+                        output,
+                        k_values,
+                        per_query_paths.get(path),
+                        dataset_name=dataset_name,
+                        engine=engine,
+                    )
+                if progress is not None:
+                    progress(runs_done=done, runs_total=len(result_paths))
+        finally:
+            finished.close()
+
+    logger.info(
+        f"Evaluated {len(runs)} of {len(result_paths)} runs with {workers} "
+        f"workers in {time.perf_counter() - started:.2f}s"
+    )
+    # Keep the runs in the order they were given
+    runs = {path: runs[path] for path in result_paths if path in runs}
+    return {
+        "leaderboard": build_leaderboard(runs, k_values, sort_by),
+        "runs": runs,
+        "errors": errors,
+    }
+
+
+def _merge_run(output, k_values, per_query_path=None, dataset_name=None, engine=None):
+    """Average one run's per-query values, saving them to per_query_path"""
+    stats = {
+        key: output["stats"][key]
+        for key in ("queries_read", "queries_evaluated", "seconds")
+    }
+    run = {"stats": stats}
+    latency = output["latency"].summary()
+    if latency is not None:
+        run["latency"] = latency
+    if not output["query_ids"]:
+        return {"metrics": create_empty_metrics(k_values), **run}
+
+    values = {name: np.concatenate(output["values"][name]) for name in METRIC_PREFIXES}
+    if per_query_path is not None:
+        per_query = PerQueryMetrics.from_unsorted(output["query_ids"], k_values, values)
+        save_per_query_metrics(
+            per_query, per_query_path, dataset_name=dataset_name, engine=engine
+        )
+        stats["per_query_path"] = per_query_path
+    return {"metrics": aggregate_metrics(values, k_values), **run}
+
+
+def evaluate_batch(
+    patterns,
+    qrels_path,
+    k_values,
+    engine="beir",
+    sort_by=None,
+    workers=None,
+    progress=None,
+    per_query=False,
+):
+    """
+    Expand result paths or globs and evaluate every match against a qrels
+    file (qrels.json or the indexed qrels.npz), indexed once through the
+    qrels cache.
+
+    With per_query, each run's per-query metrics are saved next to its
+    results file (see per_query_metrics.per_query_path_for).
+    """
+    result_paths, errors = expand_result_paths(patterns)
+    if progress is not None:
+        progress(stage="loading qrels", runs_total=len(result_paths))
+    qrels_index = qrels_cache.get_qrels_index(qrels_path)
+    if progress is not None:
+        progress(stage="evaluating")
+    batch = evaluate_result_files(
+        result_paths,
+        qrels_index,
+        k_values,
+        engine=engine,
+        sort_by=sort_by,
+        workers=workers,
+        progress=progress,
+        per_query_paths=(
+            {path: str(per_query_path_for(path)) for path in result_paths}
+            if per_query
+            else None
+        ),
+        dataset_name=Path(qrels_path).parent.name,
+    )
+    batch["errors"] = {**errors, **batch["errors"]}
+    return batch
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Evaluate many search results files against one dataset"
+    )
+    parser.add_argument("qrels_path", help="Path to qrels.json or qrels.npz")
+    parser.add_argument(
+        "results", nargs="+", help="Results files or glob patterns (quote globs)"
+    )
+    parser.add_argument(
+        "--k-values",
+        nargs="+",
+        type=int,
+        default=[1, 3, 5, 10],
+        help="K values for evaluation metrics (default: 1 3 5 10)",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default="beir",
+        help="Evaluation engine to use (default: beir)",
+    )
+    parser.add_argument(
+        "--sort-by", help="Metric ranking the runs (default: NDCG at the largest k)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Runs evaluated at once (default: BATCH_EVAL_WORKERS)",
+    )
+    parser.add_argument(
+        "--per-query",
+        action="store_true",
+        help="Save per-query metrics next to each results file",
+    )
+    parser.add_argument("--output", help="Also save the batch result as JSON here")
+    args = parser.parse_args()
+
+    batch = evaluate_batch(
+        args.results,
+        args.qrels_path,
+        args.k_values,
+        engine=args.engine,
+        sort_by=args.sort_by,
+        workers=args.workers,
+        per_query=args.per_query,
+    )
+    columns = [f"{prefix}@{max(args.k_values)}" for prefix in METRIC_PREFIXES.values()]
+    if args.sort_by and args.sort_by not in columns:
+        columns.insert(0, args.sort_by)
+    columns += [
+        column
+        for column in ("latency_p95_ms", "qps")
+        if any(column in row for row in batch["leaderboard"])
+    ]
+    print(format_leaderboard(batch["leaderboard"], columns))
+    for path, error in batch["errors"].items():
+        print(f"Error: {path}: {error}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(batch, f, indent=2)
+        print(f"Batch results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
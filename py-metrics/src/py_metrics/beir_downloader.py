@@ -2,41 +2,261 @@ import json
 import logging
 import argparse
 import zipfile
-import shutil
 import requests
 import os
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from py_metrics.dataset_converter import convert_beir_zip
+from py_metrics.dataset_store import QRELS_INDEX_FILE, DatasetStore
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def http_get(url, output_path):
+BEIR_DATASETS_URL = "https://public.ukp.informatik.tu-darmstadt.de/thakur/BEIR/datasets"
+
+# Number of concurrent HTTP Range requests per download
+DOWNLOAD_PARTS = int(os.getenv("BEIR_DOWNLOAD_PARTS", "4"))
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_TIMEOUT = 60
+# Each part syncs its data and saves the download state after this many
+# bytes or seconds, whichever comes first
+DOWNLOAD_STATE_INTERVAL_BYTES = 16 * 1024 * 1024
+DOWNLOAD_STATE_INTERVAL_SECONDS = 5.0
+
+
+def _probe(url):
+    """Return (size, accepts_ranges) for a URL, size is 0 if unknown"""
+    r = requests.head(url, allow_redirects=True, timeout=DOWNLOAD_TIMEOUT)
+    r.raise_for_status()
+    size = int(r.headers.get("Content-Length") or 0)
+    accepts_ranges = r.headers.get("Accept-Ranges", "").lower() == "bytes"
+    return size, accepts_ranges
+
+
+def _load_download_state(state_path, url, size, num_parts):
+    """
+    Load the per-part progress of an interrupted download, or plan a new one.
+
+    Parts are contiguous byte ranges [start, end] with a count of bytes done.
+    """
+    if state_path.exists():
+        try:
+            with open(state_path, "r") as f:
+                state = json.load(f)
+            if state.get("url") == url and state.get("size") == size:
+                return state
+        except (json.JSONDecodeError, OSError):
+            pass
+        logger.info(f"Discarding stale download state {state_path}")
+
+    part_size = -(-size // num_parts)
+    parts = [
+        {"start": start, "end": min(start + part_size, size) - 1, "done": 0}
+        for start in range(0, size, part_size)
+    ]
+    return {"url": url, "size": size, "parts": parts}
+
+
+def _sync(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def _download_part(url, part_path, part, save_state, report):
+    """
+    Fetch the remaining bytes of one part with an HTTP Range request.
+
+    Written bytes are only added to part["done"] once flushed and fsynced,
+    so a saved state never counts data a crash could lose. That happens
+    every DOWNLOAD_STATE_INTERVAL_BYTES or DOWNLOAD_STATE_INTERVAL_SECONDS,
+    and when the part stops, even on an error. report receives the size of
+    every chunk written.
+    """
+    if part["start"] + part["done"] > part["end"]:
+        return
+    headers = {"Range": f"bytes={part['start'] + part['done']}-{part['end']}"}
+    with requests.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as r:
+        r.raise_for_status()
+        if r.status_code != 206:
+            raise IOError(f"Server ignored range request for {url}")
+        with open(part_path, "r+b") as f:
+            f.seek(part["start"] + part["done"])
+            unsynced = 0
+            last_sync = time.monotonic()
+            try:
+                for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                    unsynced += len(chunk)
+                    report(len(chunk))
+                    if (
+                        unsynced >= DOWNLOAD_STATE_INTERVAL_BYTES
+                        or time.monotonic() - last_sync
+                        >= DOWNLOAD_STATE_INTERVAL_SECONDS
+                    ):
+                        _sync(f)
+                        part["done"] += unsynced
+                        unsynced = 0
+                        last_sync = time.monotonic()
+                        save_state()
+            finally:
+                # Keep what was written before a failure, so a resume skips it
+                _sync(f)
+                part["done"] += unsynced
+                save_state()
+
+
+def _file_md5(path):
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def verify_zip(path, expected_md5=None):
+    """
+    Check a downloaded zip before extraction.
+
+    Compares the file's MD5 with expected_md5 when given, then checks the
+    CRC of every archive member.
+
+    Raises:
+        ValueError: If the checksum or archive is invalid
+    """
+    if expected_md5 is not None:
+        actual_md5 = _file_md5(path)
+        if actual_md5 != expected_md5.lower():
+            raise ValueError(
+                f"Checksum mismatch for {path}: expected {expected_md5}, got {actual_md5}"
+            )
+    try:
+        with zipfile.ZipFile(path, "r") as zip_ref:
+            bad_member = zip_ref.testzip()
+    except zipfile.BadZipFile as e:
+        raise ValueError(f"Corrupt zip file {path}: {e}")
+    if bad_member is not None:
+        raise ValueError(f"Corrupt member {bad_member} in zip file {path}")
+
+
+def http_get(
+    url, output_path, num_parts=DOWNLOAD_PARTS, expected_md5=None, progress=None
+):
     """
     Downloads a URL to a specified file path.
 
+    Data is written to "{output_path}.part" and only renamed to output_path
+    once complete and verified, so an existing output_path is never partial.
+    When the server supports HTTP Range requests the file is fetched in
+    num_parts concurrent parts, and progress is kept in
+    "{output_path}.part.json" so an interrupted download resumes where it
+    stopped.
+
     Args:
         url: The URL to download
         output_path: The local path to save the downloaded file
+        num_parts: Number of concurrent range requests
+        expected_md5: Optional MD5 hex digest the file must match
+        progress: Optional callback receiving bytes_downloaded and bytes_total
+            keyword arguments after every chunk
     """
-    with requests.get(url, stream=True) as r:
-        r.raise_for_status()
-        with open(output_path, "wb") as f:
-            for chunk in r.iter_content(chunk_size=8192):
-                f.write(chunk)
+    output_path = Path(output_path)
+    part_path = output_path.with_name(output_path.name + ".part")
+    state_path = output_path.with_name(output_path.name + ".part.json")
+
+    size, accepts_ranges = _probe(url)
+    if accepts_ranges and size > 0:
+        state = _load_download_state(state_path, url, size, max(num_parts, 1))
+        if not part_path.exists() or part_path.stat().st_size != size:
+            # Preallocate so every part can write at its own offset
+            with open(part_path, "ab") as f:
+                f.truncate(size)
+            for part in state["parts"]:
+                part["done"] = 0
+
+        state_lock = threading.Lock()
+        progress_lock = threading.Lock()
+        resumed = sum(part["done"] for part in state["parts"])
+        downloaded = resumed
+
+        def save_state():
+            # Written atomically, so a crash mid-write keeps the previous state
+            with state_lock:
+                tmp_path = f"{state_path}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(state, f)
+                os.replace(tmp_path, state_path)
 
+        def report(nbytes):
+            nonlocal downloaded
+            with progress_lock:
+                downloaded += nbytes
+                if progress is not None:
+                    progress(bytes_downloaded=downloaded, bytes_total=size)
 
-def download_beir_dataset(dataset_name, output_dir=None):
+        if resumed:
+            logger.info(f"Resuming download of {url} at {resumed}/{size} bytes")
+        with ThreadPoolExecutor(max_workers=len(state["parts"])) as executor:
+            futures = [
+                executor.submit(
+                    _download_part, url, part_path, part, save_state, report
+                )
+                for part in state["parts"]
+            ]
+            for future in futures:
+                future.result()
+    else:
+        logger.info("Server does not support range requests, using one connection")
+        with requests.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as r:
+            r.raise_for_status()
+            with open(part_path, "wb") as f:
+                for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                    if progress is not None:
+                        progress(bytes_downloaded=f.tell(), bytes_total=size or None)
+
+    try:
+        verify_zip(part_path, expected_md5)
+    except ValueError:
+        # Corrupt data cannot be resumed, start over next time
+        part_path.unlink(missing_ok=True)
+        state_path.unlink(missing_ok=True)
+        raise
+    os.replace(part_path, output_path)
+    state_path.unlink(missing_ok=True)
+
+
+def download_beir_dataset(
+    dataset_name,
+    output_dir=None,
+    legacy_json=False,
+    expected_md5=None,
+    num_parts=DOWNLOAD_PARTS,
+    progress=None,
+):
     """
-    Download a specified BEIR dataset and save its components as JSON files.
+    Download a specified BEIR dataset and save it in the indexed layout.
+
+    Corpus and queries are kept as JSONL files with offset/id indexes and qrels
+    are saved as qrels.npz (see dataset_store).
 
     Args:
         dataset_name: Name of the BEIR dataset to download
         output_dir: Directory to save the dataset. If None, uses default directory
+        legacy_json: Also write the monolithic corpus.json, queries.json and
+            qrels.json files
+        expected_md5: Optional MD5 hex digest the downloaded zip must match
+        num_parts: Number of concurrent range requests for the download
+        progress: Optional callback receiving keyword arguments describing
+            the download and conversion progress (stage, bytes_downloaded,
+            bytes_total, docs_converted, bytes_converted)
 
     Returns:
-        Dict containing paths to the saved JSON files
+        Dict containing paths to the saved corpus, queries and qrels files
     """
     # Set up output directory
     if output_dir is None:
@@ -57,157 +277,146 @@ def download_beir_dataset(dataset_name, output_dir=None):
     queries_json_path = dataset_dir / "queries.json"
     qrels_json_path = dataset_dir / "qrels.json"
 
+    if legacy_json:
+        output_paths = {
+            "corpus_path": str(corpus_json_path),
+            "queries_path": str(queries_json_path),
+            "qrels_path": str(qrels_json_path),
+        }
+    else:
+        output_paths = {
+            "corpus_path": str(dataset_dir / "corpus.jsonl"),
+            "queries_path": str(dataset_dir / "queries.jsonl"),
+            "qrels_path": str(dataset_dir / QRELS_INDEX_FILE),
+        }
+
     # Check if output files already exist
-    if (
+    legacy_files_exist = (
         corpus_json_path.exists()
         and queries_json_path.exists()
         and qrels_json_path.exists()
-    ):
+    )
+    if DatasetStore.is_indexed(dataset_dir) and (legacy_files_exist or not legacy_json):
         logger.info(f"Files already exist in {dataset_dir}, skipping processing")
-        return {
-            "corpus_path": str(corpus_json_path),
-            "queries_path": str(queries_json_path),
-            "qrels_path": str(qrels_json_path),
-        }
+        return output_paths
 
     logger.info(f"Downloading BEIR dataset: {dataset_name}")
     logger.info(f"Output directory: {dataset_dir}")
 
     # Download the dataset
     zip_path = output_dir / f"{dataset_name}.zip"
+    if zip_path.exists():
+        try:
+            verify_zip(zip_path, expected_md5)
+            logger.info(f"Zip file already exists at {zip_path}")
+        except ValueError as e:
+            logger.warning(f"Discarding existing zip file: {e}")
+            zip_path.unlink()
     if not zip_path.exists():
-        url = f"https://public.ukp.informatik.tu-darmstadt.de/thakur/BEIR/datasets/{dataset_name}.zip"
+        url = f"{BEIR_DATASETS_URL}/{dataset_name}.zip"
         try:
             logger.info(f"Downloading from {url} to {zip_path}")
-            http_get(url, zip_path)
+            if progress is not None:
+                progress(stage="downloading")
+            http_get(
+                url,
+                zip_path,
+                num_parts=num_parts,
+                expected_md5=expected_md5,
+                progress=progress,
+            )
         except Exception as e:
             logger.error(f"Failed to download dataset: {e}")
             raise
-    else:
-        logger.info(f"Zip file already exists at {zip_path}")
 
-    # Extract the zip file
+    # Convert straight from the zip members, nothing is extracted
     try:
-        logger.info(f"Extracting zip file to {output_dir}")
-        with zipfile.ZipFile(zip_path, "r") as zip_ref:
-            zip_ref.extractall(output_dir)
+        convert_beir_zip(
+            zip_path, dataset_dir, legacy_json=legacy_json, progress=progress
+        )
     except Exception as e:
-        logger.error(f"Failed to extract dataset: {e}")
+        logger.error(f"Failed to convert dataset: {e}")
         raise
 
-    # Check if corpus is in a subdirectory
-    expected_corpus_path = dataset_dir / "corpus.jsonl"
-    if not expected_corpus_path.exists():
-        # Find the correct directory
-        for subdir in dataset_dir.glob("*"):
-            if subdir.is_dir() and (subdir / "corpus.jsonl").exists():
-                logger.info(f"Found corpus in subdirectory: {subdir}")
-                # Move files up to main directory
-                for item in subdir.glob("*"):
-                    if item.is_file():
-                        shutil.copy(item, dataset_dir)
-                    elif item.is_dir():
-                        shutil.copytree(
-                            item, dataset_dir / item.name, dirs_exist_ok=True
-                        )
-                break
-
-    # Verify corpus exists
-    if not (dataset_dir / "corpus.jsonl").exists():
-        logger.error(f"Could not find corpus.jsonl in {dataset_dir}")
-        all_files = list(dataset_dir.glob("**/*"))
-        logger.error(f"Found files: {[str(f) for f in all_files]}")
-        raise FileNotFoundError(f"corpus.jsonl not found in {dataset_dir}")
-
-    # Convert corpus from JSONL to JSON
-    corpus = {}
-    with open(dataset_dir / "corpus.jsonl", "r") as f:
-        for line in f:
-            try:
-                item = json.loads(line)
-                corpus[item.get("_id")] = item
-            except json.JSONDecodeError as e:
-                logger.error(f"Error decoding line: {e}")
-                continue
-
-    with open(corpus_json_path, "w") as f:
-        json.dump(corpus, f)
-    logger.info(f"Corpus saved to: {corpus_json_path}")
-
-    # Process queries
-    queries = {}
-    queries_jsonl = dataset_dir / "queries.jsonl"
-    if queries_jsonl.exists():
-        with open(queries_jsonl, "r") as f:
-            for line in f:
-                try:
-                    item = json.loads(line)
-                    queries[item.get("_id")] = item
-                except json.JSONDecodeError:
-                    continue
-
-        with open(queries_json_path, "w") as f:
-            json.dump(queries, f)
-        logger.info(f"Queries saved to: {queries_json_path}")
-    else:
-        # Try to find queries in TSV format
-        for query_file in dataset_dir.glob("queries/*.tsv"):
-            with open(query_file, "r") as f:
-                for line in f:
-                    parts = line.strip().split("\t")
-                    if len(parts) >= 2:
-                        query_id, query_text = parts[0], parts[1]
-                        queries[query_id] = {"_id": query_id, "text": query_text}
-
-            with open(queries_json_path, "w") as f:
-                json.dump(queries, f)
-            logger.info(f"Queries converted from TSV and saved")
-            break
-
-    # Process qrels (relevance judgments)
-    qrels = {}
-    qrels_dir = dataset_dir / "qrels"
-    if qrels_dir.exists() and qrels_dir.is_dir():
-        for qrel_file in qrels_dir.glob("*.tsv"):
-            with open(qrel_file, "r") as f:
-                for line in f:
-                    parts = line.strip().split("\t")
-                    if len(parts) >= 3:
-                        # Skip header row
-                        if (
-                            parts[0] == "query-id"
-                            and parts[1] == "corpus-id"
-                            and parts[2] == "score"
-                        ):
-                            continue
-                        query_id, doc_id, score = parts[0], parts[1], float(parts[2])
-                        if query_id not in qrels:
-                            qrels[query_id] = {}
-                        qrels[query_id][doc_id] = score
-
-        if qrels:
-            with open(qrels_json_path, "w") as f:
-                json.dump(qrels, f)
-            logger.info(f"Qrels saved to: {qrels_json_path}")
-        else:
-            logger.warning("No qrels found")
-    else:
-        logger.warning(f"No qrels directory found")
+    return output_paths
+
+
+def download_many(dataset_names, output_dir=None, max_workers=4, **kwargs):
+    """
+    Download several BEIR datasets concurrently.
 
-    return {
-        "corpus_path": str(corpus_json_path),
-        "queries_path": str(queries_json_path),
-        "qrels_path": str(qrels_json_path),
-    }
+    Args:
+        dataset_names: Names of the BEIR datasets to download
+        output_dir: Directory to save the datasets. If None, uses default directory
+        max_workers: Number of datasets fetched at the same time
+        **kwargs: Passed through to download_beir_dataset
+
+    Returns:
+        Dict mapping each dataset name to its download_beir_dataset result,
+        or to {"error": message} if it failed
+    """
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            name: executor.submit(download_beir_dataset, name, output_dir, **kwargs)
+            for name in dict.fromkeys(dataset_names)
+        }
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                logger.error(f"Failed to download {name}: {e}")
+                results[name] = {"error": str(e)}
+    return results
 
 
 def main():
     parser = argparse.ArgumentParser(description="Download BEIR dataset")
-    parser.add_argument("dataset_name", help="Name of the BEIR dataset to download")
+    parser.add_argument(
+        "dataset_names", nargs="+", help="Names of the BEIR datasets to download"
+    )
     parser.add_argument("--output-dir", help="Directory to save the dataset")
+    parser.add_argument(
+        "--legacy-json",
+        action="store_true",
+        help="Also write corpus.json, queries.json and qrels.json",
+    )
+    parser.add_argument(
+        "--md5", help="Expected MD5 of the dataset zip (single dataset only)"
+    )
+    parser.add_argument(
+        "--parts",
+        type=int,
+        default=DOWNLOAD_PARTS,
+        help="Concurrent range requests per download",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=4, help="Datasets downloaded concurrently"
+    )
     args = parser.parse_args()
 
-    download_beir_dataset(args.dataset_name, args.output_dir)
+    if len(args.dataset_names) == 1:
+        download_beir_dataset(
+            args.dataset_names[0],
+            args.output_dir,
+            args.legacy_json,
+            expected_md5=args.md5,
+            num_parts=args.parts,
+        )
+        return
+
+    if args.md5:
+        parser.error("--md5 can only be used with a single dataset")
+    results = download_many(
+        args.dataset_names,
+        args.output_dir,
+        max_workers=args.workers,
+        legacy_json=args.legacy_json,
+        num_parts=args.parts,
+    )
+    failed = [name for name, result in results.items() if "error" in result]
+    if failed:
+        raise SystemExit(f"Failed to download: {', '.join(failed)}")
 
 
 if __name__ == "__main__":
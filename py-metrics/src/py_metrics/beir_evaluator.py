@@ -3,52 +3,31 @@ import logging
 import argparse
 from pathlib import Path
 import os
+import sqlite3
 
-from beir.retrieval.evaluation import EvaluateRetrieval
+from py_metrics.dataset_store import QrelsError, load_qrels_index, read_qrels
+from py_metrics.fast_evaluator import METRIC_PREFIXES, build_qrels_index, evaluate_run
+from py_metrics.latency_metrics import LatencyStats
+from py_metrics.per_query_metrics import evaluate_pytrec, save_per_query_metrics
+from py_metrics.results_format import detect_results_format, load_results
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def evaluate_beir_results(results, qrels_path=None, qrels=None, k_values=None):
+ENGINES = ("beir", "numpy")
+
+
+def normalize_qrels(loaded_qrels):
     """
-    Evaluate retrieval results using BEIR metrics
+    Convert qrels keys to strings and relevance values to integers
 
     Args:
-        results: Dict of {query_id: {doc_id: score, ...}, ...}
-        qrels_path: Path to qrels.json file
-        qrels: Dict of qrels if already loaded
-        k_values: List of k values for evaluation (default: [1, 3, 5, 10, 20])
+        loaded_qrels: Dict of {query_id: {doc_id: relevance, ...}, ...}
 
     Returns:
-        Dict of evaluation metrics
+        Dict of qrels in the form expected by BEIR's EvaluateRetrieval
     """
-    if k_values is None:
-        k_values = [1, 3, 5, 10, 20]
-
-    # Load qrels if not provided
-    if qrels is None:
-        if qrels_path is None:
-            raise ValueError("Either qrels or qrels_path must be provided")
-
-        qrels_path = Path(qrels_path)
-        if not qrels_path.exists():
-            logger.error(f"Qrels file not found at {qrels_path}")
-            # Return empty metrics if qrels file doesn't exist
-            return create_empty_metrics(k_values)
-
-        with open(qrels_path, "r") as f:
-            loaded_qrels = json.load(f)  # Load into a temporary variable
-
-    else:
-        loaded_qrels = qrels  # Use the provided qrels if not loading from file
-
-    # Validate loaded qrels format
-    if not loaded_qrels or not isinstance(loaded_qrels, dict):
-        logger.error(f"Invalid qrels format or empty qrels provided or in {qrels_path}")
-        return create_empty_metrics(k_values)
-
-    # --- Start: Convert qrels keys to strings and relevance values to integers ---
     processed_qrels = {}
     for query_id, docs in loaded_qrels.items():
         current_query_id_str = (
@@ -72,18 +51,19 @@ def evaluate_beir_results(results, qrels_path=None, qrels=None, k_values=None):
                 logger.warning(
                     f"Skipping invalid non-integer relevance score '{relevance}' for query {current_query_id_str}, doc {current_doc_id_str} in qrels."
                 )
-    # --- End: Convert qrels ---
+    return processed_qrels
 
-    # Initialize evaluator
-    evaluator = EvaluateRetrieval()
-    evaluator.k_values = k_values
 
-    # Validate results format from input
-    if not results or not isinstance(results, dict):
-        logger.error("Invalid results format or empty results from input")
-        return create_empty_metrics(k_values)
+def normalize_results(results):
+    """
+    Convert results keys to strings and scores to floats
+
+    Args:
+        results: Dict of {query_id: {doc_id: score, ...}, ...}
 
-    # --- Start: Convert results keys to strings and scores to floats ---
+    Returns:
+        Dict of results in the form expected by BEIR's EvaluateRetrieval
+    """
     processed_results = {}
     for query_id, docs_orig in results.items():
         current_query_id_str = (
@@ -108,7 +88,127 @@ def evaluate_beir_results(results, qrels_path=None, qrels=None, k_values=None):
                     f"Skipping invalid score '{score}' (cannot convert to float) for query {current_query_id_str}, doc {current_doc_id_str} in results."
                 )
         processed_results[current_query_id_str] = current_docs_processed
-    # --- End: Convert results ---
+    return processed_results
+
+
+def evaluate_beir_results(
+    results,
+    qrels_path=None,
+    qrels=None,
+    k_values=None,
+    engine="beir",
+    processed_qrels=None,
+    qrels_index=None,
+    progress=None,
+    return_per_query=False,
+):
+    """
+    Evaluate retrieval results using BEIR metrics
+
+    Args:
+        results: Dict of {query_id: {doc_id: score, ...}, ...}
+        qrels_path: Path to a qrels.npz or qrels.json file
+        qrels: Dict of qrels if already loaded
+        k_values: List of k values for evaluation (default: [1, 3, 5, 10, 20])
+        engine: "beir" to evaluate with pytrec_eval through BEIR, or "numpy"
+            to use the vectorized engine in fast_evaluator
+        processed_qrels: Qrels already passed through normalize_qrels, used
+            by the "beir" engine without reloading or normalizing
+        qrels_index: QrelsIndex already built from the qrels, used by the
+            "numpy" engine without reloading or re-indexing
+        progress: Optional callback receiving queries_evaluated and
+            queries_total keyword arguments as evaluation advances
+        return_per_query: Also return the per-query metrics, computed in the
+            same pass as the averages
+
+    Returns:
+        Dict of evaluation metrics. With return_per_query, a tuple of
+        (metrics, PerQueryMetrics), where the latter is None if evaluation
+        failed
+    """
+    metrics, per_query = _evaluate_beir_results(
+        results,
+        qrels_path,
+        qrels,
+        k_values,
+        engine,
+        processed_qrels,
+        qrels_index,
+        progress,
+        return_per_query,
+    )
+    return (metrics, per_query) if return_per_query else metrics
+
+
+def _evaluate_beir_results(
+    results,
+    qrels_path,
+    qrels,
+    k_values,
+    engine,
+    processed_qrels,
+    qrels_index,
+    progress,
+    return_per_query,
+):
+    """Implementation of evaluate_beir_results, returning (metrics, per_query)"""
+    if k_values is None:
+        k_values = [1, 3, 5, 10, 20]
+    if engine not in ENGINES:
+        raise ValueError(
+            f"Unknown evaluation engine '{engine}', expected one of {ENGINES}"
+        )
+
+    if engine == "numpy" and qrels_index is not None:
+        return _evaluate_with_numpy(
+            results, k_values, qrels_index=qrels_index, progress=progress
+        )
+
+    if engine == "numpy" or processed_qrels is None:
+        # Load qrels if not provided
+        if qrels is None:
+            if qrels_path is None:
+                raise ValueError("Either qrels or qrels_path must be provided")
+
+            qrels_path = Path(qrels_path)
+            if not qrels_path.exists():
+                logger.error(f"Qrels file not found at {qrels_path}")
+                # Return empty metrics if qrels file doesn't exist
+                return create_empty_metrics(k_values), None
+
+            if engine == "numpy" and qrels_path.suffix == ".npz":
+                # The indexed qrels are the numpy engine's input as they are
+                return _evaluate_with_numpy(
+                    results,
+                    k_values,
+                    qrels_index=load_qrels_index(qrels_path),
+                    progress=progress,
+                )
+            loaded_qrels = read_qrels(qrels_path)
+
+        else:
+            loaded_qrels = qrels  # Use the provided qrels if not loading from file
+
+        # Validate loaded qrels format
+        if not loaded_qrels or not isinstance(loaded_qrels, dict):
+            logger.error(
+                f"Invalid qrels format or empty qrels provided or in {qrels_path}"
+            )
+            return create_empty_metrics(k_values), None
+
+        if engine == "numpy":
+            return _evaluate_with_numpy(
+                results, k_values, loaded_qrels=loaded_qrels, progress=progress
+            )
+
+        processed_qrels = normalize_qrels(loaded_qrels)
+
+    # Validate results format from input
+    if not results or not isinstance(results, dict):
+        logger.error("Invalid results format or empty results from input")
+        return create_empty_metrics(k_values), None
+
+    processed_results = normalize_results(results)
 
     # Validate that there are queries in common (use processed keys)
     common_queries = set(processed_results.keys()).intersection(
@@ -116,221 +216,280 @@ def evaluate_beir_results(results, qrels_path=None, qrels=None, k_values=None):
     )
     if not common_queries:
         logger.error("No common queries between results and qrels")
-        return create_empty_metrics(k_values)
+        return create_empty_metrics(k_values), None
 
     logger.info(
         f"Evaluating {len(processed_results)} queries against {len(processed_qrels)} qrels"
     )
     logger.info(f"Common queries: {len(common_queries)}")
+    if progress is not None:
+        progress(queries_evaluated=0, queries_total=len(common_queries))
 
     try:
-        # Calculate metrics (ndcg, map, recall, precision)
-        # Pass the processed dictionaries
-        metrics = evaluator.evaluate(
-            processed_qrels, processed_results, evaluator.k_values
+        # pytrec_eval directly rather than BEIR's EvaluateRetrieval, which
+        # only returns the ndcg, map, recall and precision averages
+        metrics, per_query = _evaluate_with_pytrec(
+            processed_qrels, processed_results, k_values
         )
+    except Exception as e:
+        logger.error(f"Error in evaluation: {e}")
+        # Return empty metrics instead of error
+        return create_empty_metrics(k_values), None
 
-        # Log the type of metrics for debugging
-        logger.info(f"Metrics type: {type(metrics)}")
+    if progress is not None:
+        progress(
+            queries_evaluated=len(common_queries),
+            queries_total=len(common_queries),
+        )
+    return metrics, per_query if return_per_query else None
 
-        # Check if metrics is a tuple (some BEIR versions return tuples)
-        if isinstance(metrics, tuple):
-            logger.warning(
-                "evaluator.evaluate() returned a tuple instead of a dictionary"
-            )
-            # Convert the tuple to a dictionary manually
-            if len(metrics) >= 4:
-                metrics_dict = {
-                    "ndcg": metrics[0],
-                    "map": metrics[1],
-                    "recall": metrics[2],
-                    "precision": metrics[3],
-                }
-                metrics = metrics_dict
-            else:
-                logger.error(f"Metrics tuple has unexpected length: {len(metrics)}")
-                return create_empty_metrics(k_values)
-
-        return metrics
+
+def _evaluate_with_numpy(
+    results, k_values, loaded_qrels=None, qrels_index=None, progress=None
+):
+    """Evaluate results with the vectorized NumPy engine, returning (metrics, per_query)"""
+    if not results or not isinstance(results, dict):
+        logger.error("Invalid results format or empty results from input")
+        return create_empty_metrics(k_values), None
+
+    try:
+        if qrels_index is None:
+            qrels_index = build_qrels_index(loaded_qrels)
+        metrics, per_query = evaluate_run(
+            results, qrels_index, k_values, progress=progress, return_per_query=True
+        )
     except Exception as e:
         logger.error(f"Error in evaluation: {e}")
-        # Return empty metrics instead of error
-        return create_empty_metrics(k_values)
+        return create_empty_metrics(k_values), None
+
+    if metrics is None:
+        logger.error("No common queries between results and qrels")
+        return create_empty_metrics(k_values), None
+    return metrics, per_query
+
+
+def _evaluate_with_pytrec(processed_qrels, processed_results, k_values):
+    """
+    Evaluate with pytrec_eval directly, keeping the per-query scores.
+
+    Mirrors EvaluateRetrieval.evaluate (identical query/doc ids dropped,
+    averages over the scored queries rounded to 5 decimals), which only
+    returns the averages.
+    """
+    for query_id, docs in processed_results.items():
+        docs.pop(query_id, None)
+
+    per_query = evaluate_pytrec(processed_qrels, processed_results, k_values)
+    return per_query.aggregate(), per_query
 
 
 def create_empty_metrics(k_values):
     """Create empty metrics dictionary for when evaluation fails"""
-    metrics = {}
-    # Use properly formatted metric names expected by the frontend
-    metrics["ndcg"] = {k: 0.0 for k in k_values}
-    metrics["map"] = {k: 0.0 for k in k_values}
-    metrics["recall"] = {k: 0.0 for k in k_values}
-    metrics["precision"] = {k: 0.0 for k in k_values}
-    return metrics
+    return {name: {k: 0.0 for k in k_values} for name in METRIC_PREFIXES}
+
 
+def _metric_k(key, prefix):
+    """The k of a metric key given either as k or as a label like "NDCG@10" """
+    key = str(key)
+    if key.startswith(f"{prefix}@"):
+        key = key[len(prefix) + 1 :]
+    return int(key)
 
-def format_metrics(metrics):
-    """Format metrics for display/API return"""
-    formatted = {}
 
+def format_metrics(metrics, k_values=None):
+    """
+    Format metrics for display/API return
+
+    Every metric of METRIC_PREFIXES is returned with labels such as
+    "NDCG@10" or "MRR@100", sorted by k, whether the input is keyed by label
+    or by k. Metrics missing from the input are reported as 0.0 at the k
+    values of the others, or at k_values when given.
+    """
     # Check if metrics is a tuple (from BEIR evaluator) instead of dict
     if isinstance(metrics, tuple):
-        # Log a warning about unexpected tuple format
         logger.warning(
             "Received metrics as a tuple instead of a dictionary. Attempting to convert..."
         )
-        try:
-            # Try to convert tuple to dictionary - common structure for BEIR
-            # BEIR's EvaluateRetrieval sometimes returns (ndcg, _map, recall, precision)
-            if len(metrics) >= 4:
-                # Create a properly structured metrics dictionary
-                metrics_dict = {"ndcg": {}, "map": {}, "recall": {}, "precision": {}}
-
-                # BEIR tuple elements are often dictionaries keyed by k-values
-                # Extract and format them properly
-                ndcg_dict, map_dict, recall_dict, precision_dict = (
-                    metrics[0],
-                    metrics[1],
-                    metrics[2],
-                    metrics[3],
-                )
-
-                # Handle each metric dictionary if it exists and has the expected structure
-                if isinstance(ndcg_dict, dict):
-                    metrics_dict["ndcg"] = ndcg_dict
-                if isinstance(map_dict, dict):
-                    metrics_dict["map"] = map_dict
-                if isinstance(recall_dict, dict):
-                    metrics_dict["recall"] = recall_dict
-                if isinstance(precision_dict, dict):
-                    metrics_dict["precision"] = precision_dict
-
-                metrics = metrics_dict
-            else:
-                logger.error(
-                    f"Received tuple with unexpected length: {len(metrics)}. Creating empty metrics."
-                )
-                # Not enough elements in tuple, return empty metrics
-                return {
-                    "ndcg": {
-                        "NDCG@1": 0.0,
-                        "NDCG@3": 0.0,
-                        "NDCG@5": 0.0,
-                        "NDCG@10": 0.0,
-                    },
-                    "map": {"MAP@1": 0.0, "MAP@3": 0.0, "MAP@5": 0.0, "MAP@10": 0.0},
-                    "recall": {
-                        "Recall@1": 0.0,
-                        "Recall@3": 0.0,
-                        "Recall@5": 0.0,
-                        "Recall@10": 0.0,
-                    },
-                    "precision": {"P@1": 0.0, "P@3": 0.0, "P@5": 0.0, "P@10": 0.0},
-                }
-        except Exception as e:
-            logger.error(f"Error converting metrics tuple to dictionary: {e}")
-            # Return empty metrics with consistent format on error
-            return {
-                "ndcg": {"NDCG@1": 0.0, "NDCG@3": 0.0, "NDCG@5": 0.0, "NDCG@10": 0.0},
-                "map": {"MAP@1": 0.0, "MAP@3": 0.0, "MAP@5": 0.0, "MAP@10": 0.0},
-                "recall": {
-                    "Recall@1": 0.0,
-                    "Recall@3": 0.0,
-                    "Recall@5": 0.0,
-                    "Recall@10": 0.0,
-                },
-                "precision": {"P@1": 0.0, "P@3": 0.0, "P@5": 0.0, "P@10": 0.0},
-            }
+        # BEIR's EvaluateRetrieval returns (ndcg, _map, recall, precision)
+        metrics = {
+            name: values
+            for name, values in zip(METRIC_PREFIXES, metrics)
+            if isinstance(values, dict)
+        }
 
     try:
-        # Initialize empty dictionaries with default values
-        ndcg = {"NDCG@1": 0.0, "NDCG@3": 0.0, "NDCG@5": 0.0, "NDCG@10": 0.0}
-        map_metrics = {"MAP@1": 0.0, "MAP@3": 0.0, "MAP@5": 0.0, "MAP@10": 0.0}
-        recall = {"Recall@1": 0.0, "Recall@3": 0.0, "Recall@5": 0.0, "Recall@10": 0.0}
-        precision = {"P@1": 0.0, "P@3": 0.0, "P@5": 0.0, "P@10": 0.0}
-
-        # NDCG at different k values
-        if "ndcg" in metrics and metrics["ndcg"] and isinstance(metrics["ndcg"], dict):
-            for k in metrics["ndcg"].keys():
-                # Check if key already has the prefix 'NDCG@'
-                if str(k).startswith("NDCG@"):
-                    ndcg[str(k)] = metrics["ndcg"][k]
-                else:
-                    ndcg[f"NDCG@{k}"] = metrics["ndcg"][k]
-        formatted["ndcg"] = ndcg
-
-        # MAP
-        if "map" in metrics and metrics["map"] and isinstance(metrics["map"], dict):
-            for k in metrics["map"].keys():
-                # Check if key already has the prefix 'MAP@'
-                if str(k).startswith("MAP@"):
-                    map_metrics[str(k)] = metrics["map"][k]
-                else:
-                    map_metrics[f"MAP@{k}"] = metrics["map"][k]
-        formatted["map"] = map_metrics
-
-        # Recall
-        if (
-            "recall" in metrics
-            and metrics["recall"]
-            and isinstance(metrics["recall"], dict)
-        ):
-            for k in metrics["recall"].keys():
-                # Check if key already has the prefix 'Recall@'
-                if str(k).startswith("Recall@"):
-                    recall[str(k)] = metrics["recall"][k]
-                else:
-                    recall[f"Recall@{k}"] = metrics["recall"][k]
-        formatted["recall"] = recall
-
-        # Precision
-        if (
-            "precision" in metrics
-            and metrics["precision"]
-            and isinstance(metrics["precision"], dict)
-        ):
-            for k in metrics["precision"].keys():
-                # Check if key already has the prefix 'P@'
-                if str(k).startswith("P@"):
-                    precision[str(k)] = metrics["precision"][k]
-                else:
-                    precision[f"P@{k}"] = metrics["precision"][k]
-        formatted["precision"] = precision
-
-        return formatted
+        found = {
+            name: {_metric_k(k, prefix): value for k, value in metrics[name].items()}
+            for name, prefix in METRIC_PREFIXES.items()
+            if isinstance(metrics.get(name), dict)
+        }
+        if k_values is None:
+            k_values = {k for values in found.values() for k in values}
+        k_values = set(k_values) or {1, 3, 5, 10}
+        return {
+            name: {
+                f"{prefix}@{k}": found.get(name, {}).get(k, 0.0)
+                for k in sorted(k_values | set(found.get(name, {})))
+            }
+            for name, prefix in METRIC_PREFIXES.items()
+        }
     except Exception as e:
         logger.error(f"Error formatting metrics: {e}")
         # Return consistently formatted empty metrics if anything goes wrong
-        return {
-            "ndcg": {"NDCG@1": 0.0, "NDCG@3": 0.0, "NDCG@5": 0.0, "NDCG@10": 0.0},
-            "map": {"MAP@1": 0.0, "MAP@3": 0.0, "MAP@5": 0.0, "MAP@10": 0.0},
-            "recall": {
-                "Recall@1": 0.0,
-                "Recall@3": 0.0,
-                "Recall@5": 0.0,
-                "Recall@10": 0.0,
-            },
-            "precision": {"P@1": 0.0, "P@3": 0.0, "P@5": 0.0, "P@10": 0.0},
-        }
+        return format_metrics(create_empty_metrics(sorted(k_values or [1, 3, 5, 10])))
 
 
-def evaluate_from_file(results_path, qrels_path, k_values=None):
-    """Evaluate results loaded from files"""
+def load_search_results(results_path, latency=None):
+    """
+    Load search results saved by the search scripts.
+
+    Accepts either {"results": {query_id: {doc_id: score}}} or the bare
+    results dict. Any other layout yields an empty dict. JSONL and binary
+    results files (see results_format) are detected and read as well.
+    Per-query timings are added to latency, a LatencyStats, when given.
+    """
+    results_format = detect_results_format(results_path)
+    if results_format != "json":
+        return load_results(results_path, results_format, latency=latency)
+
+    with open(results_path, "r") as f:
+        file_content = json.load(f)
+
+    timings = file_content.get("timings") if isinstance(file_content, dict) else None
+    if latency is not None and isinstance(timings, dict):
+        for timing in timings.values():
+            latency.add_record(timing)
+    if "results" in file_content and isinstance(file_content["results"], dict):
+        return file_content["results"]
+    if isinstance(file_content, dict) and all(
+        isinstance(v, dict) for v in file_content.values()
+    ):
+        # Assume the file itself is the results dictionary
+        return file_content
+    return {}
+
+
+def evaluate_from_file(
+    results_path,
+    qrels_path,
+    k_values=None,
+    engine="beir",
+    per_query_path=None,
+    stream=None,
+    shards=None,
+    incremental=False,
+    latency=None,
+):
+    """
+    Evaluate results loaded from files
+
+    When per_query_path is given, per-query metrics are also saved there
+    (see per_query_metrics). With stream, the results file is parsed and
+    scored a few queries at a time instead of being loaded whole (see
+    streaming_evaluator); by default files of at least STREAM_MIN_FILE_MB
+    are streamed. With shards > 1, queries are split across that many
+    worker processes instead (see sharded_evaluator). With incremental,
+    per-query metrics of unchanged queries are reused from the on-disk cache
+    (see per_query_cache). Per-query timings in the results file are added
+    to latency, a latency_metrics.LatencyStats, when given.
+
+    qrels_path is a qrels.npz or qrels.json file. Unlike results errors,
+    which yield empty metrics, a missing or unreadable qrels file raises
+    QrelsError.
+    """
+    # Imported here: streaming_evaluator, sharded_evaluator and
+    # per_query_cache build on this module
+    from py_metrics.per_query_cache import evaluate_file_incremental
+    from py_metrics.sharded_evaluator import evaluate_file_sharded
+    from py_metrics.streaming_evaluator import evaluate_file_stream, should_stream
+
     # Check if paths exist
     if not os.path.exists(results_path):
         logger.error(f"Results file not found: {results_path}")
         return format_metrics(create_empty_metrics(k_values or [1, 3, 5, 10, 20]))
+    if not os.path.exists(qrels_path):
+        raise QrelsError(f"Qrels file not found: {qrels_path}")
 
-    # Load results
+    if incremental:
+        try:
+            metrics, per_query, cache_stats = evaluate_file_incremental(
+                results_path,
+                qrels_path,
+                k_values or [1, 3, 5, 10, 20],
+                engine=engine,
+                return_per_query=per_query_path is not None,
+                latency=latency,
+            )
+        except QrelsError:
+            raise
+        except (ValueError, IOError, sqlite3.Error) as e:
+            logger.error(f"Error evaluating results file incrementally: {e}")
+            return format_metrics(create_empty_metrics(k_values or [1, 3, 5, 10, 20]))
+        logger.info(f"Per-query cache: {cache_stats}")
+        if per_query is not None:
+            save_per_query_metrics(per_query, per_query_path, engine=engine)
+            logger.info(f"Per-query metrics saved to {per_query_path}")
+        return format_metrics(metrics)
+
+    if shards is not None and shards > 1:
+        try:
+            metrics, per_query, _ = evaluate_file_sharded(
+                results_path,
+                qrels_path,
+                k_values or [1, 3, 5, 10, 20],
+                shards,
+                engine=engine,
+                return_per_query=per_query_path is not None,
+                latency=latency,
+            )
+        except QrelsError:
+            raise
+        except (ValueError, IOError) as e:
+            logger.error(f"Error evaluating results file in shards: {e}")
+            return format_metrics(create_empty_metrics(k_values or [1, 3, 5, 10, 20]))
+        if per_query is not None:
+            save_per_query_metrics(per_query, per_query_path, engine=engine)
+            logger.info(f"Per-query metrics saved to {per_query_path}")
+        return format_metrics(metrics)
+
+    if should_stream(results_path, stream):
+        try:
+            metrics, per_query = evaluate_file_stream(
+                results_path,
+                qrels_path,
+                k_values or [1, 3, 5, 10, 20],
+                engine=engine,
+                return_per_query=per_query_path is not None,
+                latency=latency,
+            )
+        except QrelsError:
+            raise
+        except (ValueError, IOError) as e:
+            logger.error(f"Error streaming results file: {e}")
+            return format_metrics(create_empty_metrics(k_values or [1, 3, 5, 10, 20]))
+        if per_query is not None:
+            save_per_query_metrics(per_query, per_query_path, engine=engine)
+            logger.info(f"Per-query metrics saved to {per_query_path}")
+        return format_metrics(metrics)
+
+    # Load results, unwrapping {"results": ...} as the streaming path does
     try:
-        with open(results_path, "r") as f:
-            results = json.load(f)
-    except (json.JSONDecodeError, IOError) as e:
+        results = load_search_results(results_path, latency=latency)
+    except (ValueError, IOError) as e:
         logger.error(f"Error loading results file: {e}")
         return format_metrics(create_empty_metrics(k_values or [1, 3, 5, 10, 20]))
 
     # Evaluate
-    metrics = evaluate_beir_results(results, qrels_path=qrels_path, k_values=k_values)
+    metrics, per_query = evaluate_beir_results(
+        results,
+        qrels_path=qrels_path,
+        k_values=k_values,
+        engine=engine,
+        return_per_query=True,
+    )
+    if per_query_path is not None and per_query is not None:
+        save_per_query_metrics(per_query, per_query_path, engine=engine)
+        logger.info(f"Per-query metrics saved to {per_query_path}")
 
     # Format metrics
     return format_metrics(metrics)
@@ -338,17 +497,67 @@ def evaluate_from_file(results_path, qrels_path, k_values=None):
 
 def main():
     parser = argparse.ArgumentParser(description="Evaluate BEIR search results")
-    parser.add_argument("results_path", help="Path to search results JSON file")
-    parser.add_argument("qrels_path", help="Path to qrels JSON file")
+    parser.add_argument(
+        "results_path", help="Path to search results file (JSON, JSONL or binary)"
+    )
+    parser.add_argument(
+        "qrels_path", help="Path to the dataset's qrels.npz (or qrels.json) file"
+    )
     parser.add_argument(
         "--k-values", nargs="+", type=int, help="K values for evaluation metrics"
     )
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default="beir",
+        help="Evaluation engine to use (default: beir)",
+    )
+    parser.add_argument(
+        "--per-query-output",
+        help="Also save per-query metrics to this .npz file",
+    )
+    parser.add_argument(
+        "--stream",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="Parse and score the results file incrementally "
+        "(default: only for files of at least STREAM_MIN_FILE_MB)",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        help="Split the queries across this many worker processes",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Reuse cached per-query metrics of unchanged queries "
+        "(cache at EVAL_CACHE_PATH)",
+    )
     args = parser.parse_args()
 
     k_values = args.k_values if args.k_values else None
-    metrics = evaluate_from_file(args.results_path, args.qrels_path, k_values)
+    latency = LatencyStats()
+    try:
+        metrics = evaluate_from_file(
+            args.results_path,
+            args.qrels_path,
+            k_values,
+            engine=args.engine,
+            per_query_path=args.per_query_output,
+            stream=args.stream,
+            shards=args.shards,
+            incremental=args.incremental,
+            latency=latency,
+        )
+    except QrelsError as e:
+        raise SystemExit(str(e))
 
     print(json.dumps(metrics, indent=4))
+    summary = latency.summary()
+    if summary is not None:
+        summary.get("throughput", {}).pop("windows", None)
+        print(json.dumps({"latency": summary}, indent=4))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,639 @@
+"""
+Benchmarks of the evaluation, dataset conversion and API hot paths.
+
+Every benchmark runs against a synthetic BEIR-shaped dataset of a given
+scale (1k, 100k or 1m corpus documents), built once under
+BENCHMARK_DATA_PATH and reused by later runs:
+
+- a dataset zip laid out like the BEIR downloads (corpus.jsonl,
+  queries.jsonl and qrels/test.tsv), which download_beir_dataset converts,
+- the dataset converted into the indexed layout, served by the API,
+- a results file with RESULTS_DEPTH results per query, whose metrics are
+  known (see synthetic_dataset), so evaluation benchmarks also fail when
+  the metrics they compute change.
+
+Each benchmark runs in a fresh process, in the style of asv: its setup
+(loading results, starting an API server) is not timed, then the hot path
+is timed `repeat` times. Hot paths quicker than MIN_SAMPLE_SECONDS run
+several times per sample. The report holds the best and median time per
+run, the throughput in items (queries or documents) per second of the best
+sample (the one least disturbed by other processes) and the peak RSS of
+the largest process involved: the benchmark process, the API server or
+one of its evaluation workers.
+
+Reports can be saved as a baseline. Later runs are compared against it and
+fail when a benchmark's throughput drops by more than BENCHMARK_MAX_SLOWDOWN
+or its peak RSS grows by more than BENCHMARK_MAX_RSS_GROWTH. Timings depend
+on the machine, so compare against a baseline recorded on the same one.
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import math
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BENCHMARK_DATA_PATH = os.getenv("BENCHMARK_DATA_PATH", "./benchmark_data")
+BENCHMARK_BASELINE_PATH = os.getenv(
+    "BENCHMARK_BASELINE_PATH", "./benchmark_baseline.json"
+)
+# Largest tolerated throughput drop and peak RSS growth against the baseline
+BENCHMARK_MAX_SLOWDOWN = float(os.getenv("BENCHMARK_MAX_SLOWDOWN", "0.2"))
+BENCHMARK_MAX_RSS_GROWTH = float(os.getenv("BENCHMARK_MAX_RSS_GROWTH", "0.2"))
+# Corpus documents of each scale
+SCALES = {"1k": 1000, "100k": 100_000, "1m": 1_000_000}
+# Bumped whenever the generated fixtures change, so stale ones are rebuilt
+FIXTURE_VERSION = 2
+FIXTURE_SEED = 42
+FIXTURE_FILE = "fixture.json"
+RESULTS_DEPTH = 100
+K_VALUES = [1, 3, 5, 10, 100]
+# Documents per page of the paginated corpus benchmark
+CORPUS_PAGE_SIZE = 1000
+# Shortest timed sample; quicker benchmarks run several times per sample
+MIN_SAMPLE_SECONDS = float(os.getenv("BENCHMARK_MIN_SAMPLE_SECONDS", "0.5"))
+SERVER_START_TIMEOUT_SECONDS = 30
+
+
+def _peak_rss_mb():
+    """Peak resident set size of this process and its waited-for children"""
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # ru_maxrss is reported in bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _scale_queries(num_docs):
+    """Queries of a dataset: 1 per 100 documents, between 100 and 10000"""
+    return min(max(num_docs // 100, 100), 10000)
+
+
+def _fixture_paths(fixture_dir, name):
+    return {
+        "fixture_dir": str(fixture_dir),
+        "data_root": str(fixture_dir / "beir_data"),
+        "zip_path": str(fixture_dir / "beir_data" / f"{name}.zip"),
+        "dataset_dir": str(fixture_dir / "beir_data" / name),
+        "results_path": str(fixture_dir / "results.json"),
+    }
+
+
+def prepare_fixture(scale, data_path=BENCHMARK_DATA_PATH):
+    """
+    Build the synthetic dataset of a scale, or reuse the one already built.
+
+    Each query has 1 to 4 relevant documents graded 1 or 2. The results
+    file retrieves each of them with probability 0.7, around rank 10, among
+    RESULTS_DEPTH results.
+
+    Args:
+        scale: One of SCALES
+        data_path: Directory holding the fixtures
+
+    Returns:
+        Dict of the fixture's counts and paths
+    """
+    # Imported here so benchmark processes only load what they measure
+    from py_metrics.synthetic_dataset import DatasetSpec, RunSpec, generate_dataset
+
+    # Absolute paths, as benchmarks run the API in another process
+    fixture_dir = Path(data_path).resolve() / scale
+    meta_path = fixture_dir / FIXTURE_FILE
+    if meta_path.exists():
+        with open(meta_path) as f:
+            fixture = json.load(f)
+        if fixture.get("version") == FIXTURE_VERSION:
+            return {**fixture, **_fixture_paths(fixture_dir, fixture["name"])}
+
+    logger.info(f"Generating the {scale} benchmark dataset in {fixture_dir}")
+    shutil.rmtree(fixture_dir, ignore_errors=True)
+    fixture_dir.mkdir(parents=True)
+    started = time.perf_counter()
+    name = f"synthetic-{scale}"
+    paths = _fixture_paths(fixture_dir, name)
+    spec = DatasetSpec(
+        num_docs=SCALES[scale],
+        num_queries=_scale_queries(SCALES[scale]),
+        relevant_per_query="uniform:1,4",
+        grades={1: 1.0, 2: 1.0},
+        seed=FIXTURE_SEED,
+    )
+    run_spec = RunSpec(depth=RESULTS_DEPTH, recall=0.7, mean_rank=10, seed=FIXTURE_SEED)
+    summary = generate_dataset(
+        name,
+        spec,
+        output_dir=paths["data_root"],
+        runs=[(paths["results_path"], run_spec, "json")],
+        k_values=K_VALUES,
+    )
+    fixture = {
+        "version": FIXTURE_VERSION,
+        "seed": FIXTURE_SEED,
+        "name": name,
+        "docs": spec.num_docs,
+        "queries": spec.num_queries,
+        "qrels": summary["qrels"],
+        "expected_metrics": summary["runs"][paths["results_path"]],
+    }
+    with open(meta_path, "w") as f:
+        json.dump(fixture, f, indent=2)
+    logger.info(
+        f"Generated {fixture['docs']} documents and {fixture['queries']} queries "
+        f"in {time.perf_counter() - started:.1f}s"
+    )
+    return {**fixture, **paths}
+
+
+def _load_fixture_qrels(fixture):
+    from py_metrics.dataset_store import load_qrels_index, qrels_index_to_dict
+
+    qrels_path = Path(fixture["dataset_dir"]) / "qrels.npz"
+    return qrels_index_to_dict(load_qrels_index(qrels_path))
+
+
+def _load_fixture_results(fixture):
+    from py_metrics.results_format import load_results
+
+    return load_results(fixture["results_path"])
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _stop_server(server):
+    # SIGINT lets uvicorn run the lifespan shutdown, which waits for the
+    # worker pools, so their peak RSS is reported in RUSAGE_CHILDREN
+    server.send_signal(signal.SIGINT)
+    try:
+        server.wait(timeout=SERVER_START_TIMEOUT_SECONDS)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+def _api_client(fixture, stack):
+    """
+    Start the API on the fixture's data root in a child process and return
+    an httpx client for it. A real server is used rather than an in-process
+    test client, which would buffer streamed responses.
+    """
+    port = _free_port()
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "py_metrics.main:app",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        env={**os.environ, "BEIR_DATA_ROOT_PATH": fixture["data_root"]},
+    )
+    stack.callback(_stop_server, server)
+    client = stack.enter_context(
+        httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=None)
+    )
+    deadline = time.monotonic() + SERVER_START_TIMEOUT_SECONDS
+    while True:
+        try:
+            client.get("/")
+            return client
+        except httpx.TransportError:
+            if server.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError("API server did not start")
+            time.sleep(0.1)
+
+
+def _check(response):
+    if response.status_code != 200:
+        raise RuntimeError(
+            f"{response.request.url} returned {response.status_code}: "
+            f"{response.text[:200]}"
+        )
+    return response
+
+
+def _check_metrics(metrics, fixture):
+    """Fail a benchmark whose evaluation no longer returns the known metrics"""
+    expected = fixture["expected_metrics"]
+    wrong = [
+        f"{label}: {metrics.get(name, {}).get(label)} != {value}"
+        for name, values in expected.items()
+        for label, value in values.items()
+        if abs(metrics.get(name, {}).get(label, math.inf) - value) > 1e-5
+    ]
+    if wrong:
+        raise RuntimeError(f"Unexpected metrics: {', '.join(wrong[:5])}")
+
+
+def _evaluate_benchmark(engine):
+    def setup(fixture, stack):
+        from py_metrics.beir_evaluator import evaluate_beir_results
+
+        qrels = _load_fixture_qrels(fixture)
+        results = _load_fixture_results(fixture)
+
+        def run():
+            return evaluate_beir_results(
+                results, qrels=qrels, k_values=K_VALUES, engine=engine
+            )
+
+        _check_metrics(run(), fixture)
+        return run, len(results)
+
+    return setup
+
+
+def _download_setup(fixture, stack):
+    from py_metrics.beir_downloader import download_beir_dataset
+
+    name = fixture["name"]
+    zip_path = Path(fixture["zip_path"])
+
+    def run():
+        # The zip is already in place, so only its check and conversion run
+        with tempfile.TemporaryDirectory(dir=fixture["fixture_dir"]) as output_dir:
+            target = Path(output_dir) / zip_path.name
+            try:
+                os.link(zip_path, target)
+            except OSError:
+                shutil.copyfile(zip_path, target)
+            download_beir_dataset(name, output_dir=output_dir)
+
+    return run, fixture["docs"]
+
+
+def _api_evaluate_setup(fixture, stack):
+    client = _api_client(fixture, stack)
+    results = _load_fixture_results(fixture)
+    # k_values is a body parameter too, so the results are embedded
+    body = json.dumps({"search_results": {"results": results}, "k_values": K_VALUES})
+
+    def run():
+        response = client.post(
+            f"/beir/evaluate/{fixture['name']}",
+            content=body,
+            headers={"Content-Type": "application/json"},
+        )
+        if _check(response).json().get("error"):
+            raise RuntimeError(response.json()["error"])
+
+    return run, len(results)
+
+
+def _api_evaluate_file_setup(fixture, stack):
+    client = _api_client(fixture, stack)
+
+    def run():
+        response = client.post(
+            f"/beir/evaluate-from-file/{fixture['name']}",
+            json={"file_path": fixture["results_path"], "k_values": K_VALUES},
+        )
+        if _check(response).json().get("error"):
+            raise RuntimeError(response.json()["error"])
+
+    return run, fixture["queries"]
+
+
+def _api_corpus_pages_setup(fixture, stack):
+    client = _api_client(fixture, stack)
+
+    def run():
+        cursor = None
+        while True:
+            params = {"limit": CORPUS_PAGE_SIZE}
+            if cursor is not None:
+                params["cursor"] = cursor
+            page = _check(
+                client.get(f"/beir/corpus/{fixture['name']}", params=params)
+            ).json()
+            cursor = page.get("next_cursor")
+            if cursor is None:
+                break
+
+    return run, fixture["docs"]
+
+
+def _api_corpus_stream_setup(fixture, stack):
+    client = _api_client(fixture, stack)
+
+    def run():
+        with client.stream(
+            "GET", f"/beir/corpus/{fixture['name']}", params={"format": "ndjson"}
+        ) as response:
+            _check(response)
+            for _ in response.iter_bytes():
+                pass
+
+    return run, fixture["docs"]
+
+
+def _api_queries_qrels_setup(fixture, stack):
+    client = _api_client(fixture, stack)
+
+    def run():
+        _check(client.get(f"/beir/queries/{fixture['name']}"))
+        _check(client.get(f"/beir/qrels/{fixture['name']}"))
+
+    return run, fixture["queries"]
+
+
+# name -> (setup(fixture, stack) returning (run, items), unit of the items)
+BENCHMARKS = {
+    "evaluate-beir": (_evaluate_benchmark("beir"), "queries"),
+    "evaluate-numpy": (_evaluate_benchmark("numpy"), "queries"),
+    "download-convert": (_download_setup, "docs"),
+    "api-evaluate": (_api_evaluate_setup, "queries"),
+    "api-evaluate-from-file": (_api_evaluate_file_setup, "queries"),
+    "api-corpus-pages": (_api_corpus_pages_setup, "docs"),
+    "api-corpus-stream": (_api_corpus_stream_setup, "docs"),
+    "api-queries-qrels": (_api_queries_qrels_setup, "queries"),
+}
+
+
+def _time(run, number):
+    started = time.perf_counter()
+    for _ in range(number):
+        run()
+    return (time.perf_counter() - started) / number
+
+
+def _run_benchmark(name, fixture, repeat):
+    """Run one benchmark in the current (fresh) process"""
+    logging.getLogger().setLevel(logging.WARNING)
+    setup, unit = BENCHMARKS[name]
+    with contextlib.ExitStack() as stack:
+        run, items = setup(fixture, stack)
+        setup_rss = _peak_rss_mb()
+        # Fast benchmarks are run several times per sample, so a sample
+        # lasts at least MIN_SAMPLE_SECONDS and timer noise averages out
+        first = _time(run, 1)
+        number = max(1, math.ceil(MIN_SAMPLE_SECONDS / max(first, 1e-6)))
+        times = [first] if number == 1 else []
+        while len(times) < repeat:
+            times.append(_time(run, number))
+    # The server and worker pools have exited, so their peak RSS is included
+    median = statistics.median(times)
+    best = min(times)
+    return {
+        "items": items,
+        "unit": unit,
+        "repeat": repeat,
+        "number": number,
+        "median_seconds": round(median, 4),
+        "min_seconds": round(best, 4),
+        "items_per_second": round(items / best, 1) if best else None,
+        "setup_rss_mb": round(setup_rss, 1),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    }
+
+
+def run_benchmarks(
+    scales, names=None, repeat=5, data_path=BENCHMARK_DATA_PATH, progress=None
+):
+    """
+    Run benchmarks against the synthetic datasets of the given scales.
+
+    Args:
+        scales: Scales to run, keys of SCALES
+        names: Benchmarks to run (default all of BENCHMARKS)
+        repeat: Timed samples of each benchmark
+        data_path: Directory holding the fixtures
+        progress: Optional callback receiving benchmark, scale and result
+            keyword arguments after each benchmark
+
+    Returns:
+        Report with the machine description and {"<name>@<scale>": result}
+    """
+    names = list(names or BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise ValueError(f"Unknown benchmarks: {', '.join(unknown)}")
+
+    report = {"machine": machine_info(), "created_at": datetime.now().isoformat()}
+    report["benchmarks"] = {}
+    context = multiprocessing.get_context("spawn")
+    for scale in scales:
+        fixture = prepare_fixture(scale, data_path)
+        for name in names:
+            # A new process per benchmark, so peak RSS is the benchmark's own
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(_run_benchmark, name, fixture, repeat).result()
+            report["benchmarks"][f"{name}@{scale}"] = result
+            logger.info(
+                f"{name}@{scale}: {result['min_seconds']}s, "
+                f"{result['items_per_second']} {result['unit']}/s, "
+                f"peak RSS {result['peak_rss_mb']} MB"
+            )
+            if progress is not None:
+                progress(benchmark=name, scale=scale, result=result)
+    return report
+
+
+def machine_info():
+    """Description of the machine the benchmarks ran on"""
+    return {
+        "node": platform.node(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+    }
+
+
+def load_baseline(path=BENCHMARK_BASELINE_PATH):
+    """Saved baseline report, or None if there is none"""
+    path = Path(path)
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(report, path=BENCHMARK_BASELINE_PATH):
+    """
+    Save a report as the baseline. Benchmarks already in the baseline but
+    not in the report are kept.
+    """
+    baseline = load_baseline(path) or {"benchmarks": {}}
+    baseline["machine"] = report["machine"]
+    baseline["created_at"] = report["created_at"]
+    baseline["benchmarks"].update(report["benchmarks"])
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+
+
+def compare_to_baseline(
+    report,
+    baseline,
+    max_slowdown=BENCHMARK_MAX_SLOWDOWN,
+    max_rss_growth=BENCHMARK_MAX_RSS_GROWTH,
+):
+    """
+    Compare a report with a baseline.
+
+    Args:
+        report: Report of run_benchmarks
+        baseline: Baseline report
+        max_slowdown: Largest tolerated relative drop in throughput
+        max_rss_growth: Largest tolerated relative growth of peak RSS
+
+    Returns:
+        Tuple of (rows, regressions): a row per benchmark present in both,
+        with both figures and their relative change, and the rows that
+        regressed
+    """
+    if baseline.get("machine", {}).get("node") != report["machine"]["node"]:
+        logger.warning(
+            "Baseline was recorded on another machine; timings may not compare"
+        )
+    rows, regressions = [], []
+    for key, result in report["benchmarks"].items():
+        base = baseline.get("benchmarks", {}).get(key)
+        if base is None:
+            continue
+        throughput_change = result["items_per_second"] / base["items_per_second"] - 1
+        rss_change = result["peak_rss_mb"] / base["peak_rss_mb"] - 1
+        row = {
+            "benchmark": key,
+            "items_per_second": result["items_per_second"],
+            "baseline_items_per_second": base["items_per_second"],
+            "throughput_change": round(throughput_change, 4),
+            "peak_rss_mb": result["peak_rss_mb"],
+            "baseline_peak_rss_mb": base["peak_rss_mb"],
+            "rss_change": round(rss_change, 4),
+            "regressed": [],
+        }
+        if throughput_change < -max_slowdown:
+            row["regressed"].append("throughput")
+        if rss_change > max_rss_growth:
+            row["regressed"].append("peak_rss")
+        rows.append(row)
+        if row["regressed"]:
+            regressions.append(row)
+    return rows, regressions
+
+
+def format_comparison(rows):
+    """Plain-text table of compare_to_baseline rows"""
+    lines = [
+        f"{'benchmark':<32} {'items/s':>12} {'change':>8} "
+        f"{'peak RSS MB':>12} {'change':>8}"
+    ]
+    for row in rows:
+        flag = "  REGRESSED" if row["regressed"] else ""
+        lines.append(
+            f"{row['benchmark']:<32} {row['items_per_second']:>12} "
+            f"{row['throughput_change']:>+8.1%} {row['peak_rss_mb']:>12} "
+            f"{row['rss_change']:>+8.1%}{flag}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark evaluation, dataset conversion and API endpoints "
+        "on synthetic datasets"
+    )
+    parser.add_argument(
+        "--scales",
+        nargs="+",
+        type=str.lower,
+        choices=list(SCALES),
+        default=["1k", "100k"],
+        help="Corpus sizes to benchmark (default: 1k 100k)",
+    )
+    parser.add_argument(
+        "--benchmarks",
+        nargs="+",
+        choices=list(BENCHMARKS),
+        help="Benchmarks to run (default: all)",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Timed samples per benchmark (default: 5)"
+    )
+    parser.add_argument(
+        "--data-path", default=BENCHMARK_DATA_PATH, help="Directory of the fixtures"
+    )
+    parser.add_argument(
+        "--baseline", default=BENCHMARK_BASELINE_PATH, help="Baseline report file"
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Save this run as the baseline instead of comparing against it",
+    )
+    parser.add_argument(
+        "--max-slowdown",
+        type=float,
+        default=BENCHMARK_MAX_SLOWDOWN,
+        help="Tolerated relative throughput drop (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--max-rss-growth",
+        type=float,
+        default=BENCHMARK_MAX_RSS_GROWTH,
+        help="Tolerated relative peak RSS growth (default: %(default)s)",
+    )
+    parser.add_argument("--output", help="Also save the report to this file")
+    args = parser.parse_args()
+
+    report = run_benchmarks(
+        args.scales, args.benchmarks, repeat=args.repeat, data_path=args.data_path
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        save_baseline(report, args.baseline)
+        logger.info(f"Baseline saved to {args.baseline}")
+        return
+
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        print(json.dumps(report["benchmarks"], indent=4))
+        logger.info(f"No baseline at {args.baseline}; save one with --save-baseline")
+        return
+    rows, regressions = compare_to_baseline(
+        report, baseline, args.max_slowdown, args.max_rss_growth
+    )
+    print(format_comparison(rows))
+    if regressions:
+        logger.error(
+            f"{len(regressions)} benchmarks regressed: "
+            + ", ".join(row["benchmark"] for row in regressions)
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""
+Batched BLEU scoring.
+
+Scores match NLTK's sentence_bleu and corpus_bleu (uniform weights, with
+smoothing methods 1-3 of SmoothingFunction), but every distinct prediction
+and reference string is tokenized and n-gram counted only once. Each pair is
+reduced to its clipped n-gram matches, n-gram totals, hypothesis length and
+closest reference length; sentence and corpus scores are then computed from
+those arrays with NumPy. Large payloads are split into chunks counted in
+up to workers separate processes, a count the caller chooses: the server
+passes worker_pools.CPU_TASK_WORKERS rather than nesting a pool inside its
+evaluation workers.
+"""
+
+import logging
+import math
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Payloads with at least this many pairs are counted in several processes
+BLEU_PARALLEL_MIN_PAIRS = int(os.getenv("BLEU_PARALLEL_MIN_PAIRS", "20000"))
+# Processes used for large payloads
+BLEU_WORKERS = int(os.getenv("BLEU_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+SMOOTHING_METHODS = ("none", "method1", "method2", "method3")
+# Epsilon of NLTK's SmoothingFunction, used by method1
+SMOOTHING_EPSILON = 0.1
+
+_WORD_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+TOKENIZERS = {
+    # Split on whitespace, like passing text.split() to NLTK
+    "whitespace": str.split,
+    # Words and individual punctuation marks, so "Paris." matches "Paris"
+    "word": _WORD_PATTERN.findall,
+}
+
+
+def _encode(texts, tokenize):
+    """
+    Tokenize each text once into integer token ids.
+
+    Returns:
+        Tuple of (token_ids, lengths): the concatenated token ids of all
+        texts and the number of tokens of each text
+    """
+    vocabulary = {}
+    token_ids = []
+    lengths = np.zeros(len(texts), dtype=np.int64)
+    for i, text in enumerate(texts):
+        tokens = tokenize(text)
+        lengths[i] = len(tokens)
+        token_ids.extend(
+            vocabulary.setdefault(token, len(vocabulary)) for token in tokens
+        )
+    return np.asarray(token_ids, dtype=np.int64), lengths
+
+
+def _expand_ranges(starts, lengths):
+    """
+    Flatten the index ranges [starts[i], starts[i] + lengths[i]).
+
+    Returns:
+        Tuple of (owners, indices): the range each index belongs to, and the
+        indices themselves
+    """
+    owners = np.repeat(np.arange(len(lengths)), lengths)
+    range_starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    indices = np.repeat(starts, lengths) + np.arange(len(owners)) - range_starts
+    return owners, indices
+
+
+def bleu_statistics(predictions, references, max_order=4, tokenizer="whitespace"):
+    """
+    Reduce prediction/references pairs to BLEU sufficient statistics.
+
+    Every distinct string is tokenized once. N-grams get dense integer ids,
+    and the clipped counts of all pairs are computed with array operations
+    per n-gram order instead of one Counter per sentence.
+
+    Args:
+        predictions: List of predicted strings
+        references: List of reference lists, one per prediction
+        max_order: Largest n-gram order
+        tokenizer: Name of a tokenizer in TOKENIZERS
+
+    Returns:
+        Tuple of (matches, totals, hyp_lengths, ref_lengths): clipped n-gram
+        matches and n-gram counts (NLTK's modified precision numerator and
+        denominator) of shape (len(predictions), max_order), and the
+        prediction length and closest reference length of each pair
+    """
+    n_pairs = len(predictions)
+    text_index = {}
+    hyp_texts = np.array(
+        [text_index.setdefault(text, len(text_index)) for text in predictions],
+        dtype=np.int64,
+    )
+    ref_counts = np.array([len(refs) for refs in references], dtype=np.int64)
+    ref_pairs = np.repeat(np.arange(n_pairs), ref_counts)
+    ref_texts = np.array(
+        [
+            text_index.setdefault(text, len(text_index))
+            for refs in references
+            for text in refs
+        ],
+        dtype=np.int64,
+    )
+
+    token_ids, text_lengths = _encode(list(text_index), TOKENIZERS[tokenizer])
+    n_texts = len(text_lengths)
+    text_starts = np.cumsum(text_lengths) - text_lengths
+    token_texts = np.repeat(np.arange(n_texts), text_lengths)
+    token_positions = np.arange(len(token_ids)) - text_starts[token_texts]
+    vocabulary_size = int(token_ids.max()) + 1 if len(token_ids) else 1
+
+    hyp_lengths = text_lengths[hyp_texts]
+    ref_lengths = np.zeros(n_pairs, dtype=np.int64)
+    if len(ref_texts):
+        # Closest reference length, the shorter one on ties
+        link_lengths = text_lengths[ref_texts]
+        distance = np.abs(link_lengths - hyp_lengths[ref_pairs])
+        span = int(link_lengths.max()) + 1
+        closest = np.full(n_pairs, np.iinfo(np.int64).max)
+        np.minimum.at(closest, ref_pairs, distance * span + link_lengths)
+        has_refs = ref_counts > 0
+        ref_lengths[has_refs] = closest[has_refs] % span
+
+    matches = np.zeros((n_pairs, max_order), dtype=np.int64)
+    # Id of each n-gram of the current order and the token it starts at
+    ngram_ids = token_ids
+    ngram_starts = np.arange(len(token_ids))
+    for order in range(1, max_order + 1):
+        if order > 1:
+            # Extend each (order - 1)-gram by the token that follows it
+            fits = (
+                token_positions[ngram_starts] + order
+                <= text_lengths[token_texts[ngram_starts]]
+            )
+            ngram_starts = ngram_starts[fits]
+            _, ngram_ids = np.unique(
+                ngram_ids[fits] * vocabulary_size + token_ids[ngram_starts + order - 1],
+                return_inverse=True,
+            )
+        ngram_texts = token_texts[ngram_starts]
+        if not len(ngram_ids):
+            break
+        n_ngrams = int(ngram_ids.max()) + 1
+
+        # Count of each distinct n-gram of each text, sorted by (text, n-gram)
+        keys, counts = np.unique(ngram_texts * n_ngrams + ngram_ids, return_counts=True)
+        key_texts = keys // n_ngrams
+        text_key_starts = np.searchsorted(key_texts, np.arange(n_texts))
+        text_key_lengths = np.bincount(key_texts, minlength=n_texts)
+
+        # Distinct n-grams of each pair's prediction
+        entry_pairs, entries = _expand_ranges(
+            text_key_starts[hyp_texts], text_key_lengths[hyp_texts]
+        )
+        entry_ngrams = keys[entries] % n_ngrams
+
+        # Largest count of each of those n-grams over the pair's references
+        entry_starts = (
+            np.cumsum(text_key_lengths[hyp_texts]) - text_key_lengths[hyp_texts]
+        )
+        link_entries_owner, link_entries = _expand_ranges(
+            entry_starts[ref_pairs], text_key_lengths[hyp_texts][ref_pairs]
+        )
+        lookup = ref_texts[link_entries_owner] * n_ngrams + entry_ngrams[link_entries]
+        found = np.minimum(np.searchsorted(keys, lookup), len(keys) - 1)
+        link_counts = np.where(keys[found] == lookup, counts[found], 0)
+        max_ref_counts = np.zeros(len(entries), dtype=np.int64)
+        np.maximum.at(max_ref_counts, link_entries, link_counts)
+
+        clipped = np.minimum(counts[entries], max_ref_counts)
+        matches[:, order - 1] = np.bincount(entry_pairs, clipped, minlength=n_pairs)
+
+    # A prediction of length L has L - n + 1 n-grams of order n; NLTK never
+    # divides by zero, so an empty n-gram total counts as 1
+    totals = np.maximum(hyp_lengths[:, None] - np.arange(max_order)[None, :], 1)
+    return matches, totals, hyp_lengths, ref_lengths
+
+
+def _statistics_chunk(args):
+    return bleu_statistics(*args)
+
+
+def parallel_bleu_statistics(
+    predictions, references, max_order=4, tokenizer="whitespace", workers=None
+):
+    """
+    bleu_statistics, split across processes for large payloads.
+
+    Payloads smaller than BLEU_PARALLEL_MIN_PAIRS, or workers <= 1, are
+    counted in the calling process.
+    """
+    workers = BLEU_WORKERS if workers is None else workers
+    n_pairs = len(predictions)
+    if workers <= 1 or n_pairs < BLEU_PARALLEL_MIN_PAIRS:
+        return bleu_statistics(predictions, references, max_order, tokenizer)
+
+    bounds = np.linspace(0, n_pairs, workers + 1).astype(int)
+    chunks = [
+        (predictions[start:end], references[start:end], max_order, tokenizer)
+        for start, end in zip(bounds[:-1], bounds[1:])
+    ]
+    logger.info(f"Counting BLEU n-grams of {n_pairs} pairs in {workers} processes")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        parts = list(executor.map(_statistics_chunk, chunks))
+    return tuple(np.concatenate(arrays) for arrays in zip(*parts))
+
+
+def _log_precisions(matches, totals, smoothing):
+    """Log of the smoothed modified precisions, as NLTK's SmoothingFunction"""
+    matches = matches.astype(np.float64)
+    totals = totals.astype(np.float64)
+    zero = matches == 0
+
+    if smoothing == "none":
+        # NLTK substitutes the smallest float for zero precisions
+        precisions = np.where(zero, sys.float_info.min, matches / totals)
+    elif smoothing == "method1":
+        precisions = np.where(zero, SMOOTHING_EPSILON, matches) / totals
+    elif smoothing == "method2":
+        precisions = (matches + 1) / (totals + 1)
+        precisions[:, 0] = matches[:, 0] / totals[:, 0]
+    elif smoothing == "method3":
+        # The k-th zero precision of a row becomes 1 / (2^k * total)
+        k = np.cumsum(zero, axis=1)
+        precisions = np.where(zero, 1.0 / (2.0**k * totals), matches / totals)
+    else:
+        raise ValueError(
+            f"Unknown smoothing '{smoothing}', expected one of {SMOOTHING_METHODS}"
+        )
+
+    with np.errstate(divide="ignore"):
+        return np.log(precisions)
+
+
+def bleu_from_statistics(matches, totals, hyp_lengths, ref_lengths, smoothing="none"):
+    """
+    BLEU of each row of sufficient statistics.
+
+    Rows without a single matching unigram score 0, as in NLTK. Sum the
+    statistics over rows first to get corpus BLEU.
+
+    Returns:
+        Array of BLEU scores, one per row
+    """
+    matches = np.atleast_2d(matches)
+    totals = np.atleast_2d(totals)
+    hyp_lengths = np.atleast_1d(hyp_lengths).astype(np.float64)
+    ref_lengths = np.atleast_1d(ref_lengths).astype(np.float64)
+    max_order = matches.shape[1]
+
+    log_precisions = _log_precisions(matches, totals, smoothing)
+    # NLTK skips precisions that are not positive
+    log_precisions[~np.isfinite(log_precisions)] = 0.0
+    scores = np.exp(log_precisions.sum(axis=1) / max_order)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        brevity_penalty = np.where(
+            hyp_lengths > ref_lengths, 1.0, np.exp(1.0 - ref_lengths / hyp_lengths)
+        )
+    brevity_penalty[hyp_lengths == 0] = 0.0
+
+    scores *= brevity_penalty
+    scores[matches[:, 0] == 0] = 0.0
+    return scores
+
+
+def sentence_bleu_scores(
+    predictions,
+    references,
+    max_order=4,
+    smoothing="none",
+    tokenizer="whitespace",
+    workers=None,
+):
+    """
+    Sentence BLEU of each prediction against its references.
+
+    Args:
+        predictions: List of predicted strings
+        references: List of reference lists, one per prediction
+        max_order: Largest n-gram order; weights are uniform
+        smoothing: One of SMOOTHING_METHODS
+        tokenizer: Name of a tokenizer in TOKENIZERS
+        workers: Processes for large payloads (default BLEU_WORKERS); 1
+            counts every pair in the calling process
+
+    Returns:
+        Array of scores, one per prediction
+    """
+    statistics = parallel_bleu_statistics(
+        predictions, references, max_order, tokenizer, workers
+    )
+    return bleu_from_statistics(*statistics, smoothing=smoothing)
+
+
+def corpus_bleu_score(
+    predictions,
+    references,
+    max_order=4,
+    smoothing="none",
+    tokenizer="whitespace",
+    workers=None,
+):
+    """
+    Corpus BLEU: n-gram matches and lengths are summed over all pairs
+    before the precisions and brevity penalty are computed.
+
+    Takes the same arguments as sentence_bleu_scores.
+    """
+    if not predictions:
+        return 0.0
+    matches, totals, hyp_lengths, ref_lengths = parallel_bleu_statistics(
+        predictions, references, max_order, tokenizer, workers
+    )
+    score = bleu_from_statistics(
+        matches.sum(axis=0),
+        totals.sum(axis=0),
+        hyp_lengths.sum(),
+        ref_lengths.sum(),
+        smoothing=smoothing,
+    )[0]
+    return float(score) if math.isfinite(score) else 0.0
@@ -1,6 +1,4 @@
-from typing import List, Dict
-
-from nltk.translate.bleu_score import sentence_bleu
+from typing import List, Dict, Optional
 
 from sklearn.metrics import (
     f1_score,
@@ -8,9 +6,16 @@ from sklearn.metrics import (
     recall_score,
 )
 
+from py_metrics.bleu import corpus_bleu_score, sentence_bleu_scores
+from py_metrics.classification_metrics import (
+    CLASSIFICATION_METRICS,
+    classification_scores,
+)
+from py_metrics.text_metrics import text_metric_scores
 from py_metrics.types.metrics import (
     ClassificationData,
     BleuData,
+    TextData,
 )
 
 
@@ -37,6 +42,21 @@ def compute_classification_metrics(
     elif average != "binary" and "pos_label" in kwargs:
         del kwargs["pos_label"]
 
+    # Label-encoded single-pass path; inputs scikit-learn would reject go
+    # through scikit-learn below so its validation errors are kept
+    requested = [m for m in CLASSIFICATION_METRICS if m in metrics_to_calculate]
+    scores = classification_scores(
+        y_true,
+        y_pred,
+        requested,
+        average,
+        pos_label=pos_label if pos_label is not None else 1,
+        labels=labels,
+        zero_division=zero_division,
+    )
+    if scores is not None:
+        return scores
+
     try:
         if "f1" in metrics_to_calculate:
             results["f1"] = f1_score(**kwargs)
@@ -53,16 +73,39 @@ def compute_classification_metrics(
     return results
 
 
-def compute_bleu_score(bleu_data: BleuData) -> float:
+def compute_bleu_score(bleu_data: BleuData, workers: Optional[int] = None) -> float:
+    options = {
+        "max_order": bleu_data.max_order,
+        "smoothing": bleu_data.smoothing,
+        "tokenizer": bleu_data.tokenizer,
+        "workers": workers,
+    }
     try:
-        bleu_scores = [
-            sentence_bleu(refs[0] if refs else "", pred)
-            for pred, refs in zip(bleu_data.predictions, bleu_data.references)
-        ]
-        return sum(bleu_scores) / len(bleu_scores) if bleu_scores else 0.0
-    except IndexError:
-        raise ValueError(
-            "Mismatch between predictions and references list structure for BLEU."
+        if bleu_data.corpus_level:
+            return corpus_bleu_score(
+                bleu_data.predictions, bleu_data.references, **options
+            )
+        bleu_scores = sentence_bleu_scores(
+            bleu_data.predictions, bleu_data.references, **options
         )
+        return float(bleu_scores.mean()) if len(bleu_scores) else 0.0
     except Exception as e:
         raise ValueError(f"Error calculating BLEU: {e}")
+
+
+def compute_text_metrics(
+    data: TextData, metrics_to_calculate: List[str]
+) -> Dict[str, float]:
+    try:
+        scores = text_metric_scores(
+            data.predictions,
+            data.references,
+            metrics_to_calculate,
+            use_stemmer=data.use_stemmer,
+        )
+    except Exception as e:
+        raise ValueError(f"Error calculating text metrics: {e}")
+    return {
+        metric: float(values.mean()) if len(values) else 0.0
+        for metric, values in scores.items()
+    }
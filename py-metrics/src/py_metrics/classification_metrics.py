@@ -0,0 +1,155 @@
+"""
+Precision, recall and F1 from a single label-encoded confusion matrix.
+
+scikit-learn's f1_score, recall_score and precision_score each validate the
+inputs and rebuild the confusion matrix from the raw label lists. Here the
+labels are encoded once into int arrays, three bincounts give the per-class
+true positive, predicted and true counts, and every requested metric and
+averaging strategy is derived from those counts with scikit-learn's
+semantics (class order, zero_division, weighted averages with zero support).
+
+Inputs scikit-learn rejects (mixed string and number labels, a multiclass
+target with average="binary", average="samples", an unknown pos_label) are
+left to scikit-learn so its error messages are preserved: classification_scores
+returns None for them.
+"""
+
+from typing import Dict, List, Optional
+
+import numpy as np
+
+CLASSIFICATION_METRICS = ("f1", "recall", "precision")
+
+
+def _zero_division_value(zero_division):
+    # "warn" scores ill-defined metrics as 0, like scikit-learn
+    return 0.0 if zero_division == "warn" else float(zero_division)
+
+
+def _divide(numerator, denominator, zero_division):
+    """numerator / denominator, with zero_division where denominator is 0"""
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    zero = denominator == 0
+    result = numerator / np.where(zero, 1.0, denominator)
+    result[zero] = _zero_division_value(zero_division)
+    return result
+
+
+def encode_labels(y_true, y_pred, labels=None):
+    """
+    Encode both label lists into ints in one pass.
+
+    Classes are ordered as scikit-learn orders them: the given labels, or
+    the sorted labels present in y_true and y_pred.
+
+    Returns:
+        Tuple of (classes, true_codes, pred_codes, n_present), or None when
+        scikit-learn has to handle the inputs (mixed string and number
+        labels, empty or duplicate labels, empty inputs)
+    """
+    present = set(y_true)
+    present.update(y_pred)
+    if not present:
+        return None
+    candidates = present if labels is None else present.union(labels)
+    if len({isinstance(label, str) for label in candidates}) > 1:
+        return None
+
+    if labels is None:
+        classes = sorted(present)
+    else:
+        if not labels or len(set(labels)) != len(labels):
+            return None
+        # Present labels that were not asked for are counted but not scored
+        classes = list(labels) + sorted(present.difference(labels))
+
+    index = {label: code for code, label in enumerate(classes)}
+    true_codes = np.fromiter(map(index.__getitem__, y_true), np.int64, len(y_true))
+    pred_codes = np.fromiter(map(index.__getitem__, y_pred), np.int64, len(y_pred))
+    return classes, true_codes, pred_codes, len(present)
+
+
+def confusion_counts(true_codes, pred_codes, n_classes):
+    """
+    Per-class counts of the one-vs-rest confusion matrices.
+
+    Returns:
+        Tuple of (tp_sum, pred_sum, true_sum) arrays of length n_classes;
+        false positives are pred_sum - tp_sum and false negatives
+        true_sum - tp_sum
+    """
+    tp_sum = np.bincount(true_codes[true_codes == pred_codes], minlength=n_classes)
+    pred_sum = np.bincount(pred_codes, minlength=n_classes)
+    true_sum = np.bincount(true_codes, minlength=n_classes)
+    return tp_sum, pred_sum, true_sum
+
+
+def classification_scores(
+    y_true,
+    y_pred,
+    metrics: List[str],
+    average: str,
+    pos_label=None,
+    labels=None,
+    zero_division=0,
+) -> Optional[Dict[str, float]]:
+    """
+    Precision, recall and F1 with scikit-learn's averaging.
+
+    Args:
+        y_true: Ground truth labels
+        y_pred: Predicted labels
+        metrics: Names from CLASSIFICATION_METRICS
+        average: "binary", "micro", "macro" or "weighted"
+        pos_label: Positive class for average="binary"
+        labels: Classes to score, in order (ignored for average="binary")
+        zero_division: Score of ill-defined metrics: 0, 1 or "warn"
+
+    Returns:
+        Dict mapping each requested metric to its score, or None when the
+        inputs must go through scikit-learn
+    """
+    if average not in ("binary", "micro", "macro", "weighted"):
+        return None
+    encoded = encode_labels(y_true, y_pred, None if average == "binary" else labels)
+    if encoded is None:
+        return None
+    classes, true_codes, pred_codes, n_present = encoded
+    n_scored = len(classes) if labels is None or average == "binary" else len(labels)
+
+    if average == "binary":
+        # scikit-learn only accepts a binary target, scoring pos_label alone
+        if n_present > 2 or (pos_label not in classes and n_present >= 2):
+            return None
+        if isinstance(pos_label, str) != isinstance(classes[0], str):
+            return None
+        if pos_label not in classes:
+            classes.append(pos_label)
+        selected = np.array([classes.index(pos_label)])
+    else:
+        selected = np.arange(n_scored)
+
+    tp_sum, pred_sum, true_sum = confusion_counts(true_codes, pred_codes, len(classes))
+    tp_sum, pred_sum, true_sum = (
+        tp_sum[selected],
+        pred_sum[selected],
+        true_sum[selected],
+    )
+    if average == "micro":
+        tp_sum, pred_sum, true_sum = (
+            tp_sum.sum(keepdims=True),
+            pred_sum.sum(keepdims=True),
+            true_sum.sum(keepdims=True),
+        )
+
+    scores = {
+        "precision": _divide(tp_sum, pred_sum, zero_division),
+        "recall": _divide(tp_sum, true_sum, zero_division),
+        "f1": _divide(2 * tp_sum, true_sum + pred_sum, zero_division),
+    }
+    # Weighted by support, unweighted if no scored class occurs in y_true
+    weights = true_sum if average == "weighted" and true_sum.sum() > 0 else None
+    return {
+        metric: float(np.average(scores[metric], weights=weights)) for metric in metrics
+    }
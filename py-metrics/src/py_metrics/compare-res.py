@@ -1,5 +1,4 @@
 #!/usr/bin/env python3
-import json
 import matplotlib.pyplot as plt
 import argparse
 import os
@@ -7,6 +6,8 @@ import sys
 import numpy as np
 from matplotlib import rcParams
 
+from py_metrics.per_query_metrics import load_metrics_file
+
 # Set high-quality plot parameters
 plt.style.use("seaborn-v0_8-whitegrid")
 rcParams["figure.dpi"] = 300
@@ -26,13 +27,10 @@ rcParams["ytick.major.width"] = 1.5
 
 
 def compare_metrics(json_file1, json_file2):
-    """Generate bar charts comparing metrics from two JSON files."""
-    # Load the JSON data
-    with open(json_file1, "r") as f:
-        data1 = json.load(f)
-
-    with open(json_file2, "r") as f:
-        data2 = json.load(f)
+    """Generate bar charts comparing metrics from two JSON (or per-query .npz) files."""
+    # Load the JSON data, or average per-query metrics files
+    data1 = load_metrics_file(json_file1)
+    data2 = load_metrics_file(json_file2)
 
     # Check if 'metrics' key exists in the loaded data
     if "metrics" not in data1:
@@ -0,0 +1,194 @@
+"""
+Lazy, resumable access to a downloaded BEIR corpus.
+
+Documents are read from corpus.jsonl when the extracted file is available,
+falling back to an incremental parse of corpus.json. Pagination cursors are
+opaque strings wrapping the source file and a byte offset, so resuming a page
+never re-reads the documents before it. For datasets in the indexed layout
+(see dataset_store) numeric offsets and counts are resolved from the offsets
+index instead of scanning the file.
+"""
+
+import base64
+import json
+from itertools import islice
+from pathlib import Path
+
+from py_metrics.dataset_store import DatasetStore
+from py_metrics.json_stream import count_lines, iter_json_object, iter_jsonl
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Approximate size of each chunk sent by the streaming responses
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor cannot be decoded"""
+
+
+def encode_cursor(source, offset):
+    """Encode a source file name and byte offset as an opaque cursor"""
+    raw = json.dumps([source, offset]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """Decode a cursor created by encode_cursor into (source, offset)"""
+    try:
+        source, offset = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise InvalidCursorError(f"Invalid cursor: {cursor[:50]}")
+    if not isinstance(source, str) or not isinstance(offset, int) or offset < 0:
+        raise InvalidCursorError(f"Invalid cursor: {cursor[:50]}")
+    return source, offset
+
+
+def corpus_source(dataset_dir):
+    """Return the corpus file documents are streamed from"""
+    dataset_dir = Path(dataset_dir)
+    jsonl_path = dataset_dir / "corpus.jsonl"
+    return jsonl_path if jsonl_path.exists() else dataset_dir / "corpus.json"
+
+
+def iter_corpus(dataset_dir, cursor=None):
+    """
+    Lazily iterate over the documents of a corpus.
+
+    Args:
+        dataset_dir: Directory of a downloaded BEIR dataset
+        cursor: Cursor returned alongside a previous page
+
+    Yields:
+        Tuples of (doc_id, doc, cursor), where cursor resumes just past doc
+    """
+    path = corpus_source(dataset_dir)
+    start = None
+    if cursor is not None:
+        source, start = decode_cursor(cursor)
+        if source != path.name:
+            raise InvalidCursorError(
+                f"Cursor refers to {source} but the corpus is served from {path.name}"
+            )
+
+    if path.suffix == ".jsonl":
+        for doc, offset in iter_jsonl(path, start or 0):
+            yield doc.get("_id"), doc, encode_cursor(path.name, offset)
+    else:
+        for doc_id, doc, offset in iter_json_object(path, start):
+            yield doc_id, doc, encode_cursor(path.name, offset)
+
+
+def _seek_offset(dataset_dir, offset, cursor):
+    """
+    Turn a numeric offset into a cursor when the corpus has an offsets index.
+
+    Returns:
+        Tuple of (offset, cursor) still to apply when iterating the corpus
+    """
+    if offset == 0 or cursor is not None:
+        return offset, cursor
+    store = DatasetStore(dataset_dir)
+    if not store.has_table("corpus"):
+        return offset, cursor
+    path = store.jsonl_path("corpus")
+    if offset >= store.count("corpus"):
+        return 0, encode_cursor(path.name, path.stat().st_size)
+    return 0, encode_cursor(path.name, store.offset_of("corpus", offset))
+
+
+def read_corpus_page(dataset_dir, offset=0, limit=None, cursor=None):
+    """
+    Read one page of documents.
+
+    Memory use is bounded by the page size; skipping `offset` documents
+    seeks through the offsets index when present and otherwise scans them
+    without keeping them.
+
+    Returns:
+        Tuple of (documents, next_cursor); next_cursor is None on the last page
+    """
+    offset, cursor = _seek_offset(dataset_dir, offset, cursor)
+    docs = islice(iter_corpus(dataset_dir, cursor), offset, None)
+    page = []
+    next_cursor = None
+    for doc_id, doc, doc_cursor in docs:
+        if limit is not None and len(page) == limit:
+            # There is at least one more document after this page
+            return page, next_cursor
+        page.append(doc)
+        next_cursor = doc_cursor
+    return page, None
+
+
+def stream_corpus_ndjson(dataset_dir, offset=0, limit=None, cursor=None):
+    """Yield the corpus as NDJSON byte chunks, one document per line"""
+    offset, cursor = _seek_offset(dataset_dir, offset, cursor)
+    docs = islice(
+        iter_corpus(dataset_dir, cursor),
+        offset,
+        None if limit is None else offset + limit,
+    )
+    chunk = []
+    size = 0
+    for _, doc, _ in docs:
+        line = json.dumps(doc).encode("utf-8") + b"\n"
+        chunk.append(line)
+        size += len(line)
+        if size >= STREAM_CHUNK_BYTES:
+            yield b"".join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield b"".join(chunk)
+
+
+def stream_corpus_json(dataset_dir):
+    """Yield the whole corpus as a {doc_id: doc} JSON object, chunk by chunk"""
+    yield b"{"
+    chunk = []
+    size = 0
+    first = True
+    for doc_id, doc, _ in iter_corpus(dataset_dir):
+        member = f"{json.dumps(doc_id)}: {json.dumps(doc)}".encode("utf-8")
+        if not first:
+            member = b", " + member
+        first = False
+        chunk.append(member)
+        size += len(member)
+        if size >= STREAM_CHUNK_BYTES:
+            yield b"".join(chunk)
+            chunk, size = [], 0
+    chunk.append(b"}")
+    yield b"".join(chunk)
+
+
+def corpus_exists(dataset_dir):
+    """Whether a dataset directory holds a readable corpus"""
+    return corpus_source(dataset_dir).exists()
+
+
+def get_corpus_doc(dataset_dir, doc_id):
+    """
+    Look up a single document by id.
+
+    Uses a binary search over the id index when present, otherwise scans the
+    corpus. Returns None if the document does not exist.
+    """
+    store = DatasetStore(dataset_dir)
+    if store.has_table("corpus"):
+        return store.get("corpus", doc_id)
+    for current_id, doc, _ in iter_corpus(dataset_dir):
+        if current_id == doc_id:
+            return doc
+    return None
+
+
+def count_corpus(dataset_dir):
+    """Count corpus documents without loading them all into memory"""
+    store = DatasetStore(dataset_dir)
+    if store.has_table("corpus"):
+        return store.count("corpus")
+    path = corpus_source(dataset_dir)
+    if path.suffix == ".jsonl":
+        return count_lines(path)
+    return sum(1 for _ in iter_json_object(path))
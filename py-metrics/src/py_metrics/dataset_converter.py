@@ -0,0 +1,224 @@
+"""
+Single-pass conversion of a BEIR dataset zip into the indexed layout.
+
+Members are streamed straight out of the zip archive, so nothing is
+extracted or copied to disk besides the output files, and no table is ever
+held in memory as a whole: corpus and queries are written line by line while
+their offsets/ids indexes are built, and only qrels (a few entries per query)
+are collected before being packed into a QrelsIndex.
+"""
+
+import json
+import logging
+import resource
+import sys
+import time
+import zipfile
+from pathlib import Path, PurePosixPath
+
+from py_metrics.dataset_store import (
+    QRELS_INDEX_FILE,
+    JsonlIndexWriter,
+    save_qrels_index,
+    write_dataset_meta,
+)
+from py_metrics.fast_evaluator import build_qrels_index
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Number of input bytes between progress log lines
+PROGRESS_INTERVAL_BYTES = 256 * 1024 * 1024
+# Number of records between progress callbacks
+PROGRESS_INTERVAL_DOCS = 10000
+
+
+def _process_peak_rss_mb():
+    """
+    Peak resident set size of this process in megabytes, over its whole
+    lifetime: in a long-running server this is not the conversion's own peak
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _find_dataset_root(zip_ref):
+    """Return the directory inside the archive that holds corpus.jsonl"""
+    for name in zip_ref.namelist():
+        path = PurePosixPath(name)
+        if path.name == "corpus.jsonl":
+            return path.parent
+    raise FileNotFoundError(f"corpus.jsonl not found in {zip_ref.filename}")
+
+
+def _members(zip_ref, root, pattern):
+    """List archive members under root matching a glob pattern, e.g. 'qrels/*.tsv'"""
+    return sorted(
+        name
+        for name in zip_ref.namelist()
+        if PurePosixPath(name).match(str(root / pattern))
+        and PurePosixPath(name).parent == (root / pattern).parent
+    )
+
+
+def _convert_jsonl(zip_ref, member, output_path, progress=None):
+    """Copy a JSONL member to output_path while indexing it"""
+    with zip_ref.open(member) as src, JsonlIndexWriter(output_path) as writer:
+        next_report = PROGRESS_INTERVAL_BYTES
+        for docs, line in enumerate(src, 1):
+            writer.write(line)
+            if progress is not None and docs % PROGRESS_INTERVAL_DOCS == 0:
+                progress(docs_converted=docs, bytes_converted=writer.position)
+            if writer.position >= next_report:
+                logger.info(f"Converted {writer.position >> 20} MB of {member}")
+                next_report += PROGRESS_INTERVAL_BYTES
+        count = writer.close()
+        if progress is not None:
+            progress(docs_converted=count, bytes_converted=writer.position)
+        return count, writer.position
+
+
+def _convert_queries_tsv(zip_ref, member, output_path):
+    """Write a queries TSV member as queries.jsonl while indexing it"""
+    with zip_ref.open(member) as src, JsonlIndexWriter(output_path) as writer:
+        for line in src:
+            parts = line.decode("utf-8").strip().split("\t")
+            if len(parts) >= 2:
+                query_id, query_text = parts[0], parts[1]
+                record = {"_id": query_id, "text": query_text}
+                writer.write(json.dumps(record).encode("utf-8"))
+        return writer.close()
+
+
+def _read_qrels(zip_ref, members):
+    """Parse qrels TSV members into a {query_id: {doc_id: score}} dict"""
+    qrels = {}
+    for member in members:
+        with zip_ref.open(member) as src:
+            for line in src:
+                parts = line.decode("utf-8").strip().split("\t")
+                if len(parts) >= 3:
+                    # Skip header row
+                    if (
+                        parts[0] == "query-id"
+                        and parts[1] == "corpus-id"
+                        and parts[2] == "score"
+                    ):
+                        continue
+                    query_id, doc_id, score = parts[0], parts[1], float(parts[2])
+                    if query_id not in qrels:
+                        qrels[query_id] = {}
+                    qrels[query_id][doc_id] = score
+    return qrels
+
+
+def _write_jsonl_as_json_object(jsonl_path, json_path):
+    """Stream a JSONL table into a {record_id: record} JSON object file"""
+    with open(jsonl_path, "rb") as src, open(json_path, "wb") as out:
+        out.write(b"{")
+        first = True
+        for line in src:
+            line = line.strip()
+            if not line:
+                continue
+            record_id = json.loads(line).get("_id")
+            if not first:
+                out.write(b", ")
+            first = False
+            out.write(json.dumps(record_id).encode("utf-8") + b": " + line)
+        out.write(b"}")
+
+
+def convert_beir_zip(zip_path, dataset_dir, legacy_json=False, progress=None):
+    """
+    Convert a BEIR dataset zip into the indexed layout in one streaming pass.
+
+    Args:
+        zip_path: Path to the downloaded dataset zip
+        dataset_dir: Directory to write the dataset to
+        legacy_json: Also write corpus.json, queries.json and qrels.json
+        progress: Optional callback receiving docs_converted and
+            bytes_converted keyword arguments as the corpus is converted
+
+    Returns:
+        Dict of conversion stats: record counts, bytes, elapsed seconds,
+        throughput and the converting process's lifetime peak RSS
+    """
+    dataset_dir = Path(dataset_dir)
+    dataset_dir.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+    counts = {}
+
+    with zipfile.ZipFile(zip_path, "r") as zip_ref:
+        root = _find_dataset_root(zip_ref)
+        logger.info(f"Converting {zip_path}:{root} into {dataset_dir}")
+        if progress is not None:
+            progress(stage="converting")
+
+        counts["corpus"], corpus_bytes = _convert_jsonl(
+            zip_ref, str(root / "corpus.jsonl"), dataset_dir / "corpus.jsonl", progress
+        )
+        logger.info(f"Indexed {counts['corpus']} corpus documents")
+
+        queries_member = str(root / "queries.jsonl")
+        queries_tsv = _members(zip_ref, root, "queries/*.tsv")
+        if queries_member in zip_ref.namelist():
+            counts["queries"], _ = _convert_jsonl(
+                zip_ref, queries_member, dataset_dir / "queries.jsonl"
+            )
+        elif queries_tsv:
+            counts["queries"] = _convert_queries_tsv(
+                zip_ref, queries_tsv[0], dataset_dir / "queries.jsonl"
+            )
+            logger.info("Queries converted from TSV")
+        else:
+            logger.warning("No queries found")
+        if "queries" in counts:
+            logger.info(f"Indexed {counts['queries']} queries")
+
+        qrels = _read_qrels(zip_ref, _members(zip_ref, root, "qrels/*.tsv"))
+
+    if qrels:
+        save_qrels_index(build_qrels_index(qrels), dataset_dir / QRELS_INDEX_FILE)
+        counts["qrels"] = len(qrels)
+        logger.info(f"Qrels saved to: {dataset_dir / QRELS_INDEX_FILE}")
+    else:
+        logger.warning("No qrels found")
+
+    if legacy_json:
+        _write_jsonl_as_json_object(
+            dataset_dir / "corpus.jsonl", dataset_dir / "corpus.json"
+        )
+        if "queries" in counts:
+            _write_jsonl_as_json_object(
+                dataset_dir / "queries.jsonl", dataset_dir / "queries.json"
+            )
+        if qrels:
+            with open(dataset_dir / "qrels.json", "w") as f:
+                json.dump(qrels, f)
+        logger.info(f"Legacy JSON files saved to: {dataset_dir}")
+
+    elapsed = time.perf_counter() - started
+    stats = {
+        "counts": counts,
+        "corpus_bytes": corpus_bytes,
+        "elapsed_seconds": round(elapsed, 3),
+        "docs_per_second": round(counts["corpus"] / elapsed, 1) if elapsed else None,
+        "mb_per_second": (
+            round(corpus_bytes / (1024 * 1024) / elapsed, 2) if elapsed else None
+        ),
+        "process_peak_rss_mb": round(_process_peak_rss_mb(), 1),
+    }
+    logger.info(
+        f"Converted {counts['corpus']} documents in {stats['elapsed_seconds']}s "
+        f"({stats['docs_per_second']} docs/s, {stats['mb_per_second']} MB/s, "
+        f"process peak RSS {stats['process_peak_rss_mb']} MB)"
+    )
+
+    write_dataset_meta(
+        dataset_dir,
+        counts,
+        conversion={k: v for k, v in stats.items() if k != "counts"},
+    )
+    return stats
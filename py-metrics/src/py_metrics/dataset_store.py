@@ -0,0 +1,343 @@
+"""
+Indexed on-disk layout for downloaded BEIR datasets.
+
+Corpus and queries stay as JSON Lines files, each accompanied by three
+memory-mappable NumPy arrays:
+
+- {name}.offsets.npy: byte offset of every record, in file order
+- {name}.ids.npy: record ids sorted lexicographically
+- {name}.order.npy: row number of each sorted id
+
+so counting is O(1), lookup by id is a binary search over the mapped ids and
+reading a range of rows seeks straight to its first record. Qrels are stored
+as the arrays of a QrelsIndex in qrels.npz. A dataset.json file records the
+format version and record counts.
+"""
+
+import json
+import logging
+import zipfile
+from array import array
+from pathlib import Path
+
+import numpy as np
+
+from py_metrics.fast_evaluator import QrelsIndex, build_qrels_index
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+META_FILE = "dataset.json"
+QRELS_INDEX_FILE = "qrels.npz"
+
+QRELS_INDEX_FIELDS = (
+    "query_ids",
+    "doc_ids",
+    "indptr",
+    "keys",
+    "relevance",
+    "num_relevant",
+    "ideal_gains",
+)
+
+
+class QrelsError(ValueError):
+    """Raised when a qrels file is missing, unreadable or holds no qrels"""
+
+
+# Number of ids buffered as Python strings before packing into a NumPy array
+ID_CHUNK_SIZE = 65536
+
+
+def _record_id(line):
+    """Extract the "_id" of a JSONL record, skipping a full parse when possible"""
+    # BEIR files start every record with {"_id": "...", so slice it out directly
+    prefix = b'{"_id": "'
+    if line.startswith(prefix):
+        end = line.find(b'"', len(prefix))
+        if end != -1 and b"\\" not in line[len(prefix) : end]:
+            return line[len(prefix) : end].decode("utf-8")
+    return str(json.loads(line).get("_id"))
+
+
+class JsonlIndexWriter:
+    """
+    Build the offsets/ids/order arrays of a JSONL table in a single pass.
+
+    Lines are either appended to the table's JSONL file with write() or, for
+    a file that already exists, only recorded with add(). Ids are packed into
+    NumPy chunks as they arrive so memory stays proportional to the id
+    column, not the records.
+    """
+
+    def __init__(self, jsonl_path, write=True):
+        self.jsonl_path = Path(jsonl_path)
+        self._file = open(self.jsonl_path, "wb") if write else None
+        self._offsets = array("q")
+        self._id_chunks = []
+        self._ids = []
+        self.position = 0
+
+    def add(self, line):
+        """Record a line that is already at the current position of the file"""
+        if line.strip():
+            self._offsets.append(self.position)
+            self._ids.append(_record_id(line))
+            if len(self._ids) >= ID_CHUNK_SIZE:
+                self._id_chunks.append(np.asarray(self._ids, dtype=str))
+                self._ids = []
+        self.position += len(line)
+
+    def write(self, line):
+        """Append a line to the JSONL file and record it"""
+        if not line.endswith(b"\n"):
+            line += b"\n"
+        self._file.write(line)
+        self.add(line)
+
+    def close(self):
+        """Flush the JSONL file and save the index arrays"""
+        if self._file is not None:
+            self._file.close()
+        self._id_chunks.append(np.asarray(self._ids, dtype=str))
+        self._ids = []
+        ids = np.concatenate(self._id_chunks)
+        self._id_chunks = []
+        order = np.argsort(ids, kind="stable")
+        prefix = self.jsonl_path.parent / self.jsonl_path.stem
+        np.save(f"{prefix}.offsets.npy", np.frombuffer(self._offsets, dtype=np.int64))
+        np.save(f"{prefix}.ids.npy", ids[order])
+        np.save(f"{prefix}.order.npy", order.astype(np.int64))
+        return len(ids)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self._file is not None:
+            self._file.close()
+
+
+def build_jsonl_index(jsonl_path):
+    """
+    Write the offsets/ids/order arrays for an existing JSON Lines file.
+
+    Args:
+        jsonl_path: Path to a JSONL file whose records carry an "_id" field
+
+    Returns:
+        Number of records indexed
+    """
+    writer = JsonlIndexWriter(jsonl_path, write=False)
+    with open(jsonl_path, "rb") as f:
+        for line in f:
+            writer.add(line)
+    return writer.close()
+
+
+def save_qrels_index(qrels_index, path):
+    """Save the arrays of a QrelsIndex to an .npz file"""
+    np.savez(path, **{name: getattr(qrels_index, name) for name in QRELS_INDEX_FIELDS})
+
+
+def load_qrels_index(path):
+    """Load a QrelsIndex saved with save_qrels_index"""
+    with np.load(path) as data:
+        arrays = {name: data[name] for name in QRELS_INDEX_FIELDS}
+    return QrelsIndex(
+        **arrays,
+        query_lookup={q: i for i, q in enumerate(arrays["query_ids"].tolist())},
+    )
+
+
+def save_qrels_arrays(qrels_index, directory):
+    """Save the arrays of a QrelsIndex as memory-mappable .npy files"""
+    directory = Path(directory)
+    for name in QRELS_INDEX_FIELDS:
+        np.save(directory / f"qrels.{name}.npy", getattr(qrels_index, name))
+
+
+def load_qrels_arrays(directory, mmap_mode="r"):
+    """
+    Map a QrelsIndex saved with save_qrels_arrays.
+
+    Processes mapping the same files share one copy of the arrays in the
+    page cache; only the query id lookup dict is built per process.
+    """
+    directory = Path(directory)
+    arrays = {
+        name: np.load(directory / f"qrels.{name}.npy", mmap_mode=mmap_mode)
+        for name in QRELS_INDEX_FIELDS
+    }
+    return QrelsIndex(
+        **arrays,
+        query_lookup={q: i for i, q in enumerate(arrays["query_ids"].tolist())},
+    )
+
+
+def qrels_index_to_dict(qrels_index):
+    """Expand a QrelsIndex back into a {query_id: {doc_id: relevance}} dict"""
+    n_docs = max(len(qrels_index.doc_ids), 1)
+    doc_ids = qrels_index.doc_ids[qrels_index.keys % n_docs].tolist()
+    relevance = qrels_index.relevance.tolist()
+    indptr = qrels_index.indptr.tolist()
+    return {
+        query_id: dict(zip(doc_ids[start:end], relevance[start:end]))
+        for query_id, start, end in zip(
+            qrels_index.query_ids.tolist(), indptr[:-1], indptr[1:]
+        )
+    }
+
+
+def write_dataset_meta(dataset_dir, counts, conversion=None):
+    """Record the format version, per-table record counts and conversion stats"""
+    meta = {"format_version": FORMAT_VERSION, "counts": counts}
+    if conversion is not None:
+        meta["conversion"] = conversion
+    with open(Path(dataset_dir) / META_FILE, "w") as f:
+        json.dump(meta, f)
+
+
+def find_qrels_path(dataset_dir):
+    """Return the qrels file of a dataset, preferring the indexed form"""
+    dataset_dir = Path(dataset_dir)
+    for name in (QRELS_INDEX_FILE, "qrels.json"):
+        if (dataset_dir / name).exists():
+            return dataset_dir / name
+    return None
+
+
+def read_qrels(qrels_path):
+    """
+    Read a qrels.npz or qrels.json file.
+
+    Args:
+        qrels_path: Path to the qrels file
+
+    Returns:
+        Dict of {query_id: {doc_id: relevance}}
+
+    Raises:
+        QrelsError: If the file is missing, unreadable or holds no qrels
+    """
+    qrels_path = Path(qrels_path)
+    try:
+        if qrels_path.suffix == ".npz":
+            loaded_qrels = qrels_index_to_dict(load_qrels_index(qrels_path))
+        else:
+            with open(qrels_path, "r") as f:
+                loaded_qrels = json.load(f)
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+        raise QrelsError(f"Cannot read qrels from {qrels_path}: {e}") from e
+    if not loaded_qrels or not isinstance(loaded_qrels, dict):
+        raise QrelsError(f"Invalid qrels format or empty qrels in {qrels_path}")
+    return loaded_qrels
+
+
+def read_qrels_index(qrels_path):
+    """
+    Read a qrels.npz or qrels.json file as a QrelsIndex.
+
+    The arrays of qrels.npz are loaded as they are; qrels.json is indexed
+    with build_qrels_index.
+
+    Args:
+        qrels_path: Path to the qrels file
+
+    Returns:
+        QrelsIndex of the qrels
+
+    Raises:
+        QrelsError: If the file is missing, unreadable or holds no qrels
+    """
+    qrels_path = Path(qrels_path)
+    if qrels_path.suffix != ".npz":
+        return build_qrels_index(read_qrels(qrels_path))
+    try:
+        qrels_index = load_qrels_index(qrels_path)
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+        raise QrelsError(f"Cannot read qrels from {qrels_path}: {e}") from e
+    if not len(qrels_index.query_ids):
+        raise QrelsError(f"Empty qrels in {qrels_path}")
+    return qrels_index
+
+
+class DatasetStore:
+    """Read access to a dataset written in the indexed layout"""
+
+    def __init__(self, dataset_dir):
+        self.dataset_dir = Path(dataset_dir)
+        self._tables = {}
+        self._meta = None
+
+    @staticmethod
+    def is_indexed(dataset_dir):
+        """Whether a dataset directory holds the indexed layout"""
+        return (Path(dataset_dir) / META_FILE).exists()
+
+    @property
+    def meta(self):
+        if self._meta is None:
+            with open(self.dataset_dir / META_FILE, "r") as f:
+                self._meta = json.load(f)
+        return self._meta
+
+    def has_table(self, name):
+        return (self.dataset_dir / f"{name}.offsets.npy").exists()
+
+    def jsonl_path(self, name):
+        return self.dataset_dir / f"{name}.jsonl"
+
+    def _table(self, name):
+        if name not in self._tables:
+            if not self.has_table(name):
+                raise FileNotFoundError(f"No {name} index in {self.dataset_dir}")
+            self._tables[name] = {
+                field: np.load(self.dataset_dir / f"{name}.{field}.npy", mmap_mode="r")
+                for field in ("offsets", "ids", "order")
+            }
+        return self._tables[name]
+
+    def count(self, name):
+        """Number of records in a table"""
+        return len(self._table(name)["offsets"])
+
+    def offset_of(self, name, row):
+        """Byte offset of a row in the table's JSONL file"""
+        return int(self._table(name)["offsets"][row])
+
+    def get(self, name, record_id):
+        """Look up a record by id, returning None if it does not exist"""
+        table = self._table(name)
+        ids = table["ids"]
+        i = int(np.searchsorted(ids, record_id))
+        if i >= len(ids) or ids[i] != record_id:
+            return None
+        with open(self.jsonl_path(name), "rb") as f:
+            f.seek(int(table["offsets"][int(table["order"][i])]))
+            return json.loads(f.readline())
+
+    def iter_range(self, name, start=0, stop=None):
+        """Yield the records of rows [start, stop) in file order"""
+        offsets = self._table(name)["offsets"]
+        stop = len(offsets) if stop is None else min(stop, len(offsets))
+        if start >= stop:
+            return
+        with open(self.jsonl_path(name), "rb") as f:
+            f.seek(int(offsets[start]))
+            remaining = stop - start
+            for line in iter(f.readline, b""):
+                if not line.strip():
+                    continue
+                yield json.loads(line)
+                remaining -= 1
+                if remaining == 0:
+                    return
+
+    def load_dict(self, name):
+        """Load a whole table as a {record_id: record} dict"""
+        return {record.get("_id"): record for record in self.iter_range(name)}
+
+    def load_qrels_index(self):
+        return load_qrels_index(self.dataset_dir / QRELS_INDEX_FILE)
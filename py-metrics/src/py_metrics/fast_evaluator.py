@@ -0,0 +1,433 @@
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Number of queries scored per dense block, keeps the padded
+# (queries x max_k) matrices bounded for very large runs
+BLOCK_SIZE = 16384
+
+METRIC_PREFIXES = {
+    "ndcg": "NDCG",
+    "map": "MAP",
+    "recall": "Recall",
+    "precision": "P",
+    # Reciprocal rank of the first relevant document, whether any relevant
+    # document is retrieved, precision at min(R, k) (R-precision once k >= R)
+    # and the share of the top k that is judged
+    "mrr": "MRR",
+    "hit": "Hit",
+    "r_precision": "R-Prec",
+    "judged": "Judged",
+}
+
+
+@dataclass
+class QrelsIndex:
+    """
+    Integer-ID CSR view of a qrels dictionary.
+
+    Queries and documents are numbered in sorted string order, so comparing
+    integer ids gives the same result as comparing the original string ids.
+    """
+
+    query_ids: np.ndarray  # sorted unique query ids (str)
+    doc_ids: np.ndarray  # sorted unique judged doc ids (str)
+    indptr: np.ndarray  # int64, len(query_ids) + 1
+    keys: np.ndarray  # int64 query_idx * len(doc_ids) + doc_idx, sorted
+    relevance: np.ndarray  # int32 relevance grade per (query, doc) pair
+    num_relevant: np.ndarray  # int64 count of grades >= 1 per query
+    ideal_gains: np.ndarray  # float64 positive grades sorted desc, CSR by indptr
+    query_lookup: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory footprint of the index in bytes"""
+        arrays = (
+            self.query_ids,
+            self.doc_ids,
+            self.indptr,
+            self.keys,
+            self.relevance,
+            self.num_relevant,
+            self.ideal_gains,
+        )
+        # The lookup dict holds references to strings already in query_ids
+        return sum(a.nbytes for a in arrays) + 100 * len(self.query_lookup)
+
+
+@dataclass
+class PerQueryMetrics:
+    """Metrics of every evaluated query, one row per query sorted by query id"""
+
+    query_ids: np.ndarray  # sorted query ids (str)
+    k_values: List[int]
+    values: Dict[str, np.ndarray]  # metric -> float64 (len(query_ids), len(k_values))
+
+    @classmethod
+    def from_unsorted(cls, query_ids, k_values, values):
+        """Build from rows in arbitrary query order, sorting them by query id"""
+        query_ids = np.asarray(query_ids, dtype=str)
+        order = np.argsort(query_ids, kind="stable")
+        return cls(
+            query_ids=query_ids[order],
+            k_values=list(k_values),
+            values={name: np.asarray(v)[order] for name, v in values.items()},
+        )
+
+    def column(self, metric, k):
+        """Per-query values of one metric at one cutoff, e.g. ("ndcg", 10)"""
+        return self.values[metric][:, self.k_values.index(k)]
+
+    def aggregate(self) -> Dict:
+        """Average into the same labelled dictionaries as evaluate_run"""
+        return aggregate_metrics(self.values, self.k_values)
+
+
+@dataclass
+class RunArrays:
+    """Ranked, truncated run aligned with the queries of a QrelsIndex"""
+
+    query_ids: List[str]  # evaluated query ids, in evaluation order
+    query_index: np.ndarray  # int64 position of each query in the QrelsIndex
+    indptr: np.ndarray  # int64 CSR offsets into gains
+    gains: np.ndarray  # float64 relevance grade of each ranked doc (0 = unjudged)
+    judged: np.ndarray  # bool, whether each ranked doc is in the query's qrels
+
+
+def _to_numeric_array(values, dtype, what):
+    """
+    Convert a list of scores/grades to a NumPy array.
+
+    Returns the array and a boolean mask of the entries that could be
+    converted; invalid entries are logged and masked out.
+    """
+    try:
+        return np.asarray(values, dtype=np.float64).astype(dtype), None
+    except (ValueError, TypeError):
+        pass
+
+    out = np.zeros(len(values), dtype=dtype)
+    valid = np.ones(len(values), dtype=bool)
+    for i, value in enumerate(values):
+        try:
+            out[i] = float(value)
+        except (ValueError, TypeError):
+            logger.warning(f"Skipping invalid {what} '{value}'")
+            valid[i] = False
+    return out, valid
+
+
+def build_qrels_index(qrels) -> QrelsIndex:
+    """
+    Build a QrelsIndex from a {query_id: {doc_id: relevance}} dictionary.
+
+    Keys are normalized to strings and relevance grades to integers, matching
+    the conversion done by evaluate_beir_results.
+    """
+    query_col = []
+    doc_col = []
+    rel_col = []
+    for query_id, docs in qrels.items():
+        if not isinstance(docs, dict):
+            logger.warning(
+                f"Unexpected format for docs in qrels for query {query_id}, skipping."
+            )
+            continue
+        query_col.extend([str(query_id)] * len(docs))
+        doc_col.extend(map(str, docs.keys()))
+        rel_col.extend(docs.values())
+
+    relevance, valid = _to_numeric_array(rel_col, np.int32, "relevance score")
+    query_arr = np.asarray(query_col, dtype=str)
+    doc_arr = np.asarray(doc_col, dtype=str)
+    if valid is not None:
+        query_arr, doc_arr, relevance = (
+            query_arr[valid],
+            doc_arr[valid],
+            relevance[valid],
+        )
+
+    query_ids, query_idx = np.unique(query_arr, return_inverse=True)
+    doc_ids, doc_idx = np.unique(doc_arr, return_inverse=True)
+    n_docs = max(len(doc_ids), 1)
+
+    keys = query_idx.astype(np.int64) * n_docs + doc_idx.astype(np.int64)
+    keys, first = np.unique(keys, return_index=True)
+    relevance = relevance[first]
+    query_idx = keys // n_docs
+
+    counts = np.bincount(query_idx, minlength=len(query_ids))
+    indptr = np.zeros(len(query_ids) + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+
+    num_relevant = np.bincount(
+        query_idx, weights=(relevance >= 1), minlength=len(query_ids)
+    ).astype(np.int64)
+
+    # Ideal ordering for NDCG: grades sorted descending within each query,
+    # non-positive grades contribute no gain
+    order = np.lexsort((-relevance, query_idx))
+    ideal_gains = np.maximum(relevance[order], 0).astype(np.float64)
+
+    return QrelsIndex(
+        query_ids=query_ids,
+        doc_ids=doc_ids,
+        indptr=indptr,
+        keys=keys,
+        relevance=relevance,
+        num_relevant=num_relevant,
+        ideal_gains=ideal_gains,
+        query_lookup={q: i for i, q in enumerate(query_ids.tolist())},
+    )
+
+
+def build_run_arrays(
+    results, qrels_index: QrelsIndex, max_k: int, ignore_identical_ids=True
+) -> RunArrays:
+    """
+    Rank a {query_id: {doc_id: score}} run and look up relevance grades.
+
+    Only queries present in the qrels are kept. Documents are ordered by score
+    descending with ties broken by doc id descending, the same ordering
+    pytrec_eval applies, and each ranking is truncated to max_k.
+    """
+    query_ids = []
+    query_index = []
+    lengths = []
+    doc_col = []
+    score_col = []
+    for query_id, docs in results.items():
+        query_id = str(query_id)
+        position = qrels_index.query_lookup.get(query_id)
+        if position is None:
+            continue
+        if not isinstance(docs, dict):
+            logger.warning(
+                f"Inner documents for query '{query_id}' in results is not a dict, skipping."
+            )
+            docs = {}
+        query_ids.append(query_id)
+        query_index.append(position)
+        lengths.append(len(docs))
+        doc_col.extend(map(str, docs.keys()))
+        score_col.extend(docs.values())
+
+    n_queries = len(query_ids)
+    query_index = np.asarray(query_index, dtype=np.int64)
+    segment = np.repeat(np.arange(n_queries, dtype=np.int64), lengths)
+    docs = np.asarray(doc_col, dtype=str)
+    scores, valid = _to_numeric_array(score_col, np.float64, "score")
+
+    keep = np.ones(len(docs), dtype=bool) if valid is None else valid
+    if ignore_identical_ids and len(docs):
+        # BEIR drops documents whose id equals the query id (quora, arguana)
+        keep &= docs != np.asarray(query_ids, dtype=str)[segment]
+    docs, scores, segment = docs[keep], scores[keep], segment[keep]
+
+    _, doc_rank = np.unique(docs, return_inverse=True)
+    order = np.lexsort((-doc_rank, -scores, segment))
+    docs, segment = docs[order], segment[order]
+
+    counts = np.bincount(segment, minlength=n_queries)
+    run_indptr = np.zeros(n_queries + 1, dtype=np.int64)
+    np.cumsum(counts, out=run_indptr[1:])
+    rank = np.arange(len(docs), dtype=np.int64) - run_indptr[segment]
+    top = rank < max_k
+    docs, segment = docs[top], segment[top]
+
+    gains = np.zeros(len(docs), dtype=np.float64)
+    judged = np.zeros(len(docs), dtype=bool)
+    if len(docs) and len(qrels_index.doc_ids):
+        doc_pos = np.searchsorted(qrels_index.doc_ids, docs)
+        doc_pos = np.minimum(doc_pos, len(qrels_index.doc_ids) - 1)
+        judged = qrels_index.doc_ids[doc_pos] == docs
+        keys = query_index[segment] * len(qrels_index.doc_ids) + doc_pos
+        key_pos = np.searchsorted(qrels_index.keys, keys)
+        key_pos = np.minimum(key_pos, len(qrels_index.keys) - 1)
+        judged &= qrels_index.keys[key_pos] == keys
+        gains[judged] = qrels_index.relevance[key_pos[judged]]
+
+    counts = np.bincount(segment, minlength=n_queries)
+    indptr = np.zeros(n_queries + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+
+    return RunArrays(
+        query_ids=query_ids,
+        query_index=query_index,
+        indptr=indptr,
+        gains=gains,
+        judged=judged,
+    )
+
+
+def _dense(values, indptr, rows, width):
+    """Scatter the CSR rows [rows] of values into a zero-padded matrix"""
+    starts = indptr[rows]
+    lengths = np.minimum(indptr[rows + 1] - starts, width)
+    out = np.zeros((len(rows), width), dtype=np.float64)
+    row = np.repeat(np.arange(len(rows)), lengths)
+    col = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    out[row, col] = values[np.repeat(starts, lengths) + col]
+    return out
+
+
+def _score_block(qrels_index, run, rows, k_values, max_k):
+    """Compute per-query metrics for a block of run queries"""
+    gains = _dense(run.gains, run.indptr, rows, max_k)
+    ideal = _dense(
+        qrels_index.ideal_gains, qrels_index.indptr, run.query_index[rows], max_k
+    )
+    num_rel = qrels_index.num_relevant[run.query_index[rows]].astype(np.float64)
+    safe_rel = np.where(num_rel > 0, num_rel, 1.0)[:, None]
+
+    cutoffs = np.asarray(k_values) - 1
+    ranks = np.arange(1, max_k + 1, dtype=np.float64)
+    discount = 1.0 / np.log2(ranks + 1.0)
+
+    relevant = gains >= 1
+    hits = np.cumsum(relevant, axis=1)
+    dcg = np.cumsum(np.where(gains > 0, gains, 0.0) * discount, axis=1)
+    idcg = np.cumsum(ideal * discount, axis=1)
+    avg_prec = np.cumsum(np.where(relevant, hits / ranks, 0.0), axis=1)
+    judged = _dense(run.judged, run.indptr, rows, max_k) > 0
+
+    idcg_k = idcg[:, cutoffs]
+    return {
+        "ndcg": np.divide(
+            dcg[:, cutoffs], idcg_k, out=np.zeros_like(idcg_k), where=idcg_k > 0
+        ),
+        "map": avg_prec[:, cutoffs] / safe_rel,
+        "recall": hits[:, cutoffs] / safe_rel,
+        "precision": hits[:, cutoffs] / np.asarray(k_values, dtype=np.float64),
+        **_rank_metrics(relevant, hits, judged, num_rel, k_values),
+    }
+
+
+def _rank_metrics(relevant, hits, judged, num_relevant, k_values):
+    """
+    MRR, Hit, R-precision and judged rate at every k from top-k flags.
+
+    Args:
+        relevant: bool (queries, max_k) matrix, whether each ranked
+            document has a grade of at least 1
+        hits: Cumulative count of relevant along each row
+        judged: bool (queries, max_k) matrix, whether each ranked document
+            is in the query's qrels
+        num_relevant: Number of relevant documents of each query
+        k_values: List of k values, each at most max_k
+
+    Returns:
+        Dict mapping "mrr", "hit", "r_precision" and "judged" to float64
+        arrays of shape (queries, len(k_values))
+    """
+    max_k = relevant.shape[1]
+    k_arr = np.asarray(k_values)
+    # Rank of the first relevant document, max_k + 1 when there is none
+    first = np.where(relevant.any(axis=1), relevant.argmax(axis=1) + 1, max_k + 1)
+    within = first[:, None] <= k_arr
+    r_cut = np.minimum(np.asarray(num_relevant)[:, None], k_arr).astype(np.int64)
+    hits_at_r = np.take_along_axis(hits, np.maximum(r_cut - 1, 0), axis=1)
+    judged_at_k = np.cumsum(judged, axis=1)[:, k_arr - 1]
+    return {
+        "mrr": np.where(within, 1.0 / first[:, None], 0.0),
+        "hit": within.astype(np.float64),
+        "r_precision": np.divide(
+            hits_at_r,
+            r_cut,
+            out=np.zeros(r_cut.shape, dtype=np.float64),
+            where=r_cut > 0,
+        ),
+        "judged": judged_at_k / k_arr.astype(np.float64),
+    }
+
+
+def score_run(
+    qrels_index: QrelsIndex, run: RunArrays, k_values, progress=None
+) -> Dict[str, np.ndarray]:
+    """
+    Compute per-query metrics for every k in one vectorized pass.
+
+    Args:
+        progress: Optional callback, called after every block of queries with
+            queries_evaluated and queries_total keyword arguments
+
+    Returns:
+        Dict mapping every metric of METRIC_PREFIXES to float64 arrays of
+        shape (len(run.query_ids), len(k_values))
+    """
+    k_values = list(k_values)
+    max_k = max(k_values)
+    n_queries = len(run.query_ids)
+    per_query = {
+        name: np.zeros((n_queries, len(k_values)), dtype=np.float64)
+        for name in METRIC_PREFIXES
+    }
+    for start in range(0, n_queries, BLOCK_SIZE):
+        rows = np.arange(start, min(start + BLOCK_SIZE, n_queries))
+        block = _score_block(qrels_index, run, rows, k_values, max_k)
+        for name, values in block.items():
+            per_query[name][rows] = values
+        if progress is not None:
+            progress(queries_evaluated=int(rows[-1]) + 1, queries_total=n_queries)
+    return per_query
+
+
+def aggregate_metrics(per_query: Dict[str, np.ndarray], k_values) -> Dict:
+    """Average per-query metrics into BEIR-style labelled dictionaries"""
+    metrics = {}
+    for name, prefix in METRIC_PREFIXES.items():
+        if name not in per_query:
+            # e.g. per-query files saved before the metric was added
+            continue
+        values = per_query[name]
+        means = values.mean(axis=0) if len(values) else np.zeros(len(k_values))
+        metrics[name] = {
+            f"{prefix}@{k}": round(float(mean), 5) for k, mean in zip(k_values, means)
+        }
+    return metrics
+
+
+def evaluate_run(
+    results,
+    qrels_index: QrelsIndex,
+    k_values,
+    ignore_identical_ids=True,
+    progress=None,
+    return_per_query=False,
+):
+    """
+    Evaluate a run against an indexed qrels with the NumPy engine.
+
+    Args:
+        results: Dict of {query_id: {doc_id: score, ...}, ...}
+        qrels_index: QrelsIndex built with build_qrels_index
+        k_values: List of k values for evaluation
+        ignore_identical_ids: Drop documents whose id equals the query id
+        progress: Optional callback passed to score_run
+        return_per_query: Also return the PerQueryMetrics the averages were
+            computed from
+
+    Returns:
+        Dict of metrics in the same shape as BEIR's EvaluateRetrieval, or
+        None if the run shares no queries with the qrels. With
+        return_per_query, a (metrics, PerQueryMetrics) tuple instead.
+    """
+    run = build_run_arrays(
+        results, qrels_index, max(k_values), ignore_identical_ids=ignore_identical_ids
+    )
+    if not run.query_ids:
+        return (None, None) if return_per_query else None
+
+    logger.info(f"Scoring {len(run.query_ids)} queries with the numpy engine")
+    per_query = score_run(qrels_index, run, k_values, progress=progress)
+    metrics = aggregate_metrics(per_query, k_values)
+    if return_per_query:
+        return metrics, PerQueryMetrics.from_unsorted(
+            run.query_ids, k_values, per_query
+        )
+    return metrics
@@ -0,0 +1,166 @@
+"""
+Evaluation of results against the process-wide qrels cache.
+
+evaluate_with_cache scores results already in memory, and
+evaluate_file_with_cache reads a saved results file and dispatches it to
+the streaming, sharded or incremental evaluator, or loads it whole. Both
+take their qrels from qrels_cache, so repeated evaluations against one
+dataset in the server or in a worker process skip reading the qrels again.
+"""
+
+import logging
+from pathlib import Path
+
+from py_metrics.beir_evaluator import evaluate_beir_results, load_search_results
+from py_metrics.latency_metrics import LatencyStats
+from py_metrics.per_query_cache import evaluate_results_incremental
+from py_metrics.per_query_metrics import save_per_query_metrics
+from py_metrics.qrels_cache import qrels_cache
+from py_metrics.sharded_evaluator import evaluate_results_sharded
+from py_metrics.streaming_evaluator import evaluate_results_stream, should_stream
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _cached_qrels_kwargs(qrels_path, engine):
+    """Qrels keyword argument of evaluate_beir_results for an engine"""
+    if engine == "numpy":
+        return {"qrels_index": qrels_cache.get_qrels_index(qrels_path)}
+    return {"processed_qrels": qrels_cache.get_processed_qrels(qrels_path)}
+
+
+def _save_per_query(per_query, per_query_path, qrels_path, engine):
+    if per_query_path is not None and per_query is not None:
+        save_per_query_metrics(
+            per_query,
+            per_query_path,
+            dataset_name=Path(qrels_path).parent.name,
+            engine=engine,
+        )
+        logger.info(f"Per-query metrics saved to {per_query_path}")
+
+
+def evaluate_with_cache(
+    results, qrels_path, k_values, engine="beir", progress=None, per_query_path=None
+):
+    """
+    Evaluate results against qrels served from the process-wide cache
+
+    When per_query_path is given, the per-query metrics computed alongside the
+    averages are saved there as well.
+    """
+    metrics, per_query = evaluate_beir_results(
+        results,
+        k_values=k_values,
+        engine=engine,
+        progress=progress,
+        return_per_query=True,
+        **_cached_qrels_kwargs(qrels_path, engine),
+    )
+    _save_per_query(per_query, per_query_path, qrels_path, engine)
+    return metrics
+
+
+def evaluate_file_with_cache(
+    results_path,
+    qrels_path,
+    k_values,
+    engine="beir",
+    progress=None,
+    per_query_path=None,
+    stream=None,
+    shards=None,
+    incremental=False,
+    workers=None,
+):
+    """
+    Load a saved results file and evaluate it with evaluate_with_cache.
+
+    Reading the file here rather than in the caller lets an evaluation worker
+    process parse it directly instead of receiving the results pickled. With
+    stream (by default for files of at least STREAM_MIN_FILE_MB), the file
+    is parsed and scored a few queries at a time instead of loaded whole.
+    With shards > 1, the queries are split across worker processes sharing
+    the cached qrels index (up to workers at once, 1 evaluating them in this
+    process); per-shard stats are reported through progress.
+    With incremental, per-query metrics are reused from the on-disk cache
+    (see per_query_cache) and the cache hits are reported through progress.
+    The latency, throughput and error figures of results files carrying
+    per-query timings are reported through progress as well (see
+    latency_metrics).
+    """
+    latency = LatencyStats()
+    if incremental:
+        if progress is not None:
+            progress(stage="incremental")
+        metrics, per_query, cache_stats = evaluate_results_incremental(
+            results_path,
+            qrels_cache.get_qrels_index(qrels_path),
+            k_values,
+            engine=engine,
+            progress=progress,
+            return_per_query=per_query_path is not None,
+            latency=latency,
+        )
+        if progress is not None:
+            progress(cache=cache_stats)
+        _save_per_query(per_query, per_query_path, qrels_path, engine)
+        _report_latency(latency, progress)
+        return metrics
+
+    if shards is not None and shards > 1:
+        if progress is not None:
+            progress(stage="sharding")
+        metrics, per_query, _ = evaluate_results_sharded(
+            results_path,
+            k_values,
+            shards,
+            engine=engine,
+            qrels_index=qrels_cache.get_qrels_index(qrels_path),
+            progress=progress,
+            return_per_query=per_query_path is not None,
+            latency=latency,
+            workers=workers,
+        )
+        _save_per_query(per_query, per_query_path, qrels_path, engine)
+        _report_latency(latency, progress)
+        return metrics
+
+    if should_stream(results_path, stream):
+        if progress is not None:
+            progress(stage="streaming")
+        metrics, per_query = evaluate_results_stream(
+            results_path,
+            k_values,
+            engine=engine,
+            progress=progress,
+            return_per_query=per_query_path is not None,
+            latency=latency,
+            **_cached_qrels_kwargs(qrels_path, engine),
+        )
+        _save_per_query(per_query, per_query_path, qrels_path, engine)
+        _report_latency(latency, progress)
+        return metrics
+
+    if progress is not None:
+        progress(stage="loading")
+    results = load_search_results(results_path, latency=latency)
+    _report_latency(latency, progress)
+    if progress is not None:
+        progress(stage="evaluating")
+    return evaluate_with_cache(
+        results,
+        qrels_path,
+        k_values,
+        engine=engine,
+        progress=progress,
+        per_query_path=per_query_path,
+    )
+
+
+def _report_latency(latency, progress):
+    """Pass the summary of collected timings, if any, to progress"""
+    summary = latency.summary()
+    if summary is not None and progress is not None:
+        progress(latency=summary)
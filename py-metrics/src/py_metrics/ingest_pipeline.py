@@ -0,0 +1,449 @@
+"""
+Adaptive-concurrency bulk ingestion of a BEIR corpus into Supermemory.
+
+batchAddMemories in the TypeScript client adds 20 documents at a time with
+a fixed pause between batches. It ignores how the server responds, and
+loading a multi-million-document corpus takes days. This pipeline streams
+the documents of a downloaded dataset (see corpus_reader) and keeps as many
+/add requests in flight as an AIMD controller allows, as TCP congestion
+control does:
+
+- Every successful request under INGEST_LATENCY_TARGET_MS grows the limit
+  by 1/limit, i.e. by about one request per round of requests.
+- A 429 or 5xx response, a network error or a slower request cuts the limit
+  by INGEST_DECREASE_FACTOR. There is at most one cut per round trip:
+  responses to requests sent before the last cut already reflect it.
+- A Retry-After header pauses all new requests until it passes.
+
+Failed requests are retried with jittered exponential backoff. Documents
+still failing after INGEST_MAX_RETRIES retries, or rejected with another
+4xx, are listed in a .failed file next to the checkpoint.
+
+Progress is checkpointed after every batch of INGEST_BATCH_DOCS documents
+and on interruption. The checkpoint holds a corpus cursor just past the
+last document that, like every document before it, has finished, so an
+interrupted load resumes there. Documents finished beyond that point
+(at most the in-flight window) are sent again on resume.
+
+Every batch logs its docs/sec, its latency percentiles and the current
+concurrency limit.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from pathlib import Path
+
+import httpx
+
+from py_metrics.corpus_reader import count_corpus, iter_corpus
+from py_metrics.latency_metrics import LatencyStats
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SUPERMEMORY_API_URL = os.getenv("SUPERMEMORY_API_URL", "http://127.0.0.1:8100")
+SUPERMEMORY_API_KEY = os.getenv("SUPERMEMORY_API_KEY", "")
+BEIR_DATA_ROOT_PATH = os.getenv("BEIR_DATA_ROOT_PATH", "./beir_data")
+# Requests in flight at the start, and the bounds of the AIMD limit
+INGEST_INITIAL_CONCURRENCY = int(os.getenv("INGEST_INITIAL_CONCURRENCY", "4"))
+INGEST_MAX_CONCURRENCY = int(os.getenv("INGEST_MAX_CONCURRENCY", "64"))
+# Requests slower than this count as congestion
+INGEST_LATENCY_TARGET_MS = float(os.getenv("INGEST_LATENCY_TARGET_MS", "2000"))
+# Multiplier applied to the limit on congestion
+INGEST_DECREASE_FACTOR = float(os.getenv("INGEST_DECREASE_FACTOR", "0.5"))
+INGEST_MAX_RETRIES = int(os.getenv("INGEST_MAX_RETRIES", "5"))
+# Documents per progress report and checkpoint
+INGEST_BATCH_DOCS = int(os.getenv("INGEST_BATCH_DOCS", "1000"))
+INGEST_TIMEOUT_SECONDS = float(os.getenv("INGEST_TIMEOUT_SECONDS", "60"))
+# First retry delay and the cap of the exponential backoff
+RETRY_BASE_SECONDS = 0.5
+RETRY_MAX_SECONDS = 30.0
+CHECKPOINT_FILE = "ingest_checkpoint.json"
+
+
+class AimdController:
+    """
+    Additive-increase/multiplicative-decrease limit on requests in flight.
+
+    Slots are held for a document's whole ingestion, retries included, so
+    documents backing off also hold back new ones.
+    """
+
+    def __init__(
+        self,
+        initial=INGEST_INITIAL_CONCURRENCY,
+        maximum=INGEST_MAX_CONCURRENCY,
+        latency_target_ms=INGEST_LATENCY_TARGET_MS,
+        decrease_factor=INGEST_DECREASE_FACTOR,
+    ):
+        if not 0 < decrease_factor < 1:
+            raise ValueError("decrease_factor must be between 0 and 1")
+        self.minimum = 1.0
+        self.maximum = float(max(maximum, 1))
+        self.limit = min(max(float(initial), self.minimum), self.maximum)
+        self.latency_target_ms = latency_target_ms
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self.increases = 0
+        self.decreases = 0
+        self.paused_until = 0.0
+        self._last_decrease = 0.0
+        self._condition = None
+
+    @property
+    def condition(self):
+        # Created on first use, inside the running event loop
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def acquire(self):
+        """Wait for a free slot under the current limit"""
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self):
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    async def wait_if_paused(self):
+        """Sleep until a Retry-After pause has passed"""
+        delay = self.paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def on_response(self, sent_at, latency_ms, congested, retry_after=None):
+        """
+        Adjust the limit after a response.
+
+        Args:
+            sent_at: time.monotonic() at which the request was sent
+            latency_ms: Response time
+            congested: Whether the response signals overload (429, 5xx or
+                a network error)
+            retry_after: Seconds the server asked to wait, if any
+        """
+        if retry_after:
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+        async with self.condition:
+            if congested or latency_ms > self.latency_target_ms:
+                if sent_at >= self._last_decrease:
+                    self.limit = max(self.minimum, self.limit * self.decrease_factor)
+                    self._last_decrease = time.monotonic()
+                    self.decreases += 1
+            elif self.limit < self.maximum:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+                self.increases += 1
+            self.condition.notify_all()
+
+
+def doc_to_memory(doc):
+    """Supermemory /add request of a BEIR document, as built by load-beir.ts"""
+    title = doc.get("title")
+    text = doc.get("text", "")
+    metadata = {"source": "beir", "doc_id": doc.get("_id")}
+    if title:
+        metadata["title"] = title
+    return {"content": f"{title}\n\n{text}" if title else text, "metadata": metadata}
+
+
+def _retry_after(response):
+    """Seconds of a Retry-After header, None if absent or not a number"""
+    try:
+        return float(response.headers["retry-after"])
+    except (KeyError, ValueError):
+        return None
+
+
+async def add_document(client, controller, memory, max_retries, record):
+    """
+    Add one memory, retrying on 429, 5xx and network errors.
+
+    Every attempt is reported to the controller and passed to record as
+    LatencyStats.add keyword arguments.
+
+    Returns:
+        Whether the memory was added
+    """
+    for attempt in range(max_retries + 1):
+        await controller.wait_if_paused()
+        sent_at = time.monotonic()
+        timestamp = time.time()
+        retry_after = None
+        try:
+            response = await client.post("/add", json=memory)
+            status = response.status_code
+            retry_after = _retry_after(response)
+        except httpx.HTTPError as e:
+            status = None
+            logger.debug(f"Add failed: {e}")
+        latency_ms = (time.monotonic() - sent_at) * 1000
+        ok = status is not None and 200 <= status < 300
+        congested = status is None or status == 429 or status >= 500
+        record(latency_ms=latency_ms, timestamp=timestamp, error=not ok)
+        await controller.on_response(sent_at, latency_ms, congested, retry_after)
+        if ok:
+            return True
+        if not congested:
+            logger.warning(
+                f"Document {memory['metadata']['doc_id']} rejected: {status}"
+            )
+            return False
+        if attempt < max_retries:
+            backoff = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2**attempt)
+            await asyncio.sleep(
+                max(retry_after or 0.0, backoff * random.uniform(0.5, 1))
+            )
+    return False
+
+
+def load_checkpoint(checkpoint_path):
+    """The saved checkpoint, or None if there is none"""
+    try:
+        with open(checkpoint_path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_checkpoint(checkpoint_path, checkpoint):
+    """Write a checkpoint atomically"""
+    tmp_path = f"{checkpoint_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, checkpoint_path)
+
+
+async def ingest_dataset(
+    dataset_dir,
+    base_url=SUPERMEMORY_API_URL,
+    api_key=SUPERMEMORY_API_KEY,
+    checkpoint_path=None,
+    resume=True,
+    controller=None,
+    max_retries=INGEST_MAX_RETRIES,
+    batch_docs=INGEST_BATCH_DOCS,
+    timeout=INGEST_TIMEOUT_SECONDS,
+    max_docs=None,
+    progress=None,
+):
+    """
+    Stream a downloaded corpus into a Supermemory-compatible /add endpoint.
+
+    Args:
+        dataset_dir: Directory of a downloaded BEIR dataset
+        base_url: Supermemory API URL
+        api_key: Sent as x-api-key
+        checkpoint_path: Checkpoint file (default ingest_checkpoint.json in
+            the dataset directory)
+        resume: Continue from the checkpoint if there is one
+        controller: AimdController (default one from the INGEST_* settings)
+        max_retries: Retries of a failing document before giving up
+        batch_docs: Documents per progress report and checkpoint
+        timeout: Seconds before a request fails
+        max_docs: Stop after this many documents of this run
+        progress: Optional callback receiving each batch report as keyword
+            arguments
+
+    Returns:
+        Summary with the documents added and failed, docs_per_second, the
+        latency summary of all requests and the final concurrency limit
+    """
+    dataset_dir = Path(dataset_dir)
+    checkpoint_path = Path(checkpoint_path or dataset_dir / CHECKPOINT_FILE)
+    failed_path = checkpoint_path.with_suffix(".failed")
+    controller = controller or AimdController()
+    checkpoint = load_checkpoint(checkpoint_path) if resume else None
+    if checkpoint is None:
+        checkpoint = {"cursor": None, "docs_done": 0, "added": 0, "failed": 0}
+        failed_path.unlink(missing_ok=True)
+    else:
+        logger.info(f"Resuming after {checkpoint['docs_done']} documents")
+    total = count_corpus(dataset_dir)
+
+    overall = LatencyStats()
+    batch_latency = LatencyStats()
+    batch_started = started = time.perf_counter()
+    batch_done = 0
+    resumed_done = checkpoint["docs_done"]
+    # Dispatched documents in corpus order:
+    # row -> [cursor past it, doc id, added (None while in flight)]
+    window = {}
+    tasks = set()
+
+    def write_checkpoint():
+        checkpoint["updated_at"] = time.time()
+        save_checkpoint(checkpoint_path, checkpoint)
+
+    def report_batch():
+        nonlocal batch_latency, batch_started, batch_done
+        now = time.perf_counter()
+        summary = batch_latency.summary() or {}
+        report = {
+            "docs_done": checkpoint["docs_done"],
+            "docs_total": total,
+            "added": checkpoint["added"],
+            "failed": checkpoint["failed"],
+            "docs_per_second": round(batch_done / max(now - batch_started, 1e-9), 2),
+            "latency_ms": summary.get("latency_ms"),
+            "concurrency_limit": round(controller.limit, 2),
+        }
+        latency_ms = report["latency_ms"] or {}
+        logger.info(
+            f"{report['docs_done']}/{total} docs, {report['docs_per_second']} docs/s, "
+            f"P50 {latency_ms.get('P50')} ms, P95 {latency_ms.get('P95')} ms, "
+            f"P99 {latency_ms.get('P99')} ms, limit {report['concurrency_limit']}, "
+            f"{report['failed']} failed"
+        )
+        if progress is not None:
+            progress(**report)
+        write_checkpoint()
+        batch_latency = LatencyStats()
+        batch_started = now
+        batch_done = 0
+
+    def record(**timing):
+        overall.add(**timing)
+        batch_latency.add(**timing)
+
+    async def ingest(client, row, doc):
+        nonlocal batch_done
+        try:
+            memory = doc_to_memory(doc)
+            added = await add_document(client, controller, memory, max_retries, record)
+        finally:
+            await controller.release()
+        # Advance the checkpoint past every leading finished document. Outcomes
+        # are counted here too, so documents sent again on resume count once.
+        window[row][1:] = [memory["metadata"]["doc_id"], added]
+        while window:
+            first = next(iter(window))
+            cursor, doc_id, outcome = window[first]
+            if outcome is None:
+                break
+            del window[first]
+            if outcome:
+                checkpoint["added"] += 1
+            else:
+                checkpoint["failed"] += 1
+                with open(failed_path, "a") as f:
+                    f.write(f"{doc_id}\n")
+            checkpoint["cursor"] = cursor
+            checkpoint["docs_done"] += 1
+            batch_done += 1
+            if batch_done >= batch_docs:
+                report_batch()
+
+    limits = httpx.Limits(
+        max_connections=int(controller.maximum),
+        max_keepalive_connections=int(controller.maximum),
+    )
+    async with httpx.AsyncClient(
+        base_url=base_url.rstrip("/"),
+        headers={"x-api-key": api_key},
+        limits=limits,
+        timeout=timeout,
+    ) as client:
+        try:
+            docs = iter_corpus(dataset_dir, checkpoint["cursor"])
+            for row, (_, doc, cursor) in enumerate(docs):
+                if max_docs is not None and row >= max_docs:
+                    break
+                await controller.acquire()
+                window[row] = [cursor, None, None]
+                task = asyncio.create_task(ingest(client, row, doc))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            write_checkpoint()
+
+    seconds = time.perf_counter() - started
+    run_done = checkpoint["docs_done"] - resumed_done
+    if batch_done:
+        report_batch()
+    summary = {
+        "docs_done": checkpoint["docs_done"],
+        "docs_total": total,
+        "added": checkpoint["added"],
+        "failed": checkpoint["failed"],
+        "seconds": round(seconds, 3),
+        "docs_per_second": round(run_done / max(seconds, 1e-9), 2),
+        "latency": overall.summary(),
+        "concurrency_limit": round(controller.limit, 2),
+        "limit_increases": controller.increases,
+        "limit_decreases": controller.decreases,
+    }
+    logger.info(
+        f"Ingested {run_done} documents in {seconds:.1f}s "
+        f"({summary['docs_per_second']} docs/s); checkpoint at {checkpoint_path}"
+    )
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load a downloaded BEIR corpus into Supermemory with "
+        "adaptive concurrency"
+    )
+    parser.add_argument("dataset_name", help="Dataset under BEIR_DATA_ROOT_PATH")
+    parser.add_argument(
+        "--url", default=SUPERMEMORY_API_URL, help="Supermemory API URL"
+    )
+    parser.add_argument("--checkpoint", help="Checkpoint file")
+    parser.add_argument(
+        "--restart", action="store_true", help="Ignore an existing checkpoint"
+    )
+    parser.add_argument(
+        "--initial-concurrency", type=int, default=INGEST_INITIAL_CONCURRENCY
+    )
+    parser.add_argument("--max-concurrency", type=int, default=INGEST_MAX_CONCURRENCY)
+    parser.add_argument(
+        "--latency-target-ms",
+        type=float,
+        default=INGEST_LATENCY_TARGET_MS,
+        help="Back off when requests get slower than this",
+    )
+    parser.add_argument("--max-retries", type=int, default=INGEST_MAX_RETRIES)
+    parser.add_argument(
+        "--batch-docs",
+        type=int,
+        default=INGEST_BATCH_DOCS,
+        help="Documents per progress report and checkpoint",
+    )
+    parser.add_argument("--max-docs", type=int, help="Stop after N documents")
+    args = parser.parse_args()
+
+    summary = asyncio.run(
+        ingest_dataset(
+            Path(BEIR_DATA_ROOT_PATH) / args.dataset_name,
+            base_url=args.url,
+            checkpoint_path=args.checkpoint,
+            resume=not args.restart,
+            controller=AimdController(
+                initial=args.initial_concurrency,
+                maximum=args.max_concurrency,
+                latency_target_ms=args.latency_target_ms,
+            ),
+            max_retries=args.max_retries,
+            batch_docs=args.batch_docs,
+            max_docs=args.max_docs,
+        )
+    )
+    if summary["latency"] is not None:
+        summary["latency"].get("throughput", {}).pop("windows", None)
+    print(json.dumps(summary, indent=4))
+
+
+if __name__ == "__main__":
+    main()
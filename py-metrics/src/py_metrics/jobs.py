@@ -0,0 +1,283 @@
+"""
+Background jobs for long-running downloads and evaluations.
+
+A job wraps one call to a blocking function that runs in one of the worker
+pools. Submitting returns immediately with a job id; the function reports
+progress through a `progress` keyword argument, which is also how
+cancellation reaches it: once a job is cancelled, the next progress() call
+raises JobCancelledError. Progress and cancellation flags live in plain
+dicts for thread-pool jobs and in multiprocessing.Manager dicts for jobs
+running in evaluation processes.
+
+Jobs with identical kind and parameters are deduplicated while in flight,
+so concurrent callers asking for the same download share one job.
+"""
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from py_metrics.worker_pools import EVAL_PROCESS_WORKERS, cpu_pool
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# How long finished jobs and their results are kept, in seconds
+JOB_RESULT_TTL_SECONDS = int(os.getenv("JOB_RESULT_TTL_SECONDS", "3600"))
+
+FINISHED_STATUSES = ("succeeded", "failed", "cancelled")
+
+
+class JobCancelledError(Exception):
+    """Raised inside a job's function once the job has been cancelled"""
+
+
+class JobProgress:
+    """
+    Progress callback handed to a job's function.
+
+    Calling it with keyword arguments merges them into the job's progress
+    (e.g. progress(bytes_downloaded=n)); any call raises JobCancelledError
+    if the job was cancelled. Instances pickle along with Manager dicts, so
+    they work in evaluation processes.
+    """
+
+    def __init__(self, job_id, progress, cancelled):
+        self.job_id = job_id
+        self._progress = progress
+        self._cancelled = cancelled
+
+    def __call__(self, **fields):
+        if self.job_id in self._cancelled:
+            raise JobCancelledError(f"Job {self.job_id} was cancelled")
+        if fields:
+            self._progress[self.job_id] = {
+                **self._progress.get(self.job_id, {}),
+                **fields,
+            }
+
+    def cancel(self):
+        self._cancelled[self.job_id] = True
+
+    @property
+    def cancelled(self):
+        return self.job_id in self._cancelled
+
+    def snapshot(self):
+        return dict(self._progress.get(self.job_id, {}))
+
+    def release(self):
+        """Drop the shared entries, returning the final progress"""
+        final = self.snapshot()
+        self._progress.pop(self.job_id, None)
+        self._cancelled.pop(self.job_id, None)
+        return final
+
+
+def _run_job(fn, progress, args, kwargs):
+    """Entry point of a job inside a worker"""
+    progress(started_at=time.time())
+    return fn(*args, progress=progress, **kwargs)
+
+
+def _timestamp(seconds):
+    if seconds is None:
+        return None
+    return datetime.fromtimestamp(seconds, tz=timezone.utc).isoformat()
+
+
+@dataclass
+class Job:
+    job_id: str
+    kind: str
+    key: str
+    params: Dict[str, Any]
+    progress: JobProgress
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    status: str = "queued"
+    result: Any = None
+    error: Optional[str] = None
+    final_progress: Optional[Dict[str, Any]] = None
+    task: Optional[asyncio.Task] = None
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATUSES
+
+    def to_dict(self):
+        progress = (
+            self.final_progress
+            if self.final_progress is not None
+            else self.progress.snapshot()
+        )
+        status = self.status
+        if status == "queued" and "started_at" in progress:
+            status = "running"
+        if status == "running" and self.progress.cancelled:
+            status = "cancelling"
+        progress = dict(progress)
+        started_at = progress.pop("started_at", None)
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "status": status,
+            "params": self.params,
+            "progress": progress,
+            "error": self.error,
+            "created_at": _timestamp(self.created_at),
+            "started_at": _timestamp(started_at),
+            "finished_at": _timestamp(self.finished_at),
+        }
+
+
+class JobManager:
+    """Registry of background jobs running in the worker pools"""
+
+    def __init__(self, ttl_seconds=JOB_RESULT_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.jobs: Dict[str, Job] = {}
+        self._inflight: Dict[str, str] = {}
+        # Cancelled jobs still running, so a resubmission waits for them
+        self._draining: Dict[str, asyncio.Task] = {}
+        self._local = ({}, {})
+        self._shared = None
+        self._manager = None
+        self._manager_lock = threading.Lock()
+
+    def _stores(self, pool):
+        """Progress and cancellation dicts reachable from the pool's workers"""
+        if pool is not cpu_pool or EVAL_PROCESS_WORKERS <= 0:
+            return self._local
+        with self._manager_lock:
+            if self._shared is None:
+                self._manager = multiprocessing.Manager()
+                self._shared = (self._manager.dict(), self._manager.dict())
+            return self._shared
+
+    def submit(self, kind, params, pool, fn, *args, **kwargs):
+        """
+        Start fn(*args, progress=..., **kwargs) in pool as a background job.
+
+        Must be called from the event loop.
+
+        Args:
+            kind: Job type, e.g. "download"
+            params: JSON-serializable parameters identifying the job; an
+                in-flight job of the same kind and params is reused
+            pool: WorkerPool to run fn in
+            fn: Blocking function accepting a `progress` keyword argument
+
+        Returns:
+            Tuple of (job, deduplicated), deduplicated being True when an
+            existing job was returned
+        """
+        self._prune()
+        key = f"{kind}:{json.dumps(params, sort_keys=True)}"
+        job_id = self._inflight.get(key)
+        if job_id is not None:
+            return self.jobs[job_id], True
+
+        job_id = uuid.uuid4().hex
+        progress, cancelled = self._stores(pool)
+        job = Job(
+            job_id=job_id,
+            kind=kind,
+            key=key,
+            params=params,
+            progress=JobProgress(job_id, progress, cancelled),
+        )
+        self.jobs[job_id] = job
+        self._inflight[key] = job_id
+        job.task = asyncio.get_running_loop().create_task(
+            self._run(job, pool, fn, args, kwargs)
+        )
+        logger.info(f"Submitted {kind} job {job_id}: {params}")
+        return job, False
+
+    async def _run(self, job, pool, fn, args, kwargs):
+        draining = self._draining.get(job.key)
+        if draining is not None:
+            await asyncio.wait([draining])
+        try:
+            job.result = await pool.run(_run_job, fn, job.progress, args, kwargs)
+            # A function may swallow JobCancelledError and return early
+            job.status = "cancelled" if job.progress.cancelled else "succeeded"
+        except JobCancelledError:
+            job.status = "cancelled"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
+        except Exception as e:
+            if job.progress.cancelled:
+                job.status = "cancelled"
+            else:
+                job.status = "failed"
+                job.error = str(e)[:1000]
+                logger.error(f"{job.kind} job {job.job_id} failed: {e}")
+        finally:
+            if job.status == "cancelled":
+                job.result = None
+            job.finished_at = time.time()
+            job.final_progress = job.progress.release()
+            if self._inflight.get(job.key) == job.job_id:
+                del self._inflight[job.key]
+            if self._draining.get(job.key) is job.task:
+                del self._draining[job.key]
+            logger.info(f"{job.kind} job {job.job_id} {job.status}")
+
+    def get(self, job_id):
+        self._prune()
+        return self.jobs.get(job_id)
+
+    def list(self):
+        self._prune()
+        return list(self.jobs.values())
+
+    def cancel(self, job_id):
+        """
+        Cancel a job.
+
+        The job's function stops at its next progress() call; until then the
+        job reports status "cancelling". Finished jobs are left unchanged.
+
+        Returns:
+            The job, or None if it does not exist
+        """
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return job
+        job.progress.cancel()
+        if self._inflight.get(job.key) == job_id:
+            del self._inflight[job.key]
+            self._draining[job.key] = job.task
+        logger.info(f"Cancelling {job.kind} job {job_id}")
+        return job
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl_seconds
+        expired = [
+            job_id
+            for job_id, job in self.jobs.items()
+            if job.finished and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    def shutdown(self):
+        with self._manager_lock:
+            if self._manager is not None:
+                self._manager.shutdown()
+                self._manager = None
+                self._shared = None
+
+
+job_manager = JobManager()
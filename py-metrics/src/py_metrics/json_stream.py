@@ -0,0 +1,233 @@
+"""
+Incremental readers for large JSON and JSONL files.
+
+Both readers yield one record at a time together with the byte offset just
+past it, so callers can stop early and later resume from that offset without
+holding the whole file in memory.
+"""
+
+import codecs
+import json
+
+CHUNK_SIZE = 1 << 20
+WHITESPACE = " \t\r\n"
+
+_decoder = json.JSONDecoder()
+
+
+class _Reader:
+    """Buffered UTF-8 reader that tracks the byte offset of its cursor"""
+
+    def __init__(self, f, offset, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.offset = offset
+        self.eof = False
+
+    def fill(self, size=0):
+        data = self.f.read(max(size, self.chunk_size))
+        if not data:
+            self.eof = True
+        self.buf = self.buf[self.pos :] + self.decoder.decode(data, final=self.eof)
+        self.pos = 0
+
+    def advance(self, n):
+        self.offset += len(self.buf[self.pos : self.pos + n].encode("utf-8"))
+        self.pos += n
+
+    def peek(self):
+        """Return the next non-whitespace character, or "" at end of file"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+                self.advance(1)
+            if self.pos < len(self.buf) or self.eof:
+                return self.buf[self.pos] if self.pos < len(self.buf) else ""
+            self.fill()
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise json.JSONDecodeError(
+                f"Expected '{char}' but found '{found}'", self.buf, self.pos
+            )
+        self.advance(1)
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                obj, end = _decoder.raw_decode(self.buf, self.pos)
+                # A value ending exactly at the buffer edge may be truncated
+                # (e.g. a number), so only accept it once more input is seen
+                if end < len(self.buf) or self.eof:
+                    self.advance(end - self.pos)
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # Each attempt decodes the value from its start, so read at least
+            # as much again as is buffered of it: decoding stays linear
+            self.fill(len(self.buf) - self.pos)
+
+    def first_member(self):
+        """
+        Read the first key of an object, and its value only if a scalar.
+
+        Returns:
+            Tuple of (key, value), value being None for an object or array
+            value, which is not parsed; (None, None) for an empty object
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            return None, None
+        key = self.value()
+        self.expect(":")
+        if self.peek() in ("{", "["):
+            return key, None
+        return key, self.value()
+
+
+def iter_json_object(path, start=None, chunk_size=CHUNK_SIZE):
+    """
+    Iterate over the top-level members of a JSON object file.
+
+    Args:
+        path: Path to a file containing a single JSON object
+        start: Byte offset returned by a previous iteration to resume from
+        chunk_size: Number of bytes read from disk at a time
+
+    Yields:
+        Tuples of (key, value, offset), where offset is the byte position
+        just past the value
+    """
+    with open(path, "rb") as f:
+        if start is not None:
+            f.seek(start)
+        reader = _Reader(f, start or 0, chunk_size)
+
+        if start is None:
+            reader.expect("{")
+            if reader.peek() == "}":
+                return
+        else:
+            # Resuming just past a value: next is either ',' or the closing '}'
+            if reader.peek() in ("}", ""):
+                return
+            reader.expect(",")
+
+        while True:
+            key = reader.value()
+            reader.expect(":")
+            value = reader.value()
+            yield key, value, reader.offset
+
+            separator = reader.peek()
+            if separator == "}":
+                return
+            reader.expect(",")
+
+
+def iter_json_members(path, expand=(), chunk_size=CHUNK_SIZE):
+    """
+    Iterate over the top-level members of a JSON object file, streaming into
+    selected members.
+
+    Members whose key is in expand and whose value is an object are never
+    parsed whole; their own members are yielded one at a time instead, so
+    memory is bounded by the largest nested value.
+
+    Args:
+        path: Path to a file containing a single JSON object
+        expand: Top-level keys whose object values are streamed
+        chunk_size: Number of bytes read from disk at a time
+
+    Yields:
+        Tuples of (parent_key, key, value, offset): parent_key is the
+        expanded top-level key for nested members and None for top-level
+        members, and offset is the byte position just past the value
+    """
+    with open(path, "rb") as f:
+        reader = _Reader(f, 0, chunk_size)
+        reader.expect("{")
+        if reader.peek() == "}":
+            return
+
+        while True:
+            key = reader.value()
+            reader.expect(":")
+            if key in expand and reader.peek() == "{":
+                reader.expect("{")
+                if reader.peek() == "}":
+                    reader.advance(1)
+                else:
+                    while True:
+                        nested_key = reader.value()
+                        reader.expect(":")
+                        value = reader.value()
+                        yield key, nested_key, value, reader.offset
+                        if reader.peek() == "}":
+                            reader.advance(1)
+                            break
+                        reader.expect(",")
+            else:
+                value = reader.value()
+                yield None, key, value, reader.offset
+
+            separator = reader.peek()
+            if separator == "}":
+                return
+            reader.expect(",")
+
+
+def first_json_member(path, chunk_size=CHUNK_SIZE):
+    """
+    Read the first member of a JSON object file without parsing the rest.
+
+    Object and array values are skipped, so this is cheap whatever their
+    size.
+
+    Returns:
+        Tuple of (key, value), value being None for an object or array;
+        (None, None) for an empty object
+
+    Raises:
+        json.JSONDecodeError: If the file does not start with a JSON object
+    """
+    with open(path, "rb") as f:
+        return _Reader(f, 0, chunk_size).first_member()
+
+
+def iter_jsonl(path, start=0):
+    """
+    Iterate over the records of a JSON Lines file.
+
+    Args:
+        path: Path to a file with one JSON value per line
+        start: Byte offset returned by a previous iteration to resume from
+
+    Yields:
+        Tuples of (record, offset), where offset is the byte position of the
+        next line. Blank lines are skipped.
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        offset = start
+        for line in iter(f.readline, b""):
+            offset += len(line)
+            if line.strip():
+                yield json.loads(line), offset
+
+
+def count_lines(path, chunk_size=CHUNK_SIZE):
+    """Count the lines of a file without decoding it"""
+    count = 0
+    last = b"\n"
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            count += chunk.count(b"\n")
+            last = chunk[-1:]
+    # A final line without a trailing newline still counts
+    return count + (last != b"\n")
@@ -0,0 +1,336 @@
+"""
+Latency percentiles, throughput and error rates of a search run.
+
+Results files may carry the timing of every query next to its results (see
+results_format): the latency in milliseconds, the Unix timestamp at which
+the request was sent, and whether it failed (an "error" message or a
+non-2xx "status"). LatencyStats accumulates them while the results are
+streamed for evaluation, with memory independent of the number of queries:
+
+- Latencies go into a LatencySketch, a log-bucketed histogram in the style
+  of HDR histograms and DDSketch. Every bucket spans a fixed ratio, so any
+  percentile is returned within LATENCY_SKETCH_ACCURACY relative error
+  from a few thousand counters, and two sketches merge by adding counts.
+- Completions are counted per QPS_WINDOW_SECONDS window, giving the QPS
+  over time as well as its peak and mean. Memory grows with the duration
+  of the run, not with the number of queries.
+
+Latency percentiles only cover successful queries; failed ones are counted
+in the error rate and in the throughput.
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Relative error of the reported latency percentiles
+LATENCY_SKETCH_ACCURACY = float(os.getenv("LATENCY_SKETCH_ACCURACY", "0.01"))
+# Width of the windows QPS is measured over
+QPS_WINDOW_SECONDS = float(os.getenv("QPS_WINDOW_SECONDS", "1"))
+LATENCY_PERCENTILES = (50, 90, 95, 99)
+# Longest QPS series returned; longer runs are reported over wider windows
+QPS_MAX_WINDOWS = 10000
+# Latencies tracked by the sketch, in milliseconds; values outside are
+# clamped to the first or last bucket (min and max stay exact)
+SKETCH_MIN_MS = 1e-3
+SKETCH_MAX_MS = 1e8
+# Samples buffered before they are folded into the sketch and windows
+SAMPLE_BUFFER_SIZE = 65536
+
+
+class LatencySketch:
+    """
+    Fixed-size log-bucketed histogram of latencies.
+
+    Bucket i holds the values in (gamma^(i-1), gamma^i] with
+    gamma = (1 + accuracy) / (1 - accuracy), so reporting the bucket's
+    midpoint keeps every quantile within the relative accuracy.
+    """
+
+    def __init__(self, relative_accuracy=LATENCY_SKETCH_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self._offset = math.floor(math.log(SKETCH_MIN_MS) / self._log_gamma)
+        size = math.ceil(math.log(SKETCH_MAX_MS) / self._log_gamma) - self._offset + 1
+        self.counts = np.zeros(size, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, values):
+        """Add an array of latencies in milliseconds"""
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return
+        clipped = np.clip(values, SKETCH_MIN_MS, SKETCH_MAX_MS)
+        index = np.ceil(np.log(clipped) / self._log_gamma).astype(np.int64)
+        index = np.clip(index - self._offset, 0, len(self.counts) - 1)
+        self.counts += np.bincount(index, minlength=len(self.counts))
+        self.count += len(values)
+        self.total += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def merge(self, other):
+        """Add the counts of a sketch built with the same accuracy"""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge latency sketches of different accuracy")
+        self.counts += other.counts
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        """Estimated q-quantile (0 <= q <= 1), None for an empty sketch"""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        bucket = int(np.searchsorted(np.cumsum(self.counts), rank, side="right"))
+        value = 2 * self.gamma ** (bucket + self._offset) / (self.gamma + 1)
+        return min(max(value, self.min), self.max)
+
+
+class LatencyStats:
+    """
+    Streaming accumulator of per-query timings.
+
+    Samples are buffered and folded into the sketch and the QPS windows in
+    blocks of SAMPLE_BUFFER_SIZE. Instances can be pickled and merged, so
+    worker processes each collect their share of a run.
+    """
+
+    def __init__(self, window_seconds=QPS_WINDOW_SECONDS):
+        self.window_seconds = window_seconds
+        self.sketch = LatencySketch()
+        self.queries = 0
+        self.errors = 0
+        self.first_start = math.inf
+        self.last_end = -math.inf
+        # {window number: completed queries}
+        self.windows = {}
+        self._latencies = []
+        self._ends = []
+
+    def add(self, latency_ms=None, timestamp=None, error=False):
+        """
+        Record one query.
+
+        Args:
+            latency_ms: Response time in milliseconds, if known
+            timestamp: Unix time at which the request was sent, if known
+            error: Whether the request failed
+        """
+        self.queries += 1
+        if error:
+            self.errors += 1
+        elif latency_ms is not None:
+            self._latencies.append(latency_ms)
+        if timestamp is not None:
+            end = timestamp + (latency_ms or 0.0) / 1000.0
+            self.first_start = min(self.first_start, timestamp)
+            self._ends.append(end)
+        if len(self._latencies) >= SAMPLE_BUFFER_SIZE or (
+            len(self._ends) >= SAMPLE_BUFFER_SIZE
+        ):
+            self._flush()
+
+    def add_many(self, latency_ms, timestamp, error):
+        """
+        Record a block of queries from parallel arrays, NaN marking an
+        unknown latency or timestamp
+        """
+        self._flush()
+        latency_ms = np.asarray(latency_ms, dtype=np.float64)
+        timestamp = np.asarray(timestamp, dtype=np.float64)
+        error = np.asarray(error, dtype=bool)
+        self.queries += len(latency_ms)
+        self.errors += int(error.sum())
+        self.sketch.add(latency_ms[~error & ~np.isnan(latency_ms)])
+        timed = ~np.isnan(timestamp)
+        if timed.any():
+            self.first_start = min(self.first_start, float(timestamp[timed].min()))
+            self._ends = (
+                timestamp[timed] + np.nan_to_num(latency_ms[timed]) / 1000.0
+            ).tolist()
+            self._flush()
+
+    def add_record(self, record):
+        """Record the timing fields of a results record, if it has any"""
+        timing = parse_timing(record)
+        if timing is not None:
+            self.add(**timing)
+
+    def _flush(self):
+        if self._latencies:
+            self.sketch.add(self._latencies)
+            self._latencies = []
+        if self._ends:
+            ends = np.asarray(self._ends, dtype=np.float64)
+            self._ends = []
+            self.last_end = max(self.last_end, float(ends.max()))
+            windows, counts = np.unique(
+                np.floor(ends / self.window_seconds).astype(np.int64),
+                return_counts=True,
+            )
+            for window, count in zip(windows.tolist(), counts.tolist()):
+                self.windows[window] = self.windows.get(window, 0) + count
+
+    def merge(self, other):
+        """Add the samples of another LatencyStats"""
+        self._flush()
+        other._flush()
+        if other.window_seconds != self.window_seconds:
+            raise ValueError("Cannot merge latency stats of different QPS windows")
+        self.sketch.merge(other.sketch)
+        self.queries += other.queries
+        self.errors += other.errors
+        self.first_start = min(self.first_start, other.first_start)
+        self.last_end = max(self.last_end, other.last_end)
+        for window, count in other.windows.items():
+            self.windows[window] = self.windows.get(window, 0) + count
+
+    def __getstate__(self):
+        self._flush()
+        return self.__dict__
+
+    def summary(self):
+        """
+        Latency, throughput and error figures of the recorded queries.
+
+        Returns:
+            Dict with the query and error counts, "latency_ms" (mean, min,
+            max and P50/P90/P95/P99) when latencies were recorded, and
+            "throughput" (duration, mean QPS, the QPS of every window and,
+            with at least 3 windows, the peak/min QPS of the full ones) when
+            timestamps were recorded. None when no query carried timing
+            data.
+        """
+        self._flush()
+        if self.queries == 0:
+            return None
+        summary = {
+            "queries": self.queries,
+            "errors": self.errors,
+            "error_rate": round(self.errors / self.queries, 5),
+        }
+        sketch = self.sketch
+        if sketch.count:
+            summary["latency_ms"] = {
+                "mean": round(sketch.total / sketch.count, 3),
+                "min": round(sketch.min, 3),
+                "max": round(sketch.max, 3),
+                **{
+                    f"P{p}": round(sketch.quantile(p / 100), 3)
+                    for p in LATENCY_PERCENTILES
+                },
+            }
+        if self.windows:
+            duration = max(self.last_end - self.first_start, 1e-9)
+            first, last = min(self.windows), max(self.windows)
+            # Merge neighbouring windows when the run spans too many
+            factor = -(-(last - first + 1) // QPS_MAX_WINDOWS)
+            width = self.window_seconds * factor
+            counts = np.zeros((last - first) // factor + 1, dtype=np.int64)
+            for window, count in self.windows.items():
+                counts[(window - first) // factor] += count
+            series = counts / width
+            throughput = {
+                "duration_seconds": round(duration, 3),
+                "qps": round(float(counts.sum()) / duration, 3),
+                "window_seconds": width,
+            }
+            # The first and last windows are usually partial, so their rate
+            # understates the throughput; without a full window in between
+            # there is no peak or min to report
+            if len(series) > 2:
+                throughput["peak_qps"] = round(float(series[1:-1].max()), 3)
+                throughput["min_qps"] = round(float(series[1:-1].min()), 3)
+            throughput["windows"] = [
+                {
+                    "start": (first + i * factor) * self.window_seconds,
+                    "qps": round(float(qps), 3),
+                }
+                for i, qps in enumerate(series)
+            ]
+            summary["throughput"] = throughput
+        return summary
+
+
+def parse_timing(record):
+    """
+    Timing fields of a results record or "timings" entry.
+
+    Recognized fields are "latency_ms", "timestamp", "error" (a message or
+    flag) and "status" (an HTTP status code; anything outside 2xx is an
+    error).
+
+    Returns:
+        Keyword arguments for LatencyStats.add, or None if the record has
+        no timing fields
+    """
+    if not isinstance(record, dict):
+        return None
+    latency = record.get("latency_ms")
+    timestamp = record.get("timestamp")
+    status = record.get("status")
+    try:
+        failed_status = status is not None and not 200 <= int(status) < 300
+    except (TypeError, ValueError):
+        failed_status = True
+    error = bool(record.get("error")) or failed_status
+    if latency is None and timestamp is None and not error and status is None:
+        return None
+    return {
+        "latency_ms": None if latency is None else float(latency),
+        "timestamp": None if timestamp is None else float(timestamp),
+        "error": error,
+    }
+
+
+def read_latency_stats(results_path):
+    """
+    Collect the timings of a results file in any format without evaluating
+
+    Returns:
+        LatencyStats of the file's queries
+    """
+    # Imported here: results_format hands timings to this module
+    from py_metrics.results_format import iter_results
+
+    latency = LatencyStats()
+    for _ in iter_results(results_path, latency=latency):
+        pass
+    return latency
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Latency percentiles, QPS and error rate of a results file"
+    )
+    parser.add_argument("results_path", help="Results file with per-query timings")
+    parser.add_argument(
+        "--windows", action="store_true", help="Also print the QPS of every window"
+    )
+    args = parser.parse_args()
+
+    summary = read_latency_stats(args.results_path).summary()
+    if summary is None:
+        print("No timing data in results file")
+        return
+    if not args.windows and "throughput" in summary:
+        summary["throughput"].pop("windows")
+    print(json.dumps(summary, indent=4))
+
+
+if __name__ == "__main__":
+    main()
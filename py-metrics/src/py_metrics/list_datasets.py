@@ -6,6 +6,8 @@ List BEIR datasets that have been downloaded to the local system.
 import json
 from pathlib import Path
 
+from py_metrics.dataset_store import DatasetStore
+
 
 def list_downloaded_datasets():
     """List all downloaded BEIR datasets in the beir_data directory."""
@@ -28,6 +30,17 @@ def list_downloaded_datasets():
 
     print(f"Found {len(datasets)} downloaded datasets:")
     for dataset in sorted(datasets):
+        if DatasetStore.is_indexed(beir_data_dir / dataset):
+            # Counts are recorded at download time, no need to parse the files
+            counts = DatasetStore(beir_data_dir / dataset).meta["counts"]
+            status = [f"corpus: {counts.get('corpus', 0)} documents"]
+            for name in ("queries", "qrels"):
+                status.append(
+                    f"{name}: {counts[name]}" if name in counts else f"{name}: missing"
+                )
+            print(f"  - {dataset} ({', '.join(status)})")
+            continue
+
         corpus_path = beir_data_dir / dataset / "corpus.json"
         queries_path = beir_data_dir / dataset / "queries.json"
         qrels_path = beir_data_dir / dataset / "qrels.json"
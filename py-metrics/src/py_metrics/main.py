@@ -1,25 +1,72 @@
 import os
 import json
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Literal, Optional
 
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field
 
 from py_metrics.beir_downloader import download_beir_dataset
+from py_metrics.corpus_reader import (
+    NDJSON_MEDIA_TYPE,
+    InvalidCursorError,
+    corpus_exists,
+    count_corpus,
+    decode_cursor,
+    get_corpus_doc,
+    read_corpus_page,
+    stream_corpus_json,
+    stream_corpus_ndjson,
+)
+from py_metrics.batch_evaluator import evaluate_batch, metric_labels
 from py_metrics.beir_evaluator import (
-    evaluate_beir_results,
     format_metrics,
     create_empty_metrics,
 )
+from py_metrics.dataset_store import (
+    DatasetStore,
+    find_qrels_path,
+    load_qrels_index,
+    qrels_index_to_dict,
+)
+from py_metrics.file_evaluator import evaluate_file_with_cache, evaluate_with_cache
+from py_metrics.qrels_cache import cache_stats, clear_cache, merge_cache_stats
 from py_metrics.calculate_metrics import (
     compute_classification_metrics,
     compute_bleu_score,
+    compute_text_metrics,
 )
 
+from py_metrics.jobs import job_manager
+from py_metrics.per_query_cache import per_query_cache
+from py_metrics.per_query_metrics import per_query_path_for
+from py_metrics.text_metrics import TEXT_METRICS
 from py_metrics.types.metrics import MetricsPayload
+from py_metrics.worker_pools import (
+    CPU_TASK_WORKERS,
+    cpu_pool,
+    io_pool,
+    pool_stats,
+    run_cpu,
+    run_io,
+    shutdown_pools,
+)
 
-app = FastAPI(title="BEIR API", description="API for working with BEIR datasets")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    shutdown_pools()
+    job_manager.shutdown()
+
+
+app = FastAPI(
+    title="BEIR API",
+    description="API for working with BEIR datasets",
+    lifespan=lifespan,
+)
 
 # Get BEIR data path from environment variable
 BEIR_DATA_ROOT_PATH = os.getenv("BEIR_DATA_ROOT_PATH", "./beir_data")
@@ -38,6 +85,31 @@ class EvaluationResults(BaseModel):
     metrics: Dict
     dataset_name: str
     error: Optional[str] = None
+    per_query_path: Optional[str] = None
+    # Per-shard timing of sharded evaluations
+    shards: Optional[List[Dict]] = None
+    # Per-query cache hits and misses of incremental evaluations
+    cache: Optional[Dict] = None
+    # Latency percentiles, QPS and error rate of results files with timings
+    latency: Optional[Dict] = None
+
+
+class BatchEvaluationRequest(BaseModel):
+    # Results files or glob patterns, e.g. "results/search_results_scifact_*.json"
+    file_paths: List[str]
+    k_values: Optional[List[int]] = None
+    engine: Literal["beir", "numpy"] = "beir"
+    # Leaderboard metric; NDCG at the largest k by default
+    sort_by: Optional[str] = None
+    # Save per-query metrics next to each results file
+    per_query: bool = False
+
+
+class BatchEvaluationResults(BaseModel):
+    dataset_name: str
+    leaderboard: List[Dict]
+    runs: Dict[str, Dict]
+    errors: Dict[str, str] = {}
 
 
 class SearchResults(BaseModel):
@@ -47,6 +119,184 @@ class SearchResults(BaseModel):
 class FilePathRequest(BaseModel):
     file_path: str
     k_values: Optional[List[int]] = None
+    engine: Literal["beir", "numpy"] = "beir"
+    # Save per-query metrics next to the results file (or to per_query_path)
+    per_query: bool = False
+    per_query_path: Optional[str] = None
+    # Parse and score the file incrementally; by default only large files are
+    stream: Optional[bool] = None
+    # Split the queries into this many shards, evaluated in parallel unless
+    # the server evaluates in processes already (see CPU_TASK_WORKERS)
+    shards: Optional[int] = Field(None, ge=1)
+    # Reuse cached per-query metrics of queries whose results did not change
+    incremental: bool = False
+
+    def resolved_per_query_path(self) -> Optional[str]:
+        if self.per_query_path is not None:
+            return self.per_query_path
+        if self.per_query:
+            return str(per_query_path_for(self.file_path))
+        return None
+
+
+def _read_json(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _read_qrels(qrels_path):
+    if qrels_path.suffix == ".npz":
+        return qrels_index_to_dict(load_qrels_index(qrels_path))
+    return _read_json(qrels_path)
+
+
+def _find_dataset_qrels(dataset_name):
+    """
+    Look for a dataset's qrels in the data root and the project root.
+
+    Returns:
+        Tuple of (qrels_path or None, list of directories tried)
+    """
+    possible_dirs = [
+        os.path.join(BEIR_DATA_ROOT_PATH, dataset_name),
+        # Path relative to the project root
+        os.path.join(
+            os.path.dirname(
+                os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+            ),
+            BEIR_DATA_ROOT_PATH,
+            dataset_name,
+        ),
+        # Direct path in project root
+        os.path.join("beir_data", dataset_name),
+    ]
+
+    for path in possible_dirs:
+        qrels_path = find_qrels_path(path)
+        if qrels_path is not None:
+            return qrels_path, possible_dirs
+    return None, possible_dirs
+
+
+def _download_job(dataset_name, legacy_json=False, progress=None):
+    result = download_beir_dataset(
+        dataset_name, legacy_json=legacy_json, progress=progress
+    )
+    return {
+        "dataset_name": dataset_name,
+        "corpus_path": result["corpus_path"],
+        "queries_path": result["queries_path"],
+        "qrels_path": result["qrels_path"],
+        "success": True,
+        "message": f"Dataset {dataset_name} downloaded and processed successfully",
+    }
+
+
+def _evaluate_file_job(
+    dataset_name,
+    file_path,
+    qrels_path,
+    k_values,
+    engine,
+    per_query_path=None,
+    stream=None,
+    shards=None,
+    incremental=False,
+    progress=None,
+):
+    shard_stats = []
+    cache_stats = {}
+    latency_stats = {}
+
+    def track(**fields):
+        # Keep the latest per-shard, cache and latency stats for the response
+        if "shards" in fields:
+            shard_stats[:] = fields["shards"]
+        if "cache" in fields:
+            cache_stats.update(fields["cache"])
+        if "latency" in fields:
+            latency_stats.update(fields["latency"])
+        if progress is not None:
+            progress(**fields)
+
+    metrics = evaluate_file_with_cache(
+        file_path,
+        qrels_path,
+        k_values,
+        engine=engine,
+        progress=track,
+        per_query_path=per_query_path,
+        stream=stream,
+        shards=shards,
+        incremental=incremental,
+        workers=CPU_TASK_WORKERS,
+    )
+    response = {"metrics": format_metrics(metrics), "dataset_name": dataset_name}
+    if per_query_path is not None and os.path.exists(per_query_path):
+        response["per_query_path"] = per_query_path
+    if shard_stats:
+        response["shards"] = shard_stats
+    if cache_stats:
+        response["cache"] = cache_stats
+    if latency_stats:
+        response["latency"] = latency_stats
+    return response
+
+
+def _evaluate_batch_job(
+    dataset_name,
+    file_paths,
+    qrels_path,
+    k_values,
+    engine,
+    sort_by=None,
+    per_query=False,
+    progress=None,
+):
+    batch = evaluate_batch(
+        file_paths,
+        qrels_path,
+        k_values,
+        engine=engine,
+        sort_by=sort_by,
+        progress=progress,
+        per_query=per_query,
+        workers=CPU_TASK_WORKERS,
+    )
+    runs = {
+        path: {"metrics": format_metrics(run["metrics"]), **run["stats"]}
+        for path, run in batch["runs"].items()
+    }
+    return {
+        "dataset_name": dataset_name,
+        "leaderboard": batch["leaderboard"],
+        "runs": runs,
+        "errors": batch["errors"],
+    }
+
+
+def _batch_job_args(dataset_name, request: BatchEvaluationRequest):
+    """Validate a batch request and build the arguments of _evaluate_batch_job"""
+    k_values = request.k_values or [1, 3, 5, 10]
+    if request.sort_by is not None and request.sort_by not in metric_labels(k_values):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cannot sort by {request.sort_by}, expected one of "
+            f"{metric_labels(k_values)}",
+        )
+    qrels_path, _ = _find_dataset_qrels(dataset_name)
+    if qrels_path is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Qrels for dataset {dataset_name} not found. Please download it first.",
+        )
+    return (
+        dataset_name,
+        request.file_paths,
+        str(qrels_path),
+        k_values,
+        request.engine,
+    ), {"sort_by": request.sort_by, "per_query": request.per_query}
 
 
 @app.get("/")
@@ -54,19 +304,17 @@ async def root():
     return {"message": "BEIR Dataset API is running"}
 
 
+@app.get("/worker-pools")
+async def get_worker_pool_stats():
+    """Get concurrency limits and queue depth of the evaluation and I/O pools"""
+    return pool_stats()
+
+
 @app.post("/beir/download/{dataset_name}", response_model=DownloadResponse)
-async def download_dataset(dataset_name: str):
+async def download_dataset(dataset_name: str, legacy_json: bool = False):
     """Download and process a BEIR dataset"""
     try:
-        result = download_beir_dataset(dataset_name)
-        return {
-            "dataset_name": dataset_name,
-            "corpus_path": result["corpus_path"],
-            "queries_path": result["queries_path"],
-            "qrels_path": result["qrels_path"],
-            "success": True,
-            "message": f"Dataset {dataset_name} downloaded and processed successfully",
-        }
+        return await run_io(_download_job, dataset_name, legacy_json=legacy_json)
     except Exception as e:
         # Log the error but don't expose detailed exception to client
         import logging
@@ -78,21 +326,63 @@ async def download_dataset(dataset_name: str):
 
 
 @app.get("/beir/corpus/{dataset_name}")
-async def get_corpus(dataset_name: str):
-    """Get the corpus for a BEIR dataset"""
+async def get_corpus(
+    dataset_name: str,
+    request: Request,
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    format: Optional[Literal["json", "ndjson"]] = None,
+):
+    """
+    Get the corpus for a BEIR dataset
+
+    Without pagination parameters the whole corpus is streamed as a
+    {doc_id: doc} object. With offset/limit/cursor a single page is returned
+    as {"documents": [...], "next_cursor": ...}. NDJSON output (format=ndjson
+    or an application/x-ndjson Accept header) streams one document per line,
+    with the next page cursor in the X-Next-Cursor header when limit is set.
+    """
     data_dir = Path(BEIR_DATA_ROOT_PATH) / dataset_name
-    corpus_path = data_dir / "corpus.json"
 
-    if not corpus_path.exists():
+    if not corpus_exists(data_dir):
         raise HTTPException(
             status_code=404,
             detail=f"Corpus for dataset {dataset_name} not found. Please download it first.",
         )
 
+    if cursor is not None:
+        try:
+            decode_cursor(cursor)
+        except InvalidCursorError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    ndjson = format == "ndjson" or (
+        format is None and NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+    )
+    paged = limit is not None or offset > 0 or cursor is not None
+
     try:
-        with open(corpus_path, "r") as f:
-            corpus = json.load(f)
-        return corpus
+        if ndjson and limit is None:
+            return StreamingResponse(
+                stream_corpus_ndjson(data_dir, offset=offset, cursor=cursor),
+                media_type=NDJSON_MEDIA_TYPE,
+            )
+        if not paged:
+            return StreamingResponse(
+                stream_corpus_json(data_dir), media_type="application/json"
+            )
+
+        documents, next_cursor = await run_io(
+            read_corpus_page, data_dir, offset=offset, limit=limit, cursor=cursor
+        )
+        if ndjson:
+            body = "".join(json.dumps(doc) + "\n" for doc in documents)
+            headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+            return Response(body, media_type=NDJSON_MEDIA_TYPE, headers=headers)
+        return {"documents": documents, "next_cursor": next_cursor}
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -100,22 +390,70 @@ async def get_corpus(dataset_name: str):
         )
 
 
+@app.get("/beir/corpus/{dataset_name}/count")
+async def get_corpus_count(dataset_name: str):
+    """Get the number of documents in the corpus for a BEIR dataset"""
+    data_dir = Path(BEIR_DATA_ROOT_PATH) / dataset_name
+
+    if not corpus_exists(data_dir):
+        raise HTTPException(
+            status_code=404,
+            detail=f"Corpus for dataset {dataset_name} not found. Please download it first.",
+        )
+
+    try:
+        count = await run_io(count_corpus, data_dir)
+        return {"dataset_name": dataset_name, "count": count}
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error reading corpus file: {str(e)[:200]}",
+        )
+
+
+@app.get("/beir/corpus/{dataset_name}/docs/{doc_id}")
+async def get_corpus_document(dataset_name: str, doc_id: str):
+    """Get a single corpus document by id"""
+    data_dir = Path(BEIR_DATA_ROOT_PATH) / dataset_name
+
+    if not corpus_exists(data_dir):
+        raise HTTPException(
+            status_code=404,
+            detail=f"Corpus for dataset {dataset_name} not found. Please download it first.",
+        )
+
+    try:
+        doc = await run_io(get_corpus_doc, data_dir, doc_id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error reading corpus file: {str(e)[:200]}",
+        )
+    if doc is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Document {doc_id} not found in corpus for {dataset_name}",
+        )
+    return doc
+
+
 @app.get("/beir/queries/{dataset_name}")
 async def get_queries(dataset_name: str):
     """Get the queries for a BEIR dataset"""
     data_dir = Path(BEIR_DATA_ROOT_PATH) / dataset_name
     queries_path = data_dir / "queries.json"
+    store = DatasetStore(data_dir)
 
-    if not queries_path.exists():
+    if not queries_path.exists() and not store.has_table("queries"):
         raise HTTPException(
             status_code=404,
             detail=f"Queries for dataset {dataset_name} not found. Please download it first.",
         )
 
     try:
-        with open(queries_path, "r") as f:
-            queries = json.load(f)
-        return queries
+        if not queries_path.exists():
+            return await run_io(store.load_dict, "queries")
+        return await run_io(_read_json, queries_path)
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -127,18 +465,16 @@ async def get_queries(dataset_name: str):
 async def get_qrels(dataset_name: str):
     """Get the qrels for a BEIR dataset"""
     data_dir = Path(BEIR_DATA_ROOT_PATH) / dataset_name
-    qrels_path = data_dir / "qrels.json"
+    qrels_path = find_qrels_path(data_dir)
 
-    if not qrels_path.exists():
+    if qrels_path is None:
         raise HTTPException(
             status_code=404,
             detail=f"Qrels for dataset {dataset_name} not found. Please download it first.",
         )
 
     try:
-        with open(qrels_path, "r") as f:
-            qrels = json.load(f)
-        return qrels
+        return await run_io(_read_qrels, qrels_path)
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -151,12 +487,13 @@ async def evaluate_results(
     dataset_name: str,
     search_results: SearchResults,
     k_values: Optional[List[int]] = None,
+    engine: Literal["beir", "numpy"] = "beir",
 ):
     """Evaluate search results for a BEIR dataset"""
     data_dir = Path(BEIR_DATA_ROOT_PATH) / dataset_name
-    qrels_path = data_dir / "qrels.json"
+    qrels_path = find_qrels_path(data_dir)
 
-    if not qrels_path.exists():
+    if qrels_path is None:
         import logging
 
         error_msg = f"Qrels file not found for {dataset_name}"
@@ -170,8 +507,12 @@ async def evaluate_results(
 
     try:
         # Evaluate the results
-        metrics = evaluate_beir_results(
-            search_results.results, qrels_path=str(qrels_path), k_values=k_values
+        metrics = await run_cpu(
+            evaluate_with_cache,
+            search_results.results,
+            qrels_path=str(qrels_path),
+            k_values=k_values,
+            engine=engine,
         )
 
         # Format metrics for better readability
@@ -203,6 +544,36 @@ async def get_available_datasets():
     return {"available_datasets": datasets}
 
 
+@app.get("/beir/qrels-cache")
+async def get_qrels_cache_stats():
+    """
+    Get hit/miss counters and memory usage of the qrels caches of the server
+    and every evaluation worker process
+    """
+    worker_stats = await run_io(cpu_pool.broadcast, cache_stats)
+    return merge_cache_stats([cache_stats(), *worker_stats])
+
+
+@app.delete("/beir/qrels-cache")
+async def clear_qrels_cache():
+    """Drop every cached qrels entry, in the server and every evaluation worker"""
+    worker_stats = await run_io(cpu_pool.broadcast, clear_cache)
+    return merge_cache_stats([clear_cache(), *worker_stats])
+
+
+@app.get("/beir/eval-cache")
+async def get_eval_cache_stats():
+    """Entries and size of the on-disk per-query metrics cache"""
+    return await run_io(per_query_cache.stats)
+
+
+@app.delete("/beir/eval-cache")
+async def clear_eval_cache():
+    """Drop every cached per-query metric row"""
+    await run_io(per_query_cache.clear)
+    return await run_io(per_query_cache.stats)
+
+
 @app.post("/calculate_metrics", response_model=Dict[str, float])
 async def calculate_metrics_endpoint(payload: MetricsPayload):
     # Just log the data
@@ -213,18 +584,38 @@ async def calculate_metrics_endpoint(payload: MetricsPayload):
 
     if "bleu" in metrics_requested and payload.bleu_data:
         try:
-            results["bleu"] = compute_bleu_score(payload.bleu_data)
+            results["bleu"] = await run_cpu(
+                compute_bleu_score, payload.bleu_data, CPU_TASK_WORKERS
+            )
         except ValueError as e:
             raise HTTPException(status_code=400, detail=str(e))
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error calculating BLEU: {e}")
 
+    text_metrics_needed = metrics_requested.intersection(TEXT_METRICS)
+    if text_metrics_needed and payload.text_data:
+        try:
+            results.update(
+                await run_cpu(
+                    compute_text_metrics,
+                    payload.text_data,
+                    sorted(text_metrics_needed),
+                )
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            raise HTTPException(
+                status_code=500, detail=f"Error calculating text metrics: {e}"
+            )
+
     classification_metrics_needed = metrics_requested.intersection(
         {"f1", "recall", "precision"}
     )
     if classification_metrics_needed and payload.classification_data:
         try:
-            classification_results = compute_classification_metrics(
+            classification_results = await run_cpu(
+                compute_classification_metrics,
                 payload.classification_data,
                 list(classification_metrics_needed),
             )
@@ -265,8 +656,7 @@ async def calculate_metrics_from_file(
 
     try:
         # Load search results from file
-        with open(file_path, "r") as f:
-            saved_results = json.load(f)
+        saved_results = await run_io(_read_json, file_path)
 
         # Process the metrics calculation
         results = {}
@@ -274,7 +664,9 @@ async def calculate_metrics_from_file(
 
         if "bleu" in metrics_requested and metrics_payload.bleu_data:
             try:
-                results["bleu"] = compute_bleu_score(metrics_payload.bleu_data)
+                results["bleu"] = await run_cpu(
+                    compute_bleu_score, metrics_payload.bleu_data, CPU_TASK_WORKERS
+                )
             except ValueError as e:
                 raise HTTPException(status_code=400, detail=str(e))
             except Exception as e:
@@ -282,12 +674,30 @@ async def calculate_metrics_from_file(
                     status_code=500, detail=f"Error calculating BLEU: {e}"
                 )
 
+        text_metrics_needed = metrics_requested.intersection(TEXT_METRICS)
+        if text_metrics_needed and metrics_payload.text_data:
+            try:
+                results.update(
+                    await run_cpu(
+                        compute_text_metrics,
+                        metrics_payload.text_data,
+                        sorted(text_metrics_needed),
+                    )
+                )
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            except Exception as e:
+                raise HTTPException(
+                    status_code=500, detail=f"Error calculating text metrics: {e}"
+                )
+
         classification_metrics_needed = metrics_requested.intersection(
             {"f1", "recall", "precision"}
         )
         if classification_metrics_needed and metrics_payload.classification_data:
             try:
-                classification_results = compute_classification_metrics(
+                classification_results = await run_cpu(
+                    compute_classification_metrics,
                     metrics_payload.classification_data,
                     list(classification_metrics_needed),
                 )
@@ -330,33 +740,13 @@ async def evaluate_results_from_file(dataset_name: str, request: FilePathRequest
             detail=f"Results file not found at path: {file_path}",
         )
 
-    possible_paths = [
-        os.path.join(BEIR_DATA_ROOT_PATH, dataset_name, "qrels.json"),
-        # Path relative to the project root
-        os.path.join(
-            os.path.dirname(
-                os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-            ),
-            BEIR_DATA_ROOT_PATH,
-            dataset_name,
-            "qrels.json",
-        ),
-        # Direct path in project root
-        os.path.join("beir_data", dataset_name, "qrels.json"),
-    ]
-
-    qrels_path = None
-    for path in possible_paths:
-        if os.path.exists(path):
-            qrels_path = path
-            break
-
+    qrels_path, possible_dirs = _find_dataset_qrels(dataset_name)
     print("qrels_path", qrels_path)
 
     if not qrels_path:
         import logging
 
-        paths_tried = "\n".join(possible_paths)
+        paths_tried = "\n".join(possible_dirs)
         error_msg = f"Qrels file not found for {dataset_name}. Tried:\n{paths_tried}"
         logging.warning(error_msg)
         empty_metrics = format_metrics(create_empty_metrics(k_values))
@@ -367,29 +757,19 @@ async def evaluate_results_from_file(dataset_name: str, request: FilePathRequest
         }
 
     try:
-        # Load the results from the file
-        with open(file_path, "r") as f:
-            file_content = json.load(f)
-
-        # Extract the results - handle different possible formats
-        search_results = {}
-        if "results" in file_content and isinstance(file_content["results"], dict):
-            search_results = file_content["results"]
-        elif isinstance(file_content, dict) and all(
-            isinstance(v, dict) for v in file_content.values()
-        ):
-            # Assume the file itself is the results dictionary
-            search_results = file_content
-
-        # Evaluate the results
-        metrics = evaluate_beir_results(
-            search_results, qrels_path=str(qrels_path), k_values=k_values
+        # Load, evaluate and format the results in an evaluation worker
+        return await run_cpu(
+            _evaluate_file_job,
+            dataset_name,
+            file_path,
+            str(qrels_path),
+            k_values,
+            request.engine,
+            per_query_path=request.resolved_per_query_path(),
+            stream=request.stream,
+            shards=request.shards,
+            incremental=request.incremental,
         )
-
-        # Format metrics for better readability
-        formatted_metrics = format_metrics(metrics)
-
-        return {"metrics": formatted_metrics, "dataset_name": dataset_name}
     except json.JSONDecodeError as e:
         error_msg = f"Invalid JSON format in results file: {str(e)}"
         empty_metrics = format_metrics(create_empty_metrics(k_values))
@@ -411,6 +791,151 @@ async def evaluate_results_from_file(dataset_name: str, request: FilePathRequest
         }
 
 
+@app.post("/jobs/download/{dataset_name}", status_code=202)
+async def submit_download_job(dataset_name: str, legacy_json: bool = False):
+    """
+    Download and process a BEIR dataset in the background
+
+    Returns the job immediately; concurrent requests for the same download
+    share one job.
+    """
+    job, deduplicated = job_manager.submit(
+        "download",
+        {"dataset_name": dataset_name, "legacy_json": legacy_json},
+        io_pool,
+        _download_job,
+        dataset_name,
+        legacy_json=legacy_json,
+    )
+    return {**job.to_dict(), "deduplicated": deduplicated}
+
+
+@app.post("/jobs/evaluate-from-file/{dataset_name}", status_code=202)
+async def submit_evaluation_job(dataset_name: str, request: FilePathRequest):
+    """Evaluate search results from a saved file in the background"""
+    k_values = request.k_values or [1, 3, 5, 10]
+
+    if not os.path.exists(request.file_path):
+        raise HTTPException(
+            status_code=404,
+            detail=f"Results file not found at path: {request.file_path}",
+        )
+
+    qrels_path, _ = _find_dataset_qrels(dataset_name)
+    if qrels_path is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Qrels for dataset {dataset_name} not found. Please download it first.",
+        )
+
+    job, deduplicated = job_manager.submit(
+        "evaluate",
+        {
+            "dataset_name": dataset_name,
+            "file_path": request.file_path,
+            "k_values": k_values,
+            "engine": request.engine,
+            "per_query_path": request.resolved_per_query_path(),
+            "stream": request.stream,
+            "shards": request.shards,
+            "incremental": request.incremental,
+        },
+        cpu_pool,
+        _evaluate_file_job,
+        dataset_name,
+        request.file_path,
+        str(qrels_path),
+        k_values,
+        request.engine,
+        per_query_path=request.resolved_per_query_path(),
+        stream=request.stream,
+        shards=request.shards,
+        incremental=request.incremental,
+    )
+    return {**job.to_dict(), "deduplicated": deduplicated}
+
+
+@app.post("/beir/evaluate-batch/{dataset_name}", response_model=BatchEvaluationResults)
+async def evaluate_batch_from_files(dataset_name: str, request: BatchEvaluationRequest):
+    """
+    Evaluate many saved results files against one dataset
+
+    Qrels are loaded once and the runs are evaluated in parallel; the
+    response ranks them in a leaderboard. Files that fail are listed under
+    errors.
+    """
+    args, kwargs = _batch_job_args(dataset_name, request)
+    try:
+        return await run_cpu(_evaluate_batch_job, *args, **kwargs)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Error evaluating results files: {str(e)}"
+        )
+
+
+@app.post("/jobs/evaluate-batch/{dataset_name}", status_code=202)
+async def submit_batch_evaluation_job(
+    dataset_name: str, request: BatchEvaluationRequest
+):
+    """Evaluate many saved results files in the background"""
+    args, kwargs = _batch_job_args(dataset_name, request)
+    job, deduplicated = job_manager.submit(
+        "evaluate-batch",
+        {
+            "dataset_name": dataset_name,
+            "file_paths": request.file_paths,
+            "k_values": args[3],
+            "engine": request.engine,
+            **kwargs,
+        },
+        cpu_pool,
+        _evaluate_batch_job,
+        *args,
+        **kwargs,
+    )
+    return {**job.to_dict(), "deduplicated": deduplicated}
+
+
+@app.get("/jobs")
+async def list_jobs():
+    """List background jobs, oldest first"""
+    return {"jobs": [job.to_dict() for job in job_manager.list()]}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get the status and progress of a background job"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job.to_dict()
+
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """Get the result of a finished background job"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=f"Job failed: {job.error}")
+    if job.status != "succeeded":
+        raise HTTPException(
+            status_code=409,
+            detail=f"Job {job_id} is {job.to_dict()['status']}, no result available",
+        )
+    return job.result
+
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running background job"""
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job.to_dict()
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -0,0 +1,513 @@
+"""
+Local stand-in for the Supermemory API, with latency and fault injection.
+
+End-to-end runs of load-beir.ts, search-file-eval.ts and delete-memories.ts
+otherwise need the live API, so neither the harness nor the clients can be
+benchmarked offline or in CI. This server implements the endpoints they use:
+
+- POST /add: {"content", "userId", "metadata"} -> {"id", "status"}
+- POST /search: {"q", "limit", "userId"} -> {"results", "total", "timing"}
+- DELETE /delete/{id}
+- GET /memories?page=&limit=: {"memories": [...], "pagination": {...}}
+
+Memories are kept in a SQLite database, in memory by default or on disk
+(MEMORY_SERVER_DB), and searched with its FTS5 full-text index ranked by
+BM25. The "filter" of search requests is accepted but not applied.
+
+Each operation has a FaultProfile: a latency distribution, the rates of
+injected 500 and 429 responses, a throughput cap (requests beyond max_qps
+get a 429 with Retry-After) and a concurrency cap (requests beyond
+max_concurrency queue). Random draws come from one generator seeded by the
+config, so a run with the same requests in the same order sees the same
+latencies and faults. The profiles can be replaced at runtime through
+PUT /admin/faults; GET /admin/stats counts responses per operation.
+
+Run with:
+    python -m py_metrics.memory_server --port 8100 --latency lognormal:40,0.5
+and point SUPERMEMORY_API_URL at http://127.0.0.1:8100 (no trailing slash).
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from fastapi import Depends, FastAPI, Header, HTTPException, Query
+from pydantic import BaseModel, Field, field_validator
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# SQLite database holding the memories; ":memory:" keeps them in the process
+MEMORY_SERVER_DB = os.getenv("MEMORY_SERVER_DB", ":memory:")
+# JSON file with the initial FaultConfig
+MEMORY_SERVER_FAULTS = os.getenv("MEMORY_SERVER_FAULTS")
+# When set, requests must send this value in the x-api-key header
+MEMORY_SERVER_API_KEY = os.getenv("MEMORY_SERVER_API_KEY")
+OPERATIONS = ("add", "search", "delete", "list")
+LATENCY_DISTRIBUTIONS = {
+    # name: number of parameters
+    "fixed": 1,
+    "uniform": 2,
+    "normal": 2,
+    "lognormal": 2,
+    "exponential": 1,
+}
+
+
+def parse_latency(spec):
+    """
+    Parse a latency distribution into a sampler.
+
+    Args:
+        spec: "fixed:MS", "uniform:LOW_MS,HIGH_MS", "normal:MEAN_MS,STD_MS",
+            "lognormal:MEDIAN_MS,SIGMA" or "exponential:MEAN_MS"
+
+    Returns:
+        Function of a random.Random returning a latency in seconds
+    """
+    name, _, params = spec.partition(":")
+    if name not in LATENCY_DISTRIBUTIONS:
+        raise ValueError(
+            f"Unknown latency distribution '{name}', expected one of "
+            f"{list(LATENCY_DISTRIBUTIONS)}"
+        )
+    try:
+        values = [float(value) for value in params.split(",")] if params else []
+    except ValueError:
+        raise ValueError(f"Invalid latency parameters in '{spec}'")
+    if len(values) != LATENCY_DISTRIBUTIONS[name] or any(v < 0 for v in values):
+        raise ValueError(
+            f"'{name}' latency takes {LATENCY_DISTRIBUTIONS[name]} "
+            f"non-negative parameter(s), got '{spec}'"
+        )
+
+    if name == "fixed":
+        return lambda rng: values[0] / 1000
+    if name == "uniform":
+        low, high = sorted(values)
+        return lambda rng: rng.uniform(low, high) / 1000
+    if name == "normal":
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1])) / 1000
+    if name == "lognormal":
+        mu = math.log(max(values[0], 1e-9))
+        return lambda rng: rng.lognormvariate(mu, values[1]) / 1000
+    return lambda rng: (rng.expovariate(1 / values[0]) if values[0] else 0.0) / 1000
+
+
+class FaultProfile(BaseModel):
+    # Latency distribution, see parse_latency
+    latency: str = "fixed:0"
+    # Fraction of requests answered with a 500 after their latency
+    error_rate: float = Field(0.0, ge=0, le=1)
+    # Fraction of requests rejected at once with a 429
+    rate_limit_rate: float = Field(0.0, ge=0, le=1)
+    # Requests per second accepted; further requests get a 429
+    max_qps: Optional[float] = Field(None, gt=0)
+    # Requests processed at once; further requests queue
+    max_concurrency: Optional[int] = Field(None, ge=1)
+
+    @field_validator("latency")
+    @classmethod
+    def check_latency(cls, spec):
+        parse_latency(spec)
+        return spec
+
+
+class FaultConfig(BaseModel):
+    add: FaultProfile = FaultProfile()
+    search: FaultProfile = FaultProfile()
+    delete: FaultProfile = FaultProfile()
+    list: FaultProfile = FaultProfile()
+    # Seed of the latency and fault draws; None draws differently every run
+    seed: Optional[int] = None
+
+
+class AddMemoryRequest(BaseModel):
+    content: str
+    userId: Optional[str] = None
+    metadata: Optional[Dict] = None
+
+
+class SearchRequest(BaseModel):
+    q: str
+    limit: int = Field(10, ge=1, le=1000)
+    filter: Optional[Dict] = None
+    userId: Optional[str] = None
+
+
+class MemoryIndex:
+    """
+    Memories in a SQLite table with an FTS5 full-text index.
+
+    One connection is shared by all threads behind a lock; SQLite serializes
+    writes anyway, and the server runs operations off the event loop.
+    """
+
+    def __init__(self, path=MEMORY_SERVER_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS memories (id TEXT PRIMARY KEY, "
+                "user_id TEXT, content TEXT NOT NULL, metadata TEXT, "
+                "created_at TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS memories_fts USING fts5(content)"
+            )
+
+    def add(self, content, user_id=None, metadata=None):
+        """Store a memory and return its id"""
+        memory_id = uuid.uuid4().hex
+        created_at = datetime.now(timezone.utc).isoformat()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO memories VALUES (?, ?, ?, ?, ?)",
+                (memory_id, user_id, content, json.dumps(metadata or {}), created_at),
+            )
+            self._conn.execute(
+                "INSERT INTO memories_fts (rowid, content) VALUES (?, ?)",
+                (cursor.lastrowid, content),
+            )
+        return memory_id
+
+    def search(self, q, limit, user_id=None):
+        """
+        Memories matching any term of q, best BM25 score first.
+
+        Returns:
+            List of Supermemory search results
+        """
+        terms = re.findall(r"\w+", q.lower())
+        if not terms:
+            return []
+        match = " OR ".join(f'"{term}"' for term in dict.fromkeys(terms))
+        sql = (
+            "SELECT m.id, m.content, m.metadata, m.created_at, "
+            "-bm25(memories_fts) AS score FROM memories_fts "
+            "JOIN memories m ON m.rowid = memories_fts.rowid "
+            "WHERE memories_fts MATCH ?"
+        )
+        params = [match]
+        if user_id is not None:
+            sql += " AND m.user_id = ?"
+            params.append(user_id)
+        sql += " ORDER BY bm25(memories_fts) LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+
+        results = []
+        for memory_id, content, metadata, created_at, score in rows:
+            metadata = json.loads(metadata)
+            score = round(score, 6)
+            results.append(
+                {
+                    "documentId": memory_id,
+                    "chunks": [
+                        {"content": content, "isRelevant": True, "score": score}
+                    ],
+                    "metadata": metadata,
+                    "score": score,
+                    "title": metadata.get("title"),
+                    "createdAt": created_at,
+                    "updatedAt": created_at,
+                }
+            )
+        return results
+
+    def delete(self, memory_id):
+        """Delete a memory; False if there is none with this id"""
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT rowid FROM memories WHERE id = ?", (memory_id,)
+            ).fetchone()
+            if row is None:
+                return False
+            self._conn.execute("DELETE FROM memories WHERE rowid = ?", row)
+            self._conn.execute("DELETE FROM memories_fts WHERE rowid = ?", row)
+        return True
+
+    def list(self, page, limit):
+        """
+        One page of memories in insertion order.
+
+        Returns:
+            Tuple of (memories, total number of memories)
+        """
+        with self._lock:
+            (total,) = self._conn.execute("SELECT COUNT(*) FROM memories").fetchone()
+            rows = self._conn.execute(
+                "SELECT id, user_id, content, metadata, created_at FROM memories "
+                "ORDER BY rowid LIMIT ? OFFSET ?",
+                (limit, (page - 1) * limit),
+            ).fetchall()
+        memories = [
+            {
+                "id": memory_id,
+                "userId": user_id,
+                "content": content,
+                "metadata": json.loads(metadata),
+                "createdAt": created_at,
+                "updatedAt": created_at,
+            }
+            for memory_id, user_id, content, metadata, created_at in rows
+        ]
+        return memories, total
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM memories").fetchone()[0]
+
+
+class TokenBucket:
+    """Admits rate requests per second, with bursts of up to one second's worth"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.capacity = max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def take(self):
+        """Take a token; returns 0 or the seconds until one is available"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class FaultInjector:
+    """Applies a FaultConfig to the operations and counts their responses"""
+
+    def __init__(self, config=None):
+        self.stats = {op: Counter() for op in OPERATIONS}
+        self.configure(config or FaultConfig())
+
+    def configure(self, config):
+        """Replace the fault profiles, resetting the limits and the seed"""
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self._latency = {
+            op: parse_latency(getattr(config, op).latency) for op in OPERATIONS
+        }
+        self._buckets = {
+            op: TokenBucket(getattr(config, op).max_qps)
+            for op in OPERATIONS
+            if getattr(config, op).max_qps
+        }
+        self._semaphores = {
+            op: asyncio.Semaphore(getattr(config, op).max_concurrency)
+            for op in OPERATIONS
+            if getattr(config, op).max_concurrency
+        }
+
+    async def run(self, op, work, *args):
+        """
+        Run work(*args) in a thread, after the injected delay and faults.
+
+        Raises:
+            HTTPException: 429 when rate limited, 500 for injected errors
+        """
+        profile = getattr(self.config, op)
+        # Draw everything up front so the sequence of draws, and hence every
+        # decision, only depends on the seed and the order of requests
+        limited = self.rng.random() < profile.rate_limit_rate
+        delay = self._latency[op](self.rng)
+        failed = self.rng.random() < profile.error_rate
+
+        bucket = self._buckets.get(op)
+        wait = bucket.take() if bucket is not None else 0.0
+        if wait or limited:
+            self.stats[op]["429"] += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests",
+                headers={"Retry-After": str(max(1, math.ceil(wait)))},
+            )
+
+        semaphore = self._semaphores.get(op)
+        if semaphore is not None:
+            await semaphore.acquire()
+        try:
+            await asyncio.sleep(delay)
+            if failed:
+                self.stats[op]["500"] += 1
+                raise HTTPException(status_code=500, detail="Injected server error")
+            result = await asyncio.to_thread(work, *args)
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+        self.stats[op]["200"] += 1
+        return result
+
+
+def load_fault_config(path):
+    """Read a FaultConfig from a JSON file"""
+    with open(path, "r") as f:
+        return FaultConfig(**json.load(f))
+
+
+def create_app(index=None, faults=None, api_key=MEMORY_SERVER_API_KEY):
+    """
+    Build the stand-in server.
+
+    Args:
+        index: MemoryIndex (default one at MEMORY_SERVER_DB)
+        faults: FaultConfig (default from MEMORY_SERVER_FAULTS, else none)
+        api_key: Required x-api-key value, or None to accept any request
+    """
+    index = index or MemoryIndex()
+    if faults is None and MEMORY_SERVER_FAULTS:
+        faults = load_fault_config(MEMORY_SERVER_FAULTS)
+    injector = FaultInjector(faults)
+
+    def check_api_key(x_api_key: Optional[str] = Header(None)):
+        if api_key is not None and x_api_key != api_key:
+            raise HTTPException(status_code=401, detail="Invalid API key")
+
+    app = FastAPI(
+        title="Supermemory stand-in",
+        description="Local Supermemory-compatible API with fault injection",
+        dependencies=[Depends(check_api_key)],
+    )
+    app.state.index = index
+    app.state.faults = injector
+
+    @app.post("/add")
+    async def add_memory(request: AddMemoryRequest):
+        memory_id = await injector.run(
+            "add", index.add, request.content, request.userId, request.metadata
+        )
+        return {"id": memory_id, "status": "done"}
+
+    @app.post("/search")
+    async def search_memories(request: SearchRequest):
+        started = time.perf_counter()
+        results = await injector.run(
+            "search", index.search, request.q, request.limit, request.userId
+        )
+        return {
+            "results": results,
+            "total": len(results),
+            "timing": round((time.perf_counter() - started) * 1000, 3),
+        }
+
+    @app.delete("/delete/{memory_id}")
+    async def delete_memory(memory_id: str):
+        if not await injector.run("delete", index.delete, memory_id):
+            raise HTTPException(status_code=404, detail="Memory not found")
+        return {"success": True, "id": memory_id}
+
+    @app.get("/memories")
+    async def list_memories(
+        page: int = Query(1, ge=1), limit: int = Query(10, ge=1, le=1000)
+    ):
+        memories, total = await injector.run("list", index.list, page, limit)
+        return {
+            "memories": memories,
+            "pagination": {
+                "currentPage": page,
+                "limit": limit,
+                "totalItems": total,
+                "totalPages": math.ceil(total / limit),
+            },
+        }
+
+    @app.get("/admin/faults")
+    async def get_faults():
+        return injector.config
+
+    @app.put("/admin/faults")
+    async def set_faults(config: FaultConfig):
+        injector.configure(config)
+        return injector.config
+
+    @app.get("/admin/stats")
+    async def get_stats():
+        return {
+            "memories": await asyncio.to_thread(index.count),
+            "responses": {op: dict(counts) for op, counts in injector.stats.items()},
+        }
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run a local Supermemory-compatible server with fault injection"
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Bind address")
+    parser.add_argument("--port", type=int, default=8100, help="Port")
+    parser.add_argument(
+        "--db",
+        default=MEMORY_SERVER_DB,
+        help="SQLite database for the memories (default: in memory)",
+    )
+    parser.add_argument(
+        "--faults",
+        default=MEMORY_SERVER_FAULTS,
+        help="JSON file with per-operation fault profiles",
+    )
+    parser.add_argument(
+        "--latency", help="Latency of every operation, e.g. lognormal:40,0.5"
+    )
+    parser.add_argument("--error-rate", type=float, help="Fraction of 500 responses")
+    parser.add_argument(
+        "--rate-limit-rate", type=float, help="Fraction of 429 responses"
+    )
+    parser.add_argument(
+        "--max-qps", type=float, help="Requests per second per operation"
+    )
+    parser.add_argument(
+        "--max-concurrency", type=int, help="Requests processed at once per operation"
+    )
+    parser.add_argument("--seed", type=int, help="Seed of the latency and fault draws")
+    args = parser.parse_args()
+
+    config = load_fault_config(args.faults) if args.faults else FaultConfig()
+    # Command-line options override the file for every operation
+    overrides = {
+        "latency": args.latency,
+        "error_rate": args.error_rate,
+        "rate_limit_rate": args.rate_limit_rate,
+        "max_qps": args.max_qps,
+        "max_concurrency": args.max_concurrency,
+    }
+    overrides = {key: value for key, value in overrides.items() if value is not None}
+    config = FaultConfig(
+        **{
+            op: FaultProfile(**{**getattr(config, op).model_dump(), **overrides})
+            for op in OPERATIONS
+        },
+        seed=args.seed if args.seed is not None else config.seed,
+    )
+
+    import uvicorn
+
+    logger.info(f"Serving memories from {args.db} on {args.host}:{args.port}")
+    uvicorn.run(
+        create_app(MemoryIndex(args.db), config), host=args.host, port=args.port
+    )
+
+
+if __name__ == "__main__":
+    main()
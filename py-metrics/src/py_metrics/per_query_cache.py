@@ -0,0 +1,368 @@
+"""
+Incremental evaluation backed by an on-disk cache of per-query metrics.
+
+Re-running search after a small change usually leaves most rankings
+unchanged, yet a plain evaluation scores every query again. Here each query
+is keyed by a hash of everything its metrics depend on:
+
+- the engine and the k values,
+- the query id and its retrieved documents with their scores, as given,
+  which determine the ranking,
+- the query's judged documents and their grades.
+
+A changed ranking or a changed judgment for the query therefore changes
+the key, while queries whose inputs did not change hit the cache, even
+after unrelated qrels edits. Hashing the raw inputs keeps lookups cheaper
+than ranking. Only the misses are ranked and scored, with either engine,
+and the hits and fresh rows are averaged together, in query order, exactly
+as a full evaluation would.
+
+The cache is a SQLite database (EVAL_CACHE_PATH) mapping keys to the
+float64 metric rows, or to an empty row for queries the engine does not
+score, so those hit the cache too. WAL mode lets several evaluation
+processes share it.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+import numpy as np
+
+from py_metrics.beir_evaluator import ENGINES, create_empty_metrics, normalize_results
+from py_metrics.dataset_store import read_qrels_index
+from py_metrics.fast_evaluator import (
+    METRIC_PREFIXES,
+    PerQueryMetrics,
+    aggregate_metrics,
+    build_run_arrays,
+    score_run,
+)
+from py_metrics.per_query_metrics import evaluate_pytrec
+from py_metrics.sharded_evaluator import qrels_subset
+from py_metrics.streaming_evaluator import STREAM_BATCH_QUERIES, iter_result_batches
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# SQLite database holding the cached per-query metrics
+EVAL_CACHE_PATH = os.getenv("EVAL_CACHE_PATH", "./.cache/per_query_metrics.sqlite")
+# Bump to invalidate every entry when the scoring semantics change
+CACHE_KEY_VERSION = 2
+# Keys looked up per SQL statement, below SQLite's variable limit
+LOOKUP_CHUNK = 500
+# Metric row cached for a query the engine does not score
+UNSCORED = b""
+
+
+class PerQueryCache:
+    """
+    SQLite store of per-query metric rows keyed by content hash.
+
+    The database is only created on first use. Each call opens its own
+    connection, so the cache is safe to use from threads and processes.
+    """
+
+    def __init__(self, path=EVAL_CACHE_PATH):
+        self.path = Path(path)
+
+    def _connect(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS per_query_metrics "
+            "(key BLOB PRIMARY KEY, metrics BLOB NOT NULL, created_at REAL NOT NULL)"
+        )
+        return conn
+
+    def get_many(self, keys):
+        """{key: metric row bytes} of the keys present in the cache"""
+        found = {}
+        conn = self._connect()
+        try:
+            for start in range(0, len(keys), LOOKUP_CHUNK):
+                chunk = keys[start : start + LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                found.update(
+                    conn.execute(
+                        "SELECT key, metrics FROM per_query_metrics "
+                        f"WHERE key IN ({placeholders})",
+                        chunk,
+                    )
+                )
+        finally:
+            conn.close()
+        return found
+
+    def put_many(self, items):
+        """Store (key, metric row bytes) pairs"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO per_query_metrics VALUES (?, ?, ?)",
+                    [(key, metrics, now) for key, metrics in items],
+                )
+        finally:
+            conn.close()
+
+    def clear(self):
+        """Delete every cached row"""
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM per_query_metrics")
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+
+    def stats(self):
+        """Number of cached rows and size of the database"""
+        if not self.path.exists():
+            return {"path": str(self.path), "entries": 0, "bytes": 0}
+        conn = self._connect()
+        try:
+            (entries,) = conn.execute(
+                "SELECT COUNT(*) FROM per_query_metrics"
+            ).fetchone()
+        finally:
+            conn.close()
+        return {
+            "path": str(self.path),
+            "entries": entries,
+            "bytes": self.path.stat().st_size,
+        }
+
+
+per_query_cache = PerQueryCache()
+
+
+def _qrels_digest(qrels_index, position):
+    """Digest of the judged (doc id, grade) pairs of one qrels query"""
+    start, end = qrels_index.indptr[position], qrels_index.indptr[position + 1]
+    n_docs = max(len(qrels_index.doc_ids), 1)
+    doc_ids = qrels_index.doc_ids[qrels_index.keys[start:end] % n_docs].tolist()
+    digest = hashlib.blake2b("\x00".join(doc_ids).encode("utf-8"), digest_size=16)
+    digest.update(np.asarray(qrels_index.relevance[start:end], dtype="<i8").tobytes())
+    return digest.digest()
+
+
+def _score_bytes(scores):
+    try:
+        return np.fromiter(scores, dtype=np.float64, count=len(scores)).tobytes()
+    except (TypeError, ValueError):
+        # Unparsable scores are dropped when ranking; hash their text instead
+        return "\x00".join(map(str, scores)).encode("utf-8")
+
+
+def query_keys(batch, qrels_index, k_values, engine):
+    """
+    Cache key of every query of a results batch that has qrels.
+
+    Args:
+        batch: {query_id: {doc_id: score}} results
+        qrels_index: QrelsIndex of the qrels
+        k_values: List of k values for evaluation
+        engine: Evaluation engine
+
+    Returns:
+        {query_id: 16-byte digest}, in batch order
+    """
+    header = f"v{CACHE_KEY_VERSION}|{engine}|{','.join(map(str, k_values))}|"
+    header = header.encode("utf-8")
+    keys = {}
+    for query_id, docs in batch.items():
+        query_id = str(query_id)
+        position = qrels_index.query_lookup.get(query_id)
+        if position is None:
+            continue
+        digest = hashlib.blake2b(header, digest_size=16)
+        digest.update(query_id.encode("utf-8") + b"\x00")
+        digest.update(_qrels_digest(qrels_index, position))
+        # The ranking is a function of the retrieved documents and their
+        # scores, so hash them as given instead of ranking every query first
+        if isinstance(docs, dict):
+            digest.update("\x00".join(map(str, docs)).encode("utf-8") + b"\x01")
+            digest.update(_score_bytes(docs.values()))
+        keys[query_id] = digest.digest()
+    return keys
+
+
+def _pack(metric_rows):
+    """{metric: values at each k} of one query as bytes, in METRIC_PREFIXES order"""
+    return np.stack(
+        [np.asarray(metric_rows[name], dtype=np.float64) for name in METRIC_PREFIXES]
+    ).tobytes()
+
+
+def _unpack(metrics, n_k):
+    return np.frombuffer(metrics, dtype=np.float64).reshape(len(METRIC_PREFIXES), n_k)
+
+
+def _score_misses(qrels_index, batch, k_values, engine):
+    """
+    Score a {query_id: {doc_id: score}} batch with the requested engine.
+
+    Returns:
+        {query_id: {metric: row of len(k_values)}} of the scored queries
+    """
+    if engine == "numpy":
+        run = build_run_arrays(batch, qrels_index, max(k_values))
+        values = score_run(qrels_index, run, k_values)
+        return {
+            query_id: {name: values[name][i] for name in METRIC_PREFIXES}
+            for i, query_id in enumerate(run.query_ids)
+        }
+
+    processed_results = normalize_results(batch)
+    for query_id, docs in processed_results.items():
+        docs.pop(query_id, None)
+    per_query = evaluate_pytrec(
+        qrels_subset(qrels_index, list(processed_results)), processed_results, k_values
+    )
+    return {
+        query_id: {name: per_query.values[name][i] for name in METRIC_PREFIXES}
+        for i, query_id in enumerate(per_query.query_ids.tolist())
+    }
+
+
+def evaluate_batches_incremental(
+    batches,
+    qrels_index,
+    k_values,
+    engine="beir",
+    cache=None,
+    progress=None,
+    return_per_query=False,
+):
+    """
+    Evaluate batches of results, reusing cached per-query metrics.
+
+    Args:
+        batches: Iterable of ({query_id: {doc_id: score}}, offset) tuples,
+            e.g. from streaming_evaluator.iter_result_batches
+        qrels_index: QrelsIndex of the qrels, for both engines
+        k_values: List of k values for evaluation
+        engine: "beir" or "numpy", scoring the cache misses
+        cache: PerQueryCache (default the one at EVAL_CACHE_PATH)
+        progress: Optional callback receiving queries_evaluated,
+            cache_hits and cache_misses keyword arguments after every batch
+        return_per_query: Also return the per-query metrics
+
+    Returns:
+        Tuple of (metrics, PerQueryMetrics or None, cache stats) where the
+        cache stats hold the hits, misses and hit_rate of this evaluation
+    """
+    if engine not in ENGINES:
+        raise ValueError(
+            f"Unknown evaluation engine '{engine}', expected one of {ENGINES}"
+        )
+    cache = cache or per_query_cache
+    k_values = list(k_values)
+    query_ids = []
+    rows = []
+    hits = misses = 0
+
+    for batch, _ in batches:
+        keys = query_keys(batch, qrels_index, k_values, engine)
+        if not keys:
+            continue
+        cached = cache.get_many(list(keys.values()))
+        missing = {
+            query_id: docs
+            for query_id, docs in batch.items()
+            if str(query_id) in keys and keys[str(query_id)] not in cached
+        }
+        scored = {}
+        if missing:
+            scored = _score_misses(qrels_index, missing, k_values, engine)
+
+        fresh = []
+        for query_id, key in keys.items():
+            if key in cached:
+                hits += 1
+                if cached[key] != UNSCORED:
+                    query_ids.append(query_id)
+                    rows.append(_unpack(cached[key], len(k_values)))
+            elif query_id in scored:
+                misses += 1
+                query_ids.append(query_id)
+                packed = _pack(scored[query_id])
+                fresh.append((key, packed))
+                rows.append(_unpack(packed, len(k_values)))
+            else:
+                # Not scored by the engine (e.g. pytrec_eval skips queries
+                # left without documents); cached as such, left out of the
+                # averages like in a full evaluation
+                misses += 1
+                fresh.append((key, UNSCORED))
+        if fresh:
+            cache.put_many(fresh)
+        if progress is not None:
+            progress(
+                queries_evaluated=len(query_ids), cache_hits=hits, cache_misses=misses
+            )
+
+    lookups = hits + misses
+    cache_stats = {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / lookups, 5) if lookups else 0.0,
+    }
+    logger.info(f"Incremental evaluation: {hits} cached and {misses} scored queries")
+    if not query_ids:
+        logger.error("No common queries between results and qrels")
+        return create_empty_metrics(k_values), None, cache_stats
+
+    stacked = np.stack(rows)
+    values = {
+        name: stacked[:, position, :] for position, name in enumerate(METRIC_PREFIXES)
+    }
+    metrics = aggregate_metrics(values, k_values)
+    per_query = None
+    if return_per_query:
+        per_query = PerQueryMetrics.from_unsorted(query_ids, k_values, values)
+    return metrics, per_query, cache_stats
+
+
+def evaluate_run_incremental(
+    results, qrels_index, k_values, batch_queries=None, **kwargs
+):
+    """evaluate_batches_incremental for a {query_id: {doc_id: score}} dict"""
+    batch_queries = batch_queries or STREAM_BATCH_QUERIES
+    items = list(results.items())
+    batches = (
+        (dict(items[start : start + batch_queries]), 0)
+        for start in range(0, len(items), batch_queries)
+    )
+    return evaluate_batches_incremental(batches, qrels_index, k_values, **kwargs)
+
+
+def evaluate_results_incremental(
+    results_path, qrels_index, k_values, batch_queries=None, latency=None, **kwargs
+):
+    """
+    evaluate_batches_incremental for a results file in any format, streamed
+    batch by batch, with per-query timings added to latency when given
+    """
+    return evaluate_batches_incremental(
+        iter_result_batches(results_path, batch_queries, latency),
+        qrels_index,
+        k_values,
+        **kwargs,
+    )
+
+
+def evaluate_file_incremental(results_path, qrels_path, k_values, **kwargs):
+    """
+    evaluate_results_incremental with qrels loaded from a qrels.npz or
+    qrels.json file. Raises QrelsError if the qrels cannot be read.
+    """
+    return evaluate_results_incremental(
+        results_path, read_qrels_index(qrels_path), k_values, **kwargs
+    )
@@ -0,0 +1,199 @@
+"""
+Compact columnar storage for per-query retrieval metrics.
+
+A per-query file is an .npz archive with one row per query, sorted by
+query id:
+
+- query_ids: query ids (str)
+- k_values: the evaluated cutoffs (int64)
+- one float64 array of shape (len(query_ids), len(k_values)) per metric of
+  METRIC_PREFIXES (ndcg, map, recall, precision, mrr, hit, r_precision,
+  judged); files written before a metric existed simply lack it
+- dataset_name, engine: optional metadata (0-d str arrays)
+
+Comparison and plotting scripts load it with load_per_query_metrics without
+parsing JSON, and recover the averaged metrics with PerQueryMetrics.aggregate.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+import pytrec_eval
+
+from py_metrics.fast_evaluator import METRIC_PREFIXES, PerQueryMetrics
+
+PER_QUERY_SUFFIX = ".per_query.npz"
+
+# pytrec_eval measure name prefix of each metric, e.g. "ndcg_cut_10"
+PYTREC_MEASURES = {
+    "ndcg": "ndcg_cut",
+    "map": "map_cut",
+    "recall": "recall",
+    "precision": "P",
+}
+# Measures requested alongside PYTREC_MEASURES to derive MRR, Hit and
+# R-precision at every k from the same pytrec_eval pass
+PYTREC_RANK_MEASURES = ("recip_rank", "Rprec", "num_rel")
+
+
+def per_query_path_for(results_path):
+    """Default per-query file for a results file, e.g. run.json -> run.per_query.npz"""
+    results_path = Path(results_path)
+    return results_path.with_name(results_path.stem + PER_QUERY_SUFFIX)
+
+
+def pytrec_measures(k_values):
+    """pytrec_eval measures needed by per_query_from_pytrec at k_values"""
+    cutoffs = ",".join(str(k) for k in k_values)
+    return {
+        *(f"{measure}.{cutoffs}" for measure in PYTREC_MEASURES.values()),
+        f"success.{cutoffs}",
+        *PYTREC_RANK_MEASURES,
+    }
+
+
+def judged_at_k(qrels, results, query_ids, k_values):
+    """
+    Share of each query's top k documents that are judged in the qrels.
+
+    The documents of all queries are ranked with one np.lexsort in
+    pytrec_eval's order (score descending, ties by doc id descending), as in
+    fast_evaluator.build_run_arrays, and the judged ones are counted by rank.
+
+    Returns:
+        float64 array of shape (len(query_ids), len(k_values))
+    """
+    lengths = []
+    doc_col = []
+    score_col = []
+    judged_col = []
+    for query_id in query_ids:
+        docs = results.get(query_id, {})
+        judged_docs = qrels.get(query_id, {})
+        lengths.append(len(docs))
+        doc_col.extend(docs.keys())
+        score_col.extend(docs.values())
+        judged_col.extend([doc_id in judged_docs for doc_id in docs])
+
+    segment = np.repeat(np.arange(len(query_ids), dtype=np.int64), lengths)
+    scores = np.asarray(score_col, dtype=np.float64)
+    _, doc_rank = np.unique(np.asarray(doc_col, dtype=str), return_inverse=True)
+    order = np.lexsort((-doc_rank, -scores, segment))
+    indptr = np.zeros(len(query_ids) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    # segment is already grouped, so sorting keeps each query's rows in place
+    ranks = np.arange(len(order), dtype=np.int64) - indptr[segment] + 1
+    judged = np.asarray(judged_col, dtype=bool)[order]
+    rows, ranks = segment[judged], ranks[judged]
+    return np.stack(
+        [np.bincount(rows[ranks <= k], minlength=len(query_ids)) / k for k in k_values],
+        axis=1,
+    ).reshape(len(query_ids), len(k_values))
+
+
+def per_query_from_pytrec(scores, k_values, qrels, results):
+    """
+    Convert pytrec_eval's {query_id: {measure: value}} scores.
+
+    Args:
+        scores: Output of RelevanceEvaluator.evaluate with the measures of
+            pytrec_measures(k_values)
+        k_values: List of k values the measures were computed at
+        qrels: Qrels the scores were computed from
+        results: Results the scores were computed from, for judged@k, which
+            pytrec_eval does not provide
+
+    Returns:
+        PerQueryMetrics with one row per scored query
+    """
+    query_ids = list(scores.keys())
+
+    def column(measure):
+        return np.array(
+            [scores[query_id][measure] for query_id in query_ids], dtype=np.float64
+        )
+
+    def columns(measure):
+        return np.stack([column(f"{measure}_{k}") for k in k_values], axis=1).reshape(
+            len(query_ids), len(k_values)
+        )
+
+    values = {name: columns(measure) for name, measure in PYTREC_MEASURES.items()}
+    k_arr = np.asarray(k_values)
+    # Rank of the first relevant document from its reciprocal rank
+    recip_rank = column("recip_rank")
+    first = np.full(len(query_ids), np.inf)
+    np.divide(1.0, recip_rank, out=first, where=recip_rank > 0)
+    first = np.rint(first)[:, None]
+    values["mrr"] = np.where(first <= k_arr, 1.0 / first, 0.0)
+    values["hit"] = columns("success")
+    # Precision at min(R, k): Rprec once k >= R, P@k before
+    values["r_precision"] = np.where(
+        column("num_rel")[:, None] <= k_arr,
+        column("Rprec")[:, None],
+        values["precision"],
+    )
+    values["judged"] = judged_at_k(qrels, results, query_ids, k_values)
+    return PerQueryMetrics.from_unsorted(query_ids, k_values, values)
+
+
+def evaluate_pytrec(qrels, results, k_values):
+    """
+    Score normalized results with pytrec_eval at every k.
+
+    Identical query/doc ids must already be removed from results.
+
+    Returns:
+        PerQueryMetrics with one row per scored query
+    """
+    evaluator = pytrec_eval.RelevanceEvaluator(qrels, pytrec_measures(k_values))
+    return per_query_from_pytrec(evaluator.evaluate(results), k_values, qrels, results)
+
+
+def save_per_query_metrics(per_query, path, dataset_name=None, engine=None):
+    """Save PerQueryMetrics to a compressed .npz file"""
+    arrays = {
+        "query_ids": per_query.query_ids,
+        "k_values": np.asarray(per_query.k_values, dtype=np.int64),
+        **per_query.values,
+    }
+    if dataset_name is not None:
+        arrays["dataset_name"] = np.array(dataset_name)
+    if engine is not None:
+        arrays["engine"] = np.array(engine)
+    np.savez_compressed(path, **arrays)
+
+
+def load_per_query_metrics(path):
+    """
+    Load a file written by save_per_query_metrics.
+
+    Returns:
+        Tuple of (PerQueryMetrics, metadata dict)
+    """
+    with np.load(path) as data:
+        per_query = PerQueryMetrics(
+            query_ids=data["query_ids"],
+            k_values=data["k_values"].tolist(),
+            values={name: data[name] for name in METRIC_PREFIXES if name in data},
+        )
+        metadata = {
+            key: str(data[key]) for key in ("dataset_name", "engine") if key in data
+        }
+    return per_query, metadata
+
+
+def load_metrics_file(path):
+    """
+    Load averaged metrics from an evaluation JSON file or a per-query file.
+
+    Returns:
+        Dict with "metrics" and, when known, "dataset_name", as written by
+        the evaluate scripts
+    """
+    if str(path).endswith(".npz"):
+        per_query, metadata = load_per_query_metrics(path)
+        return {"metrics": per_query.aggregate(), **metadata}
+    with open(path, "r") as f:
+        return json.load(f)
@@ -1,5 +1,4 @@
 #!/usr/bin/env python3
-import json
 import matplotlib.pyplot as plt
 import argparse
 import os
@@ -7,6 +6,8 @@ import sys
 import numpy as np
 from matplotlib import rcParams
 
+from py_metrics.per_query_metrics import load_metrics_file
+
 # Set high-quality plot parameters
 plt.style.use("seaborn-v0_8-whitegrid")
 rcParams["figure.dpi"] = 300
@@ -26,10 +27,9 @@ rcParams["ytick.major.width"] = 1.5
 
 
 def plot_metrics(json_file):
-    """Generate bar charts for metrics in the JSON file."""
-    # Load the JSON data
-    with open(json_file, "r") as f:
-        data = json.load(f)
+    """Generate bar charts for metrics in the JSON (or per-query .npz) file."""
+    # Load the JSON data, or average a per-query metrics file
+    data = load_metrics_file(json_file)
 
     metrics = data["metrics"]
     dataset_name = data.get("dataset_name", "unknown")
@@ -152,7 +152,9 @@ def plot_metrics(json_file):
     if not os.path.exists(plots_dir):
         os.makedirs(plots_dir)
 
-    output_filename = os.path.basename(json_file).replace(".json", "_hq.png")
+    output_filename = (
+        os.path.basename(json_file).replace(".npz", ".json").replace(".json", "_hq.png")
+    )
     output_path = os.path.join(plots_dir, output_filename)
     plt.savefig(output_path, bbox_inches="tight", pad_inches=0.3)
     print(f"High-quality plot saved to {output_path}")
@@ -166,7 +168,8 @@ def main():
         description="Plot evaluation metrics from a JSON file"
     )
     parser.add_argument(
-        "json_file", help="Path to the JSON file containing evaluation metrics"
+        "json_file",
+        help="Path to the JSON file containing evaluation metrics, or a per-query .npz file",
     )
     args = parser.parse_args()
 
@@ -0,0 +1,198 @@
+import json
+import logging
+import os
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from py_metrics.beir_evaluator import normalize_qrels
+from py_metrics.dataset_store import load_qrels_index, qrels_index_to_dict
+from py_metrics.fast_evaluator import build_qrels_index
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Memory budget for cached qrels, in megabytes
+QRELS_CACHE_MAX_MB = int(os.getenv("QRELS_CACHE_MAX_MB", "1024"))
+
+
+def _estimate_qrels_bytes(processed_qrels):
+    """Rough memory footprint of a normalized {query_id: {doc_id: int}} dict"""
+    total = sys.getsizeof(processed_qrels)
+    for query_id, docs in processed_qrels.items():
+        total += sys.getsizeof(query_id) + sys.getsizeof(docs)
+        # Doc id strings plus small ints, which CPython shares
+        total += sum(sys.getsizeof(doc_id) for doc_id in docs)
+    return total
+
+
+class QrelsCache:
+    """
+    Process-wide LRU cache of normalized qrels.
+
+    The server and every evaluation worker process each keep one; see
+    cache_stats, clear_cache and merge_cache_stats for reporting them
+    together.
+
+    Qrels are read from either qrels.json or the indexed qrels.npz. Entries
+    are keyed by qrels file path and form ("processed" for the beir
+    engine, "index" for the numpy engine) and are invalidated whenever the
+    file's mtime or size changes. Least recently used entries are evicted
+    once the estimated size of all entries exceeds max_bytes.
+    """
+
+    def __init__(self, max_bytes=QRELS_CACHE_MAX_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get_processed_qrels(self, qrels_path):
+        """Get qrels normalized for BEIR's EvaluateRetrieval"""
+        return self._get(qrels_path, "processed")
+
+    def get_qrels_index(self, qrels_path):
+        """Get qrels as a QrelsIndex for the numpy engine"""
+        return self._get(qrels_path, "index")
+
+    def _get(self, qrels_path, form):
+        path = str(Path(qrels_path).resolve())
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        key = (path, form)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry["version"] == version:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry["value"]
+                # File changed on disk since it was cached
+                self._remove(key)
+                self.invalidations += 1
+            self.misses += 1
+
+        # Build outside the lock so slow loads don't block other datasets
+        value, size = self._load(path, form)
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size <= self.max_bytes:
+                self._entries[key] = {"version": version, "value": value, "bytes": size}
+                self._bytes += size
+                self._evict()
+            else:
+                logger.warning(
+                    f"Qrels {path} ({size} bytes) exceeds the cache budget, not caching"
+                )
+        return value
+
+    def _load(self, path, form):
+        if path.endswith(".npz"):
+            index = load_qrels_index(path)
+            if form == "index":
+                return index, index.nbytes
+            processed_qrels = qrels_index_to_dict(index)
+            return processed_qrels, _estimate_qrels_bytes(processed_qrels)
+
+        with open(path, "r") as f:
+            loaded_qrels = json.load(f)
+        if not loaded_qrels or not isinstance(loaded_qrels, dict):
+            raise ValueError(f"Invalid qrels format or empty qrels in {path}")
+
+        if form == "index":
+            index = build_qrels_index(loaded_qrels)
+            return index, index.nbytes
+
+        processed_qrels = normalize_qrels(loaded_qrels)
+        return processed_qrels, _estimate_qrels_bytes(processed_qrels)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry["bytes"]
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._entries:
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.evictions += 1
+            logger.info(f"Evicted qrels {key[0]} ({key[1]}) from cache")
+
+    def clear(self):
+        """Drop every cached entry, keeping the counters"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Hit/miss counters and current memory usage"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": [
+                    {"qrels_path": path, "form": form, "bytes": entry["bytes"]}
+                    for (path, form), entry in self._entries.items()
+                ],
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+qrels_cache = QrelsCache()
+
+
+def cache_stats():
+    """Stats of this process's qrels cache, with its process id"""
+    return {"pid": os.getpid(), **qrels_cache.stats()}
+
+
+def clear_cache():
+    """Clear this process's qrels cache and return its stats"""
+    qrels_cache.clear()
+    return cache_stats()
+
+
+def merge_cache_stats(process_stats):
+    """
+    Add up the cache_stats of several processes, such as the server and its
+    evaluation workers, each of which keeps its own cache.
+
+    Args:
+        process_stats: List of cache_stats() results
+
+    Returns:
+        Dict of the summed counters, every entry tagged with its pid, and
+        the per-process stats under "processes"
+    """
+    hits = sum(stats["hits"] for stats in process_stats)
+    misses = sum(stats["misses"] for stats in process_stats)
+    return {
+        "entries": [
+            {**entry, "pid": stats["pid"]}
+            for stats in process_stats
+            for entry in stats["entries"]
+        ],
+        "bytes": sum(stats["bytes"] for stats in process_stats),
+        "max_bytes": sum(stats["max_bytes"] for stats in process_stats),
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        "evictions": sum(stats["evictions"] for stats in process_stats),
+        "invalidations": sum(stats["invalidations"] for stats in process_stats),
+        "processes": [
+            {key: value for key, value in stats.items() if key != "entries"}
+            for stats in process_stats
+        ],
+    }
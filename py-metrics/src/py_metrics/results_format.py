@@ -0,0 +1,624 @@
+"""
+Readers and writers for search results files.
+
+Three formats are read, detected from the file contents:
+
+- "json": the single object written by the search scripts, either
+  {"results": {query_id: {doc_id: score}}, ...metadata} or the bare
+  results object. The wrapped form may also hold per-query timings in a
+  "timings" member: {query_id: {"latency_ms": 12.3, "timestamp": ...}}.
+- "jsonl": one query per line. An optional first line holds metadata:
+
+      {"format": "py-metrics-results", "version": 1, "metadata": {...}}
+      {"query_id": "q1", "results": {"doc1": 12.5, "doc2": 11.0}}
+      {"query_id": "q2", "results": {}, "latency_ms": 12.3,
+       "timestamp": 1718000000.5, "status": 200}
+
+  Lines are independent, so a file can be appended to while searching,
+  streamed, or split at line boundaries.
+- "binary": a compact, memory-mappable file. An 8-byte magic, a little-endian
+  uint64 header length and a JSON header are followed by arrays aligned to
+  64 bytes, each located by the header's "arrays" entry (offset, dtype,
+  length):
+
+      query_id_offsets, query_id_bytes  UTF-8 query ids, CSR style
+      doc_id_offsets, doc_id_bytes      UTF-8 dictionary of distinct doc ids
+      indptr                            int64, query i owns entries
+                                        indptr[i]:indptr[i+1]
+      doc_index                         int32 (int64 for huge dictionaries)
+                                        position in the doc id dictionary
+      scores                            float32 by default
+
+  Optional latency_ms and timestamp (float64, NaN when unknown) and error
+  (uint8) arrays hold one timing per query.
+
+  Queries can be read by position without touching the rest of the file.
+  With float32 scores, documents whose scores only differ beyond float32
+  precision tie, and ties are ranked by doc id.
+
+Timing fields ("latency_ms", "timestamp", "error", "status") are optional in
+every format; readers hand them to a latency_metrics.LatencyStats when one
+is passed.
+"""
+
+import argparse
+import json
+import logging
+import math
+import mmap
+from array import array
+from pathlib import Path
+
+import numpy as np
+
+from py_metrics.json_stream import first_json_member, iter_json_members
+from py_metrics.latency_metrics import parse_timing
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FORMATS = ("json", "jsonl", "binary")
+FORMAT_NAME = "py-metrics-results"
+FORMAT_VERSION = 1
+BINARY_MAGIC = b"PYMRES\x00\x01"
+BINARY_ALIGNMENT = 64
+# First lines longer than this are not parsed whole when detecting formats
+DETECT_MAX_LINE_BYTES = 1 << 20
+
+BINARY_ARRAYS = (
+    "query_id_offsets",
+    "query_id_bytes",
+    "doc_id_offsets",
+    "doc_id_bytes",
+    "indptr",
+    "doc_index",
+    "scores",
+)
+# Optional per-query arrays of "binary" files
+BINARY_TIMING_ARRAYS = ("latency_ms", "timestamp", "error")
+# Per-query timing fields of results records
+TIMING_FIELDS = ("latency_ms", "timestamp", "error", "status")
+
+
+def detect_results_format(path):
+    """
+    Detect the format of a results file from its first bytes.
+
+    Returns:
+        One of FORMATS
+    """
+    with open(path, "rb") as f:
+        if f.read(len(BINARY_MAGIC)) == BINARY_MAGIC:
+            return "binary"
+        f.seek(0)
+        first_line = f.readline(DETECT_MAX_LINE_BYTES)
+    if first_line.endswith(b"\n"):
+        try:
+            record = json.loads(first_line)
+        except ValueError:
+            # A pretty-printed or multi-line JSON object
+            return "json"
+    else:
+        # A long first line (or a single-line file): JSON Lines records
+        # start with "query_id" and headers with "format", so only the first
+        # key is read, without parsing a (possibly huge) "results" value
+        try:
+            key, value = first_json_member(path)
+        except ValueError:
+            return "json"
+        record = {key: value}
+    if isinstance(record, dict) and (
+        record.get("format") == FORMAT_NAME or "query_id" in record
+    ):
+        return "jsonl"
+    return "json"
+
+
+def iter_search_results(results_path, latency=None):
+    """
+    Stream the queries of a "json" results file.
+
+    Accepts the same layouts as load_search_results: {"results": {...}} with
+    other metadata members, or the bare results dict. The layout is decided
+    by the first member: a "results" object or a non-object value means the
+    wrapped layout. Entries of a "timings" member are added to latency, a
+    LatencyStats, when given.
+
+    Yields:
+        Tuples of (query_id, docs, offset), offset being the byte position
+        just past the query
+    """
+    layout = None
+    for parent, key, value, offset in iter_json_members(
+        results_path, expand=("results", "timings")
+    ):
+        if parent == "timings":
+            if latency is not None:
+                latency.add_record(value)
+        elif parent == "results":
+            layout = "wrapped"
+            yield key, value, offset
+        elif layout is None and (parent is not None or not isinstance(value, dict)):
+            layout = "wrapped"
+        elif layout != "wrapped":
+            layout = "bare"
+            if isinstance(value, dict):
+                yield key, value, offset
+            else:
+                logger.warning(f"Skipping non-object member '{key}' of results")
+
+
+def iter_results_jsonl(path, start=0, stop=None, latency=None):
+    """
+    Stream the queries of a "jsonl" results file as (query_id, docs, offset).
+
+    With start and stop, only the lines beginning in the byte range
+    [start, stop) are read, so consecutive ranges split a file into disjoint
+    shards whatever line boundaries the range ends fall on. The timing
+    fields of every query are added to latency, a LatencyStats, when given.
+    """
+    for query_id, docs, offset, record in _iter_jsonl_records(path, start, stop):
+        if latency is not None:
+            latency.add_record(record)
+        yield query_id, docs, offset
+
+
+def _iter_jsonl_records(path, start, stop):
+    """iter_results_jsonl, also yielding each query's whole record"""
+    with open(path, "rb") as f:
+        if start > 0:
+            # Move to the first line beginning at or after start
+            f.seek(start - 1)
+            f.readline()
+        position = f.tell()
+        for line in iter(f.readline, b""):
+            if stop is not None and position >= stop:
+                return
+            position += len(line)
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if "query_id" not in record:
+                if record.get("format") != FORMAT_NAME:
+                    logger.warning("Skipping results line without a query_id")
+                continue
+            yield (
+                str(record["query_id"]),
+                record.get("results") or {},
+                position,
+                record,
+            )
+
+
+def iter_results(path, results_format=None, latency=None):
+    """
+    Stream the queries of a results file in any of FORMATS.
+
+    Args:
+        path: Results file
+        results_format: One of FORMATS, detected when None
+        latency: Optional LatencyStats receiving the per-query timings
+
+    Yields:
+        Tuples of (query_id, {doc_id: score}, offset), offset being the byte
+        position reached in the file, for progress reporting
+    """
+    results_format = results_format or detect_results_format(path)
+    if results_format == "binary":
+        with ResultsBinaryReader(path) as reader:
+            yield from reader.iter_queries(latency=latency)
+    elif results_format == "jsonl":
+        yield from iter_results_jsonl(path, latency=latency)
+    else:
+        yield from iter_search_results(path, latency=latency)
+
+
+def _timing(record):
+    """Timing fields of a record, None if it has none"""
+    timing = {
+        field: record[field]
+        for field in TIMING_FIELDS
+        if isinstance(record, dict) and record.get(field) is not None
+    }
+    return timing or None
+
+
+def iter_results_with_timing(path, results_format=None):
+    """
+    Stream (query_id, docs, timing) of a results file, timing being the
+    query's timing fields or None.
+
+    The "timings" of a "json" file may follow its results, so they are read
+    in a first pass over the file.
+    """
+    results_format = results_format or detect_results_format(path)
+    if results_format == "binary":
+        with ResultsBinaryReader(path) as reader:
+            for i, (query_id, docs, _) in enumerate(reader.iter_queries()):
+                yield query_id, docs, reader.query_timing(i)
+    elif results_format == "jsonl":
+        for query_id, docs, _, record in _iter_jsonl_records(path, 0, None):
+            yield query_id, docs, _timing(record)
+    else:
+        timings = {
+            key: _timing(value)
+            for parent, key, value, _ in iter_json_members(
+                path, expand=("results", "timings")
+            )
+            if parent == "timings"
+        }
+        for query_id, docs, _ in iter_search_results(path):
+            yield query_id, docs, timings.get(query_id)
+
+
+def read_results_metadata(path):
+    """Metadata stored in a results file (empty if there is none)"""
+    results_format = detect_results_format(path)
+    if results_format == "binary":
+        with ResultsBinaryReader(path) as reader:
+            return reader.metadata
+    if results_format == "jsonl":
+        with open(path, "rb") as f:
+            record = json.loads(f.readline())
+        return record.get("metadata", {}) if "query_id" not in record else {}
+    metadata = {}
+    for parent, key, value, _ in iter_json_members(path, expand=("results",)):
+        if parent is None and not isinstance(value, dict):
+            metadata[key] = value
+    return metadata
+
+
+class ResultsJsonlWriter:
+    """
+    Write results one query per line.
+
+    Opening an existing file with append=True adds queries after the ones
+    already there, without rewriting the metadata line.
+    """
+
+    def __init__(self, path, metadata=None, append=False):
+        self.path = Path(path)
+        exists = append and self.path.exists() and self.path.stat().st_size > 0
+        self._file = open(self.path, "a" if append else "w", encoding="utf-8")
+        if not exists:
+            header = {"format": FORMAT_NAME, "version": FORMAT_VERSION}
+            if metadata:
+                header["metadata"] = metadata
+            self._file.write(json.dumps(header) + "\n")
+
+    def write(self, query_id, docs, timing=None):
+        record = {"query_id": str(query_id), "results": docs}
+        if timing:
+            record.update(timing)
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _pack_strings(strings):
+    """Concatenate strings as UTF-8 with int64 CSR offsets"""
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+class ResultsBinaryWriter:
+    """
+    Collect results query by query and write them as a "binary" file on
+    close. Doc ids are interned into one dictionary, so memory holds each
+    distinct doc id once plus 8 to 12 bytes per result.
+    """
+
+    def __init__(self, path, metadata=None, score_dtype="float32"):
+        self.path = Path(path)
+        self.metadata = metadata or {}
+        self.score_dtype = np.dtype(score_dtype)
+        self._query_ids = []
+        self._doc_lookup = {}
+        self._lengths = array("q")
+        self._doc_index = array("q")
+        self._scores = array("d")
+        # Timing arrays, only written when some query has a timing
+        self._timings = {
+            "latency_ms": array("d"),
+            "timestamp": array("d"),
+            "error": array("B"),
+        }
+        self._has_timing = False
+
+    def write(self, query_id, docs, timing=None):
+        timing = parse_timing(timing) if timing else None
+        self._has_timing |= timing is not None
+        timing = timing or {}
+        for name in ("latency_ms", "timestamp"):
+            value = timing.get(name)
+            self._timings[name].append(math.nan if value is None else value)
+        self._timings["error"].append(int(timing.get("error", False)))
+        lookup = self._doc_lookup
+        self._query_ids.append(str(query_id))
+        self._lengths.append(len(docs))
+        self._doc_index.extend(
+            lookup.setdefault(str(doc_id), len(lookup)) for doc_id in docs
+        )
+        self._scores.extend(float(score) for score in docs.values())
+
+    def close(self):
+        doc_ids = list(self._doc_lookup)
+        index_dtype = np.int32 if len(doc_ids) < 2**31 else np.int64
+        query_id_offsets, query_id_bytes = _pack_strings(self._query_ids)
+        doc_id_offsets, doc_id_bytes = _pack_strings(doc_ids)
+        indptr = np.zeros(len(self._lengths) + 1, dtype=np.int64)
+        np.cumsum(np.frombuffer(self._lengths, dtype=np.int64), out=indptr[1:])
+        arrays = {
+            "query_id_offsets": query_id_offsets,
+            "query_id_bytes": query_id_bytes,
+            "doc_id_offsets": doc_id_offsets,
+            "doc_id_bytes": doc_id_bytes,
+            "indptr": indptr,
+            "doc_index": np.frombuffer(self._doc_index, dtype=np.int64).astype(
+                index_dtype
+            ),
+            "scores": np.frombuffer(self._scores, dtype=np.float64).astype(
+                self.score_dtype
+            ),
+        }
+        if self._has_timing:
+            arrays["latency_ms"] = np.frombuffer(self._timings["latency_ms"])
+            arrays["timestamp"] = np.frombuffer(self._timings["timestamp"])
+            arrays["error"] = np.frombuffer(self._timings["error"], dtype=np.uint8)
+        _write_binary(self.path, arrays, self.metadata)
+        logger.info(
+            f"Wrote {len(self._query_ids)} queries, {len(arrays['scores'])} "
+            f"results and {len(doc_ids)} distinct doc ids to {self.path}"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        # Only write a complete file
+        if exc_type is None:
+            self.close()
+
+
+def _write_binary(path, arrays, metadata):
+    """Lay out the header and the aligned arrays of a "binary" file"""
+
+    def layout(header_size):
+        position = _align(len(BINARY_MAGIC) + 8 + header_size)
+        entries = {}
+        for name, array_ in arrays.items():
+            entries[name] = {
+                "offset": position,
+                "dtype": array_.dtype.str,
+                "length": len(array_),
+            }
+            position = _align(position + array_.nbytes)
+        return entries
+
+    header = {
+        "format": FORMAT_NAME,
+        "version": FORMAT_VERSION,
+        "metadata": metadata,
+        "n_queries": len(arrays["indptr"]) - 1,
+        "n_docs": len(arrays["doc_id_offsets"]) - 1,
+        "n_results": len(arrays["scores"]),
+        "arrays": layout(0),
+    }
+    # Offsets depend on the header size and vice versa; iterate to a fixpoint
+    encoded = b""
+    while True:
+        previous = encoded
+        encoded = json.dumps(header).encode("utf-8")
+        if encoded == previous:
+            break
+        header["arrays"] = layout(len(encoded))
+
+    with open(path, "wb") as f:
+        f.write(BINARY_MAGIC)
+        f.write(np.uint64(len(encoded)).tobytes())
+        f.write(encoded)
+        for name in arrays:
+            f.write(b"\0" * (header["arrays"][name]["offset"] - f.tell()))
+            f.write(np.ascontiguousarray(arrays[name]).tobytes())
+
+
+def _align(position):
+    return -(-position // BINARY_ALIGNMENT) * BINARY_ALIGNMENT
+
+
+class ResultsBinaryReader:
+    """
+    Memory-mapped view of a "binary" results file.
+
+    Arrays are mapped, not read: looking up query i touches only its own
+    entries and the bytes of its doc ids.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        try:
+            if self._file.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+                raise ValueError(f"{path} is not a binary results file")
+            header_size = int(np.frombuffer(self._file.read(8), dtype=np.uint64)[0])
+            self.header = json.loads(self._file.read(header_size))
+            if self.header.get("version") != FORMAT_VERSION:
+                raise ValueError(
+                    f"Unsupported results format version {self.header.get('version')}"
+                )
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        self.metadata = self.header.get("metadata", {})
+        self.arrays = {
+            name: self._map(entry) for name, entry in self.header["arrays"].items()
+        }
+
+    def _map(self, entry):
+        if entry["length"] == 0:
+            return np.zeros(0, dtype=entry["dtype"])
+        return np.frombuffer(
+            self._mmap,
+            dtype=entry["dtype"],
+            count=entry["length"],
+            offset=entry["offset"],
+        )
+
+    def __len__(self):
+        return self.header["n_queries"]
+
+    def _string(self, name, i):
+        """i-th string of a packed string array, read straight from the map"""
+        offsets = self.arrays[f"{name}_offsets"]
+        base = self.header["arrays"][f"{name}_bytes"]["offset"]
+        return self._mmap[base + offsets[i] : base + offsets[i + 1]].decode("utf-8")
+
+    def query_id(self, i):
+        return self._string("query_id", i)
+
+    def query_docs(self, i):
+        """{doc_id: score} of the i-th query"""
+        indptr = self.arrays["indptr"]
+        start, end = indptr[i], indptr[i + 1]
+        doc_index = self.arrays["doc_index"][start:end]
+        offsets = self.arrays["doc_id_offsets"]
+        base = self.header["arrays"]["doc_id_bytes"]["offset"]
+        starts = (offsets[doc_index] + base).tolist()
+        ends = (offsets[doc_index + 1] + base).tolist()
+        blob = self._mmap
+        return dict(
+            zip(
+                (blob[s:e].decode("utf-8") for s, e in zip(starts, ends)),
+                self.arrays["scores"][start:end].tolist(),
+            )
+        )
+
+    def query_timing(self, i):
+        """Timing fields of the i-th query, None if the file has none"""
+        if "latency_ms" not in self.arrays:
+            return None
+        timing = {"error": bool(self.arrays["error"][i])}
+        for name in ("latency_ms", "timestamp"):
+            value = float(self.arrays[name][i])
+            if not math.isnan(value):
+                timing[name] = value
+        return timing
+
+    def iter_queries(self, start=0, stop=None, latency=None):
+        """
+        Yield (query_id, docs, offset) for queries start..stop, offset being
+        the file position just past the query's last score
+
+        The timings of these queries are added to latency, a LatencyStats,
+        when given.
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        if latency is not None and "latency_ms" in self.arrays:
+            latency.add_many(
+                self.arrays["latency_ms"][start:stop],
+                self.arrays["timestamp"][start:stop],
+                self.arrays["error"][start:stop].astype(bool),
+            )
+        scores = self.header["arrays"]["scores"]
+        itemsize = np.dtype(scores["dtype"]).itemsize
+        indptr = self.arrays["indptr"]
+        for i in range(start, stop):
+            offset = scores["offset"] + int(indptr[i + 1]) * itemsize
+            yield self.query_id(i), self.query_docs(i), offset
+
+    def close(self):
+        # Views into the map must be released before it can be closed
+        self.arrays = {}
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_results(path, results_format=None, latency=None):
+    """Load every query of a results file into {query_id: {doc_id: score}}"""
+    return {
+        query_id: docs
+        for query_id, docs, _ in iter_results(
+            path, results_format=results_format, latency=latency
+        )
+    }
+
+
+def write_results(path, results, results_format, metadata=None, **kwargs):
+    """
+    Write {query_id: {doc_id: score}} (or an iterable of (query_id, docs)
+    pairs or (query_id, docs, timing) triples) to a "jsonl" or "binary"
+    results file.
+    """
+    if results_format not in ("jsonl", "binary"):
+        raise ValueError(f"Cannot write results format '{results_format}'")
+    items = results.items() if isinstance(results, dict) else results
+    writer_class = (
+        ResultsJsonlWriter if results_format == "jsonl" else ResultsBinaryWriter
+    )
+    with writer_class(path, metadata=metadata, **kwargs) as writer:
+        for query_id, docs, *timing in items:
+            writer.write(query_id, docs, *timing)
+
+
+def convert_results(input_path, output_path, results_format, score_dtype="float32"):
+    """
+    Convert a results file to "jsonl" or "binary", streaming the input.
+
+    Metadata members of a "json" input (dataset, timestamp, ...) and
+    per-query timings are kept.
+    """
+    metadata = read_results_metadata(input_path)
+    kwargs = {"score_dtype": score_dtype} if results_format == "binary" else {}
+    write_results(
+        output_path,
+        iter_results_with_timing(input_path),
+        results_format,
+        metadata=metadata,
+        **kwargs,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert search results to the JSONL or binary results format"
+    )
+    parser.add_argument("input_path", help="Results file in any supported format")
+    parser.add_argument("output_path", help="File to write")
+    parser.add_argument(
+        "--format",
+        choices=("jsonl", "binary"),
+        help="Output format (default: jsonl for .jsonl outputs, else binary)",
+    )
+    parser.add_argument(
+        "--score-dtype",
+        choices=("float32", "float64"),
+        default="float32",
+        help="Score precision of binary outputs (default: float32)",
+    )
+    args = parser.parse_args()
+
+    results_format = args.format or (
+        "jsonl" if args.output_path.endswith(".jsonl") else "binary"
+    )
+    convert_results(args.input_path, args.output_path, results_format, args.score_dtype)
+    print(f"Wrote {results_format} results to {args.output_path}")
+
+
+if __name__ == "__main__":
+    main()
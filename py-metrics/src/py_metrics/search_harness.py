@@ -0,0 +1,359 @@
+"""
+Async search load harness for Supermemory-compatible APIs.
+
+batchSearchMemories in the TypeScript client searches in fixed batches of
+10 with a pause between them and measures neither latency nor throughput.
+This harness issues the searches from one asyncio event loop through a
+pooled HTTP client (httpx, at most `connections` keep-alive connections),
+in one of two modes:
+
+- Closed loop: `concurrency` workers each send a query, wait for its
+  response and send the next one. Throughput is whatever the server
+  sustains at that concurrency.
+- Open loop: queries are sent on a fixed schedule of `target_qps`, evenly
+  spaced or with Poisson arrivals, however slowly the server answers.
+  Latency is measured from the scheduled send time, so requests held back
+  by a saturated server or connection pool count their wait instead of
+  hiding it (coordinated omission).
+
+Each query's results and timing (latency_ms, timestamp, status and error)
+are appended to a JSONL results file as they complete (see results_format).
+The file can be handed to the evaluator as is, so retrieval quality and
+latency/throughput (see latency_metrics) come from the same run.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import time
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+from py_metrics.beir_evaluator import format_metrics
+from py_metrics.dataset_store import find_qrels_path
+from py_metrics.file_evaluator import evaluate_file_with_cache
+from py_metrics.latency_metrics import LatencyStats
+from py_metrics.results_format import ResultsJsonlWriter
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Search API, e.g. the live API or py_metrics.memory_server
+SUPERMEMORY_API_URL = os.getenv("SUPERMEMORY_API_URL", "http://127.0.0.1:8100")
+SUPERMEMORY_API_KEY = os.getenv("SUPERMEMORY_API_KEY", "")
+BEIR_DATA_ROOT_PATH = os.getenv("BEIR_DATA_ROOT_PATH", "./beir_data")
+# Connections of open-loop runs; closed-loop runs use one per worker
+SEARCH_MAX_CONNECTIONS = int(os.getenv("SEARCH_MAX_CONNECTIONS", "100"))
+SEARCH_TIMEOUT_SECONDS = float(os.getenv("SEARCH_TIMEOUT_SECONDS", "30"))
+# Seconds between progress log lines
+PROGRESS_LOG_SECONDS = 5
+ARRIVALS = ("uniform", "poisson")
+
+
+def iter_queries(queries_path):
+    """
+    Stream (query_id, text) from a queries.json or queries.jsonl file, or
+    from the queries of a downloaded dataset directory
+    """
+    path = Path(queries_path)
+    if path.is_dir():
+        jsonl_path = path / "queries.jsonl"
+        path = jsonl_path if jsonl_path.exists() else path / "queries.json"
+
+    if path.suffix == ".jsonl":
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield str(record["_id"]), record.get("text", "")
+        return
+
+    with open(path, "r", encoding="utf-8") as f:
+        queries = json.load(f)
+    for query_id, query in queries.items():
+        text = query.get("text", "") if isinstance(query, dict) else str(query)
+        yield str(query_id), text
+
+
+def results_to_docs(response):
+    """
+    {doc_id: score} of a search response, using the doc_id metadata that
+    load-beir.ts attaches to each memory.
+
+    Results without a score are scored by rank. A document returned more
+    than once (e.g. as several chunks) keeps its best score.
+    """
+    docs = {}
+    for rank, result in enumerate(response.get("results") or []):
+        doc_id = (result.get("metadata") or {}).get("doc_id")
+        if doc_id is None:
+            continue
+        score = result.get("score")
+        if score is None:
+            score = 1.0 / (rank + 1)
+        doc_id = str(doc_id)
+        docs[doc_id] = max(score, docs.get(doc_id, score))
+    return docs
+
+
+async def search_query(client, text, limit, user_id=None, started=None):
+    """
+    Send one search and time it.
+
+    Args:
+        client: httpx.AsyncClient with the API's base URL
+        text: Query text
+        limit: Results requested
+        user_id: Optional userId scoping the search
+        started: time.perf_counter() value to measure latency from, for
+            open-loop sends (default now)
+
+    Returns:
+        Tuple of ({doc_id: score}, timing) where timing holds latency_ms,
+        status and, for failed searches, error
+    """
+    started = time.perf_counter() if started is None else started
+    body = {"q": text, "limit": limit}
+    if user_id:
+        body["userId"] = user_id
+    try:
+        response = await client.post("/search", json=body)
+        timing = {"status": response.status_code}
+        if response.is_success:
+            docs = results_to_docs(response.json())
+        else:
+            docs = {}
+            timing["error"] = response.text[:200] or response.reason_phrase
+    except (httpx.HTTPError, ValueError) as e:
+        docs = {}
+        timing = {"error": str(e) or type(e).__name__}
+    timing["latency_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    return docs, timing
+
+
+async def run_search_load(
+    queries,
+    output_path,
+    base_url=SUPERMEMORY_API_URL,
+    api_key=SUPERMEMORY_API_KEY,
+    concurrency=10,
+    target_qps=None,
+    arrivals="uniform",
+    limit=10,
+    user_id=None,
+    connections=None,
+    timeout=SEARCH_TIMEOUT_SECONDS,
+    seed=None,
+    metadata=None,
+):
+    """
+    Search every query and write the results with their timings.
+
+    Args:
+        queries: Iterable of (query_id, text), e.g. from iter_queries
+        output_path: JSONL results file to write
+        base_url: Search API URL
+        api_key: Sent as x-api-key
+        concurrency: Workers of a closed-loop run
+        target_qps: Send rate of an open-loop run; None runs closed-loop
+        arrivals: "uniform" or "poisson" spacing of open-loop sends
+        limit: Results requested per query
+        user_id: Optional userId scoping the searches
+        connections: Connection pool size (default concurrency for closed
+            loop, SEARCH_MAX_CONNECTIONS for open loop)
+        timeout: Seconds before a search fails; queueing for a pooled
+            connection does not count
+        seed: Seed of the Poisson arrivals
+        metadata: Extra members of the results file's metadata line
+
+    Returns:
+        LatencyStats of the run
+    """
+    if arrivals not in ARRIVALS:
+        raise ValueError(f"Unknown arrivals '{arrivals}', expected one of {ARRIVALS}")
+    if target_qps is not None and target_qps <= 0:
+        raise ValueError("target_qps must be positive")
+    if target_qps is None and concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+    if connections is None:
+        connections = SEARCH_MAX_CONNECTIONS if target_qps else concurrency
+
+    latency = LatencyStats()
+    wall_start, perf_start = time.time(), time.perf_counter()
+    done = 0
+    last_log = perf_start
+    run_metadata = {
+        "mode": "open" if target_qps else "closed",
+        "concurrency": None if target_qps else concurrency,
+        "target_qps": target_qps,
+        "arrivals": arrivals if target_qps else None,
+        "limit": limit,
+        "started_at": datetime.now().isoformat(),
+        **(metadata or {}),
+    }
+
+    def record(query_id, docs, timing, started):
+        nonlocal done, last_log
+        # Wall-clock send time, derived from the monotonic clock
+        timing["timestamp"] = round(wall_start + started - perf_start, 6)
+        writer.write(query_id, docs, timing)
+        latency.add_record(timing)
+        done += 1
+        now = time.perf_counter()
+        if now - last_log >= PROGRESS_LOG_SECONDS:
+            last_log = now
+            logger.info(
+                f"{done} queries in {now - perf_start:.1f}s "
+                f"({done / (now - perf_start):.1f} QPS, {latency.errors} errors)"
+            )
+
+    async def search_and_record(client, query_id, text, started=None):
+        started = time.perf_counter() if started is None else started
+        docs, timing = await search_query(client, text, limit, user_id, started)
+        record(query_id, docs, timing, started)
+
+    limits = httpx.Limits(
+        max_connections=connections, max_keepalive_connections=connections
+    )
+    with ResultsJsonlWriter(output_path, metadata=run_metadata) as writer:
+        async with httpx.AsyncClient(
+            base_url=base_url.rstrip("/"),
+            headers={"x-api-key": api_key},
+            limits=limits,
+            timeout=httpx.Timeout(timeout, pool=None),
+        ) as client:
+            queries = iter(queries)
+            if target_qps is None:
+
+                async def worker():
+                    # Workers share the iterator; the event loop runs one at a time
+                    for query_id, text in queries:
+                        await search_and_record(client, query_id, text)
+
+                await asyncio.gather(*(worker() for _ in range(concurrency)))
+            else:
+                rng = random.Random(seed)
+                in_flight = set()
+                send_at = time.perf_counter()
+                for query_id, text in queries:
+                    delay = send_at - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    task = asyncio.create_task(
+                        search_and_record(client, query_id, text, send_at)
+                    )
+                    in_flight.add(task)
+                    task.add_done_callback(in_flight.discard)
+                    if arrivals == "poisson":
+                        send_at += rng.expovariate(target_qps)
+                    else:
+                        send_at += 1 / target_qps
+                await asyncio.gather(*in_flight)
+
+    logger.info(
+        f"Searched {done} queries in {time.perf_counter() - perf_start:.2f}s "
+        f"with {latency.errors} errors; results saved to {output_path}"
+    )
+    return latency
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run search queries under load and save results with timings"
+    )
+    parser.add_argument(
+        "dataset_name", help="Dataset under BEIR_DATA_ROOT_PATH whose queries to run"
+    )
+    parser.add_argument(
+        "--queries", help="queries.json or queries.jsonl (default: the dataset's)"
+    )
+    parser.add_argument(
+        "--output",
+        help="JSONL results file "
+        "(default: results/search_results_<dataset>_<timestamp>.jsonl)",
+    )
+    parser.add_argument("--url", default=SUPERMEMORY_API_URL, help="Search API URL")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=10,
+        help="Closed-loop workers (default: 10)",
+    )
+    parser.add_argument(
+        "--qps", type=float, help="Run open-loop at this many queries per second"
+    )
+    parser.add_argument(
+        "--arrivals",
+        choices=ARRIVALS,
+        default="uniform",
+        help="Spacing of open-loop sends (default: uniform)",
+    )
+    parser.add_argument(
+        "--limit", type=int, default=10, help="Results per query (default: 10)"
+    )
+    parser.add_argument("--user-id", help="userId scoping the searches")
+    parser.add_argument("--connections", type=int, help="Connection pool size")
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=SEARCH_TIMEOUT_SECONDS,
+        help="Seconds before a search fails",
+    )
+    parser.add_argument("--max-queries", type=int, help="Only run the first N queries")
+    parser.add_argument("--seed", type=int, help="Seed of Poisson arrivals")
+    parser.add_argument(
+        "--k-values",
+        nargs="+",
+        type=int,
+        help="Evaluate the run against the dataset's qrels at these k values",
+    )
+    args = parser.parse_args()
+
+    dataset_dir = Path(BEIR_DATA_ROOT_PATH) / args.dataset_name
+    queries = iter_queries(args.queries or dataset_dir)
+    if args.max_queries is not None:
+        queries = itertools.islice(queries, args.max_queries)
+    timestamp = datetime.now().isoformat().replace(":", "-")
+    output_path = args.output or os.path.join(
+        "results", f"search_results_{args.dataset_name}_{timestamp}.jsonl"
+    )
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+
+    latency = asyncio.run(
+        run_search_load(
+            queries,
+            output_path,
+            base_url=args.url,
+            concurrency=args.concurrency,
+            target_qps=args.qps,
+            arrivals=args.arrivals,
+            limit=args.limit,
+            user_id=args.user_id,
+            connections=args.connections,
+            timeout=args.timeout,
+            seed=args.seed,
+            metadata={"dataset": args.dataset_name},
+        )
+    )
+    summary = latency.summary()
+    if summary is not None:
+        summary.get("throughput", {}).pop("windows", None)
+    print(json.dumps({"latency": summary}, indent=4))
+
+    if args.k_values:
+        qrels_path = find_qrels_path(dataset_dir)
+        if qrels_path is None:
+            logger.error(f"No qrels found in {dataset_dir}; skipping evaluation")
+            return
+        metrics = evaluate_file_with_cache(output_path, str(qrels_path), args.k_values)
+        print(json.dumps(format_metrics(metrics), indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,461 @@
+"""
+Sharded evaluation across worker processes.
+
+The queries of a run are split into contiguous shards, each evaluated in
+its own process, and the per-query metrics of all shards are concatenated
+in shard order before averaging. The averages are therefore exactly those
+of a single-process evaluation of the same queries.
+
+Qrels are never pickled to the workers: the arrays of a QrelsIndex are
+saved once as .npy files under SHARD_TMP_DIR (RAM-backed /dev/shm when
+available) and every worker maps them, sharing one copy of the pages.
+Results are not pickled either when they come from a file the workers can
+read in parts:
+
+- binary results files are split by query ranges holding about the same
+  number of results,
+- JSONL results files are split by byte ranges, aligned to lines by the
+  reader,
+- JSON results files cannot be split without parsing them, so they are
+  loaded once and sent to the workers as one dict per shard.
+
+Every shard reports its own timing, so unbalanced shards or slow workers
+show up in the stats.
+"""
+
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+
+import numpy as np
+
+from py_metrics.beir_evaluator import (
+    ENGINES,
+    create_empty_metrics,
+    load_search_results,
+    normalize_results,
+)
+from py_metrics.dataset_store import (
+    load_qrels_arrays,
+    read_qrels_index,
+    save_qrels_arrays,
+)
+from py_metrics.fast_evaluator import (
+    METRIC_PREFIXES,
+    PerQueryMetrics,
+    aggregate_metrics,
+    build_run_arrays,
+    score_run,
+)
+from py_metrics.latency_metrics import LatencyStats
+from py_metrics.per_query_metrics import evaluate_pytrec
+from py_metrics.results_format import (
+    ResultsBinaryReader,
+    detect_results_format,
+    iter_results,
+    iter_results_jsonl,
+)
+from py_metrics.streaming_evaluator import group_result_batches
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Maximum number of worker processes, however many shards are requested
+SHARD_MAX_WORKERS = int(os.getenv("SHARD_MAX_WORKERS", str(os.cpu_count() or 1)))
+# Queries scored together inside a shard
+SHARD_BATCH_QUERIES = int(os.getenv("SHARD_BATCH_QUERIES", "4096"))
+# Directory for the shared qrels arrays
+SHARD_TMP_DIR = os.getenv(
+    "SHARD_TMP_DIR", "/dev/shm" if os.path.isdir("/dev/shm") else None
+)
+
+
+def plan_binary_shards(results_path, shards):
+    """Split a binary results file into query ranges of similar result counts"""
+    with ResultsBinaryReader(results_path) as reader:
+        indptr = np.array(reader.arrays["indptr"])
+    targets = np.linspace(0, indptr[-1], shards + 1)
+    bounds = np.searchsorted(indptr, targets)
+    bounds[0], bounds[-1] = 0, len(indptr) - 1
+    bounds = np.maximum.accumulate(bounds).tolist()
+    return [
+        ("binary", str(results_path), start, stop)
+        for start, stop in zip(bounds[:-1], bounds[1:])
+        if stop > start
+    ]
+
+
+def plan_jsonl_shards(results_path, shards):
+    """Split a JSONL results file into byte ranges of similar size"""
+    bounds = np.linspace(0, os.path.getsize(results_path), shards + 1)
+    bounds = bounds.astype(np.int64).tolist()
+    return [
+        ("jsonl", str(results_path), start, stop)
+        for start, stop in zip(bounds[:-1], bounds[1:])
+        if stop > start
+    ]
+
+
+def plan_dict_shards(results, shards):
+    """Split a {query_id: docs} dict into contiguous dicts of similar sizes"""
+    items = list(results.items())
+    sizes = np.cumsum(
+        [len(docs) + 1 if isinstance(docs, dict) else 1 for _, docs in items]
+    )
+    bounds = np.searchsorted(
+        sizes,
+        np.linspace(0, sizes[-1] if len(items) else 0, shards + 1)[1:-1],
+        side="right",
+    )
+    bounds = [0] + bounds.tolist() + [len(items)]
+    return [
+        ("results", dict(items[start:stop]))
+        for start, stop in zip(bounds[:-1], bounds[1:])
+        if stop > start
+    ]
+
+
+def _iter_shard(source, latency=None):
+    """(query_id, docs, offset) tuples of one shard"""
+    kind = source[0]
+    if kind == "binary":
+        _, path, start, stop = source
+        with ResultsBinaryReader(path) as reader:
+            yield from reader.iter_queries(start, stop, latency=latency)
+    elif kind == "jsonl":
+        _, path, start, stop = source
+        yield from iter_results_jsonl(path, start, stop, latency=latency)
+    elif kind == "file":
+        yield from iter_results(source[1], latency=latency)
+    else:
+        for query_id, docs in source[1].items():
+            yield query_id, docs, 0
+
+
+def qrels_subset(qrels_index, query_ids):
+    """{query_id: {doc_id: relevance}} of the given queries present in qrels"""
+    n_docs = max(len(qrels_index.doc_ids), 1)
+    subset = {}
+    for query_id in query_ids:
+        position = qrels_index.query_lookup.get(str(query_id))
+        if position is None:
+            continue
+        start, end = qrels_index.indptr[position], qrels_index.indptr[position + 1]
+        doc_ids = qrels_index.doc_ids[qrels_index.keys[start:end] % n_docs]
+        subset[str(query_id)] = dict(
+            zip(doc_ids.tolist(), qrels_index.relevance[start:end].tolist())
+        )
+    return subset
+
+
+def _score_numpy(qrels_index, batch, k_values):
+    run = build_run_arrays(batch, qrels_index, max(k_values))
+    if not run.query_ids:
+        return [], None
+    return run.query_ids, score_run(qrels_index, run, k_values)
+
+
+def _score_pytrec(qrels_index, batch, k_values):
+    # An evaluator over the batch's own qrels only, instead of building the
+    # full qrels dict in every worker
+    qrels = qrels_subset(qrels_index, batch)
+    if not qrels:
+        return [], None
+    processed_results = normalize_results(batch)
+    for query_id, docs in processed_results.items():
+        docs.pop(query_id, None)
+    per_query = evaluate_pytrec(qrels, processed_results, k_values)
+    return per_query.query_ids.tolist(), per_query.values
+
+
+@contextmanager
+def shared_qrels(qrels_index):
+    """
+    Save the arrays of a QrelsIndex for worker processes to map.
+
+    Yields:
+        The directory to pass to evaluate_shard; it is removed on exit
+    """
+    with tempfile.TemporaryDirectory(
+        prefix="py-metrics-qrels-", dir=SHARD_TMP_DIR
+    ) as qrels_dir:
+        save_qrels_arrays(qrels_index, qrels_dir)
+        yield qrels_dir
+
+
+def evaluate_shard(shard, source, qrels_dir, k_values, engine, batch_queries):
+    """
+    Evaluate one shard in a worker process.
+
+    Args:
+        shard: Position of the shard, echoed in its stats
+        source: Shard description from one of the plan_*_shards functions,
+            or ("file", path) for a whole results file in any format
+        qrels_dir: Directory yielded by shared_qrels
+        k_values: List of k values for evaluation
+        engine: "beir" or "numpy"
+        batch_queries: Queries scored together
+
+    Returns:
+        Dict of the shard's query_ids and per-query values in evaluation
+        order, the LatencyStats of its results' timings, and its timing
+        stats
+    """
+    started = time.perf_counter()
+    qrels_index = load_qrels_arrays(qrels_dir)
+    loaded = time.perf_counter()
+    score = _score_numpy if engine == "numpy" else _score_pytrec
+
+    queries_read = 0
+    query_ids = []
+    values = {name: [] for name in METRIC_PREFIXES}
+    latency = LatencyStats()
+    shard_queries = _iter_shard(source, latency)
+    for batch, _ in group_result_batches(shard_queries, batch_queries):
+        queries_read += len(batch)
+        batch_query_ids, batch_values = score(qrels_index, batch, k_values)
+        if batch_query_ids:
+            query_ids.extend(batch_query_ids)
+            for name in METRIC_PREFIXES:
+                values[name].append(batch_values[name])
+
+    finished = time.perf_counter()
+    return {
+        "query_ids": query_ids,
+        "values": values,
+        "latency": latency,
+        "stats": {
+            "shard": shard,
+            "pid": os.getpid(),
+            "queries_read": queries_read,
+            "queries_evaluated": len(query_ids),
+            "qrels_seconds": round(loaded - started, 4),
+            "seconds": round(finished - started, 4),
+        },
+    }
+
+
+def iter_shard_tasks(tasks, workers):
+    """
+    Run evaluate_shard on argument tuples in up to workers processes.
+
+    With a single worker the tasks run one after another in the calling
+    process, so no pool is nested inside an evaluation pool worker (see
+    worker_pools.CPU_TASK_WORKERS). Queued tasks are cancelled if the
+    iteration stops early.
+
+    Yields:
+        Tuples of (task position, Future holding its output) as tasks finish
+    """
+    if workers <= 1:
+        for position, task in enumerate(tasks):
+            future = Future()
+            try:
+                future.set_result(evaluate_shard(*task))
+            except Exception as e:
+                future.set_exception(e)
+            yield position, future
+        return
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = {
+            executor.submit(evaluate_shard, *task): position
+            for position, task in enumerate(tasks)
+        }
+        for future in as_completed(futures):
+            yield futures[future], future
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _run_shards(
+    sources,
+    qrels_index,
+    k_values,
+    engine,
+    progress=None,
+    return_per_query=False,
+    batch_queries=None,
+    latency=None,
+    workers=None,
+):
+    """Evaluate shard sources in worker processes and merge their metrics"""
+    if engine not in ENGINES:
+        raise ValueError(
+            f"Unknown evaluation engine '{engine}', expected one of {ENGINES}"
+        )
+    k_values = list(k_values)
+    batch_queries = batch_queries or SHARD_BATCH_QUERIES
+    workers = max(1, min(len(sources), workers or SHARD_MAX_WORKERS))
+    outputs = [None] * len(sources)
+    started = time.perf_counter()
+
+    with shared_qrels(qrels_index) as qrels_dir:
+        tasks = [
+            (shard, source, qrels_dir, k_values, engine, batch_queries)
+            for shard, source in enumerate(sources)
+        ]
+        if progress is not None:
+            progress(shards_done=0, shards_total=len(sources))
+        finished = iter_shard_tasks(tasks, workers)
+        try:
+            for done, (shard, future) in enumerate(finished, start=1):
+                outputs[shard] = future.result()
+                if progress is not None:
+                    progress(
+                        shards_done=done,
+                        shards_total=len(sources),
+                        queries_evaluated=sum(
+                            o["stats"]["queries_evaluated"] for o in outputs if o
+                        ),
+                        shards=[o["stats"] for o in outputs if o],
+                    )
+        finally:
+            # Drop queued shards if a shard failed or the job was cancelled
+            finished.close()
+
+    shard_stats = [output["stats"] for output in outputs]
+    if latency is not None:
+        for output in outputs:
+            latency.merge(output["latency"])
+    for stats in shard_stats:
+        logger.info(
+            f"Shard {stats['shard']}: {stats['queries_evaluated']} queries "
+            f"in {stats['seconds']}s"
+        )
+    logger.info(
+        f"Evaluated {len(sources)} shards with {workers} workers in "
+        f"{time.perf_counter() - started:.2f}s"
+    )
+
+    query_ids = [q for output in outputs for q in output["query_ids"]]
+    if not query_ids:
+        logger.error("No common queries between results and qrels")
+        return create_empty_metrics(k_values), None, shard_stats
+
+    # Rows stay in shard order, so the means equal a single-process run's
+    values = {
+        name: np.concatenate(
+            [row for output in outputs for row in output["values"][name]]
+        )
+        for name in METRIC_PREFIXES
+    }
+    metrics = aggregate_metrics(values, k_values)
+    per_query = None
+    if return_per_query:
+        per_query = PerQueryMetrics.from_unsorted(query_ids, k_values, values)
+    return metrics, per_query, shard_stats
+
+
+def evaluate_results_sharded(
+    results_path,
+    k_values,
+    shards,
+    engine="beir",
+    qrels_index=None,
+    progress=None,
+    return_per_query=False,
+    batch_queries=None,
+    latency=None,
+    workers=None,
+):
+    """
+    Evaluate a results file in shards across worker processes.
+
+    Args:
+        results_path: JSON, JSONL or binary results file (see results_format)
+        k_values: List of k values for evaluation
+        shards: Number of shards, each evaluated by one task; at most
+            workers run at once
+        engine: "beir" or "numpy"
+        qrels_index: QrelsIndex of the qrels, for both engines
+        progress: Optional callback receiving shards_done, shards_total,
+            queries_evaluated and the per-shard stats so far as keyword
+            arguments whenever a shard finishes
+        return_per_query: Also return the per-query metrics
+        batch_queries: Queries scored together inside a shard (default
+            SHARD_BATCH_QUERIES)
+        latency: Optional LatencyStats collecting the per-query timings,
+            merged from the shards
+        workers: Processes evaluating shards (default SHARD_MAX_WORKERS); 1
+            evaluates them in the calling process
+
+    Returns:
+        Tuple of (metrics, PerQueryMetrics or None, per-shard stats)
+    """
+    results_format = detect_results_format(results_path)
+    if results_format == "binary":
+        sources = plan_binary_shards(results_path, shards)
+    elif results_format == "jsonl":
+        sources = plan_jsonl_shards(results_path, shards)
+    else:
+        sources = plan_dict_shards(
+            load_search_results(results_path, latency=latency), shards
+        )
+    return _run_shards(
+        sources,
+        qrels_index,
+        k_values,
+        engine,
+        progress=progress,
+        return_per_query=return_per_query,
+        batch_queries=batch_queries,
+        latency=latency,
+        workers=workers,
+    )
+
+
+def evaluate_run_sharded(
+    results,
+    k_values,
+    shards,
+    engine="beir",
+    qrels_index=None,
+    progress=None,
+    return_per_query=False,
+    batch_queries=None,
+    workers=None,
+):
+    """evaluate_results_sharded for a {query_id: {doc_id: score}} dict"""
+    return _run_shards(
+        plan_dict_shards(results, shards),
+        qrels_index,
+        k_values,
+        engine,
+        progress=progress,
+        return_per_query=return_per_query,
+        batch_queries=batch_queries,
+        workers=workers,
+    )
+
+
+def evaluate_file_sharded(
+    results_path,
+    qrels_path,
+    k_values,
+    shards,
+    engine="beir",
+    progress=None,
+    return_per_query=False,
+    latency=None,
+    workers=None,
+):
+    """
+    evaluate_results_sharded with qrels loaded from a qrels.npz or
+    qrels.json file. Raises QrelsError if the qrels cannot be read.
+    """
+    return evaluate_results_sharded(
+        results_path,
+        k_values,
+        shards,
+        engine=engine,
+        qrels_index=read_qrels_index(qrels_path),
+        progress=progress,
+        return_per_query=return_per_query,
+        latency=latency,
+        workers=workers,
+    )
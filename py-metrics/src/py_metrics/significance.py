@@ -0,0 +1,367 @@
+"""
+Paired significance tests between retrieval runs.
+
+Runs are compared on the per-query metrics saved by the evaluators (see
+per_query_metrics). For every pair of runs the per-query differences are
+resampled with
+
+- a paired bootstrap: resample queries with replacement, giving a
+  percentile confidence interval for the mean difference and a p-value
+  from the bootstrap distribution shifted to the null hypothesis
+- a paired randomization (permutation) test: randomly swap the two runs'
+  scores per query, i.e. flip the sign of each difference
+
+Resampling is vectorized: each chunk of resamples is one matrix of shape
+(resamples, queries), holding how often each query was drawn (bootstrap) or
+which queries had their runs swapped (permutation), so the resampled means
+of all compared pairs come out of a single matrix product. Memory stays
+bounded by RESAMPLE_CHUNK_ELEMENTS. Chunks get independent seeds spawned
+from one SeedSequence, so results are reproducible and do not depend on the
+number of worker processes.
+
+Both p-values count the observed difference as one of the resamples,
+(extreme + 1) / (resamples + 1), so neither is ever exactly 0.
+
+Cost grows with resamples x queries: each bootstrap resample draws one
+random index per query and bincounts them, roughly 2 ms per 100k queries
+on one core (about 20 s for 10,000 resamples of 100,000 queries, divided
+by workers). The permutation test draws one bit per query and is about 5x
+cheaper. Drawing and counting the indices dominates, so fewer resamples
+(e.g. 2,000 for a p-value near 0.05) or more workers are the levers for
+very large query sets.
+"""
+
+import argparse
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from py_metrics.fast_evaluator import METRIC_PREFIXES
+from py_metrics.per_query_metrics import load_per_query_metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Upper bound on the number of elements of each resampling matrix
+RESAMPLE_CHUNK_ELEMENTS = int(os.getenv("RESAMPLE_CHUNK_ELEMENTS", str(1 << 24)))
+
+TESTS = ("bootstrap", "permutation")
+
+
+def align_runs(per_queries, metric, k, fill_missing=False):
+    """
+    Line up one metric of several runs by query id.
+
+    Args:
+        per_queries: List of PerQueryMetrics, one per run
+        metric: Metric name, e.g. "ndcg"
+        k: Cutoff, e.g. 10
+        fill_missing: Keep every query evaluated by any run, scoring missing
+            queries as 0.0. By default only queries evaluated by all runs
+            are kept.
+
+    Returns:
+        Tuple of (query_ids, scores) where scores has shape
+        (len(query_ids), len(per_queries))
+    """
+    if fill_missing:
+        query_ids = np.unique(np.concatenate([pq.query_ids for pq in per_queries]))
+    else:
+        query_ids = per_queries[0].query_ids
+        for pq in per_queries[1:]:
+            query_ids = np.intersect1d(query_ids, pq.query_ids)
+
+    scores = np.zeros((len(query_ids), len(per_queries)), dtype=np.float64)
+    for i, pq in enumerate(per_queries):
+        # query_ids of a PerQueryMetrics are sorted, so locate rows by bisection
+        pos = np.minimum(
+            np.searchsorted(pq.query_ids, query_ids), len(pq.query_ids) - 1
+        )
+        found = pq.query_ids[pos] == query_ids
+        scores[found, i] = pq.column(metric, k)[pos[found]]
+    return query_ids, scores
+
+
+def _chunk_sizes(n_resamples, n_queries):
+    """Split resamples into chunks whose matrices fit RESAMPLE_CHUNK_ELEMENTS"""
+    size = max(1, RESAMPLE_CHUNK_ELEMENTS // max(n_queries, 1))
+    sizes = [size] * (n_resamples // size)
+    if n_resamples % size:
+        sizes.append(n_resamples % size)
+    return sizes
+
+
+def _resample_chunks(test, diffs, sizes, seeds):
+    """
+    Resampled mean differences for a list of chunks.
+
+    Args:
+        test: "bootstrap" or "permutation"
+        diffs: float64 array (queries, pairs) of per-query differences
+        sizes: Number of resamples in each chunk
+        seeds: SeedSequence of each chunk
+
+    Returns:
+        float64 array (sum(sizes), pairs)
+    """
+    n_queries = len(diffs)
+    out = []
+    for size, seed in zip(sizes, seeds):
+        rng = np.random.default_rng(seed)
+        if test == "bootstrap":
+            # Count the draws of each query in every resample with one
+            # bincount over row-offset indices, then weight the differences
+            dtype = np.int32 if size * n_queries < 2**31 else np.int64
+            index = rng.integers(0, n_queries, size=(size, n_queries), dtype=dtype)
+            index += (np.arange(size, dtype=dtype) * n_queries)[:, None]
+            counts = np.bincount(index.ravel(), minlength=size * n_queries)
+            weights = counts.reshape(size, n_queries).astype(np.float64)
+            out.append(weights @ diffs / n_queries)
+        else:
+            # Swapping the runs of a query flips the sign of its difference:
+            # sum(sign * d) = 2 * sum(d[swapped]) - sum(d)
+            packed = rng.integers(
+                0, 256, size=(size, (n_queries + 7) // 8), dtype=np.uint8
+            )
+            swapped = np.unpackbits(packed, axis=1, count=n_queries)
+            sums = 2.0 * (swapped.astype(np.float64) @ diffs) - diffs.sum(axis=0)
+            out.append(sums / n_queries)
+    return np.concatenate(out) if out else np.zeros((0, diffs.shape[1]))
+
+
+def resample_mean_differences(test, diffs, n_resamples, seed=None, workers=1):
+    """
+    Resample mean differences with the bootstrap or the permutation test.
+
+    Args:
+        test: "bootstrap" or "permutation"
+        diffs: Array (queries,) or (queries, pairs) of per-query differences
+        n_resamples: Number of resamples
+        seed: Seed or SeedSequence for reproducible results
+        workers: Number of processes to spread the chunks over
+
+    Returns:
+        float64 array (n_resamples, pairs)
+    """
+    if test not in TESTS:
+        raise ValueError(f"Unknown test '{test}', expected one of {TESTS}")
+    diffs = np.asarray(diffs, dtype=np.float64)
+    if diffs.ndim == 1:
+        diffs = diffs[:, None]
+
+    sizes = _chunk_sizes(n_resamples, len(diffs))
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    seeds = seed.spawn(len(sizes))
+
+    if workers <= 1 or len(sizes) <= 1:
+        return _resample_chunks(test, diffs, sizes, seeds)
+
+    groups = np.array_split(np.arange(len(sizes)), min(workers, len(sizes)))
+    with ProcessPoolExecutor(max_workers=len(groups)) as executor:
+        futures = [
+            executor.submit(
+                _resample_chunks,
+                test,
+                diffs,
+                [sizes[i] for i in group],
+                [seeds[i] for i in group],
+            )
+            for group in groups
+        ]
+        return np.concatenate([future.result() for future in futures])
+
+
+def paired_tests(
+    scores_a,
+    scores_b,
+    n_resamples=10000,
+    confidence=0.95,
+    seed=None,
+    workers=1,
+):
+    """
+    Bootstrap and permutation tests of mean(scores_b - scores_a).
+
+    Args:
+        scores_a: Array (queries,) or (queries, pairs) of baseline scores
+        scores_b: Array of the same shape with the compared scores
+        n_resamples: Number of resamples for each test
+        confidence: Confidence level of the bootstrap interval
+        seed: Seed for reproducible results
+        workers: Number of processes to spread resampling over
+
+    Returns:
+        Dict of arrays with one entry per pair: diff, ci_low, ci_high,
+        bootstrap_p and permutation_p
+    """
+    diffs = np.asarray(scores_b, dtype=np.float64) - np.asarray(
+        scores_a, dtype=np.float64
+    )
+    if diffs.ndim == 1:
+        diffs = diffs[:, None]
+    if len(diffs) == 0:
+        raise ValueError("No queries to compare")
+
+    observed = diffs.mean(axis=0)
+    bootstrap_seed, permutation_seed = np.random.SeedSequence(seed).spawn(2)
+    boot = resample_mean_differences(
+        "bootstrap", diffs, n_resamples, seed=bootstrap_seed, workers=workers
+    )
+    perm = resample_mean_differences(
+        "permutation", diffs, n_resamples, seed=permutation_seed, workers=workers
+    )
+
+    alpha = 1.0 - confidence
+    ci_low, ci_high = np.percentile(
+        boot, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0
+    )
+    # Tolerance so resamples equal to the observed difference count as extreme
+    threshold = np.abs(observed) - 1e-12
+    # Bootstrap p-value: shift the bootstrap distribution to a zero mean
+    bootstrap_p = ((np.abs(boot - observed) >= threshold).sum(axis=0) + 1) / (
+        n_resamples + 1
+    )
+    permutation_p = ((np.abs(perm) >= threshold).sum(axis=0) + 1) / (n_resamples + 1)
+    return {
+        "diff": observed,
+        "ci_low": ci_low,
+        "ci_high": ci_high,
+        "bootstrap_p": bootstrap_p,
+        "permutation_p": permutation_p,
+    }
+
+
+def compare_runs(
+    per_queries,
+    names,
+    metric="ndcg",
+    k=10,
+    all_pairs=False,
+    n_resamples=10000,
+    confidence=0.95,
+    seed=None,
+    workers=1,
+    fill_missing=False,
+):
+    """
+    Test whether runs differ significantly on one metric.
+
+    Args:
+        per_queries: List of PerQueryMetrics, one per run
+        names: Display name of each run
+        metric: Metric name ("ndcg", "map", "recall" or "precision")
+        k: Cutoff of the metric
+        all_pairs: Compare every pair of runs instead of each run against
+            the first (baseline) run
+        n_resamples: Number of resamples for each test
+        confidence: Confidence level of the bootstrap interval
+        seed: Seed for reproducible results
+        workers: Number of processes to spread resampling over
+        fill_missing: Score queries missing from a run as 0.0 instead of
+            dropping them
+
+    Returns:
+        List of result dicts, one per compared pair
+    """
+    if len(per_queries) < 2:
+        raise ValueError("At least two runs are needed for a comparison")
+    if metric not in METRIC_PREFIXES:
+        raise ValueError(f"Unknown metric '{metric}'")
+
+    query_ids, scores = align_runs(per_queries, metric, k, fill_missing=fill_missing)
+    logger.info(f"Comparing {len(names)} runs on {len(query_ids)} queries")
+
+    if all_pairs:
+        pairs = [(i, j) for i in range(len(names)) for j in range(i + 1, len(names))]
+    else:
+        pairs = [(0, j) for j in range(1, len(names))]
+    a = scores[:, [i for i, _ in pairs]]
+    b = scores[:, [j for _, j in pairs]]
+    stats = paired_tests(
+        a, b, n_resamples=n_resamples, confidence=confidence, seed=seed, workers=workers
+    )
+
+    label = f"{METRIC_PREFIXES[metric]}@{k}"
+    return [
+        {
+            "run_a": names[i],
+            "run_b": names[j],
+            "metric": label,
+            "queries": len(query_ids),
+            "mean_a": round(float(a[:, p].mean()), 5),
+            "mean_b": round(float(b[:, p].mean()), 5),
+            "diff": round(float(stats["diff"][p]), 5),
+            "ci_low": round(float(stats["ci_low"][p]), 5),
+            "ci_high": round(float(stats["ci_high"][p]), 5),
+            "confidence": confidence,
+            "bootstrap_p": float(stats["bootstrap_p"][p]),
+            "permutation_p": float(stats["permutation_p"][p]),
+        }
+        for p, (i, j) in enumerate(pairs)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Paired bootstrap and permutation tests between runs"
+    )
+    parser.add_argument(
+        "per_query_files",
+        nargs="+",
+        help="Per-query metrics (.npz) of each run; the first is the baseline",
+    )
+    parser.add_argument(
+        "--metric", choices=list(METRIC_PREFIXES), default="ndcg", help="Metric"
+    )
+    parser.add_argument("--k", type=int, default=10, help="Metric cutoff")
+    parser.add_argument(
+        "--resamples", type=int, default=10000, help="Resamples per test"
+    )
+    parser.add_argument(
+        "--confidence", type=float, default=0.95, help="Confidence interval level"
+    )
+    parser.add_argument("--seed", type=int, help="Random seed")
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Processes used for resampling"
+    )
+    parser.add_argument(
+        "--all-pairs",
+        action="store_true",
+        help="Compare every pair of runs, not just each run against the first",
+    )
+    parser.add_argument(
+        "--fill-missing",
+        action="store_true",
+        help="Score queries missing from a run as 0 instead of dropping them",
+    )
+    parser.add_argument("--output", help="Also save the results to this JSON file")
+    args = parser.parse_args()
+
+    per_queries = [load_per_query_metrics(path)[0] for path in args.per_query_files]
+    names = [Path(path).name for path in args.per_query_files]
+    results = compare_runs(
+        per_queries,
+        names,
+        metric=args.metric,
+        k=args.k,
+        all_pairs=args.all_pairs,
+        n_resamples=args.resamples,
+        confidence=args.confidence,
+        seed=args.seed,
+        workers=args.workers,
+        fill_missing=args.fill_missing,
+    )
+
+    print(json.dumps(results, indent=4))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
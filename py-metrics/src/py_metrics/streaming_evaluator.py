@@ -0,0 +1,232 @@
+"""
+Streaming evaluation of results files too large to load at once.
+
+The results file (JSON, JSONL or binary, see results_format) is parsed
+incrementally, one query at a time, instead of being loaded whole and then
+copied into normalized dictionaries. Queries are scored in small batches.
+Each batch's metrics are added to running sums and the batch is then
+dropped, so peak memory is the qrels plus STREAM_BATCH_QUERIES queries of
+results, whatever the size of the file.
+
+Both engines give the same scores as evaluate_beir_results on the fully
+loaded file: the "numpy" engine scores batches with fast_evaluator, the
+"beir" engine with one pytrec_eval RelevanceEvaluator, mirroring BEIR's
+EvaluateRetrieval (identical query/doc ids dropped, averages over the
+scored queries rounded to 5 decimals).
+"""
+
+import logging
+import os
+
+import numpy as np
+import pytrec_eval
+
+from py_metrics.beir_evaluator import (
+    ENGINES,
+    create_empty_metrics,
+    normalize_qrels,
+    normalize_results,
+)
+from py_metrics.dataset_store import read_qrels, read_qrels_index
+from py_metrics.fast_evaluator import (
+    METRIC_PREFIXES,
+    PerQueryMetrics,
+    build_run_arrays,
+    score_run,
+)
+from py_metrics.per_query_metrics import per_query_from_pytrec, pytrec_measures
+from py_metrics.results_format import iter_results
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Number of queries parsed and scored together
+STREAM_BATCH_QUERIES = int(os.getenv("STREAM_BATCH_QUERIES", "256"))
+# Results files at least this large are streamed unless the caller decides
+STREAM_MIN_FILE_MB = int(os.getenv("STREAM_MIN_FILE_MB", "256"))
+
+
+def should_stream(results_path, stream=None):
+    """Whether to stream a results file: stream if given, else by file size"""
+    if stream is not None:
+        return stream
+    return os.path.getsize(results_path) >= STREAM_MIN_FILE_MB * 1024 * 1024
+
+
+def group_result_batches(queries, batch_queries=None):
+    """
+    Group streamed (query_id, docs, offset) tuples into small dicts.
+
+    Yields:
+        Tuples of ({query_id: {doc_id: score}}, offset of the last query)
+    """
+    batch_queries = batch_queries or STREAM_BATCH_QUERIES
+    batch = {}
+    offset = 0
+    for query_id, docs, offset in queries:
+        batch[query_id] = docs
+        if len(batch) >= batch_queries:
+            yield batch, offset
+            batch = {}
+    if batch:
+        yield batch, offset
+
+
+def iter_result_batches(results_path, batch_queries=None, latency=None):
+    """
+    Group the streamed queries of a results file, in any format read by
+    results_format, into small dicts. Per-query timings are added to
+    latency, a LatencyStats, when given.
+
+    Yields:
+        Tuples of ({query_id: {doc_id: score}}, offset)
+    """
+    return group_result_batches(
+        iter_results(results_path, latency=latency), batch_queries
+    )
+
+
+def _numpy_scorer(qrels_index, k_values):
+    max_k = max(k_values)
+
+    def score(batch):
+        run = build_run_arrays(batch, qrels_index, max_k)
+        if not run.query_ids:
+            return [], None
+        return run.query_ids, score_run(qrels_index, run, k_values)
+
+    return score
+
+
+def _pytrec_scorer(processed_qrels, k_values):
+    evaluator = pytrec_eval.RelevanceEvaluator(
+        processed_qrels, pytrec_measures(k_values)
+    )
+
+    def score(batch):
+        processed_results = normalize_results(batch)
+        for query_id, docs in processed_results.items():
+            docs.pop(query_id, None)
+        per_query = per_query_from_pytrec(
+            evaluator.evaluate(processed_results),
+            k_values,
+            processed_qrels,
+            processed_results,
+        )
+        return per_query.query_ids.tolist(), per_query.values
+
+    return score
+
+
+def evaluate_results_stream(
+    results_path,
+    k_values,
+    engine="beir",
+    qrels_index=None,
+    processed_qrels=None,
+    progress=None,
+    return_per_query=False,
+    batch_queries=None,
+    latency=None,
+):
+    """
+    Evaluate a results file without loading it whole.
+
+    Args:
+        results_path: Path to a JSON, JSONL or binary results file (see
+            results_format)
+        k_values: List of k values for evaluation
+        engine: "beir" or "numpy"
+        qrels_index: QrelsIndex for the "numpy" engine
+        processed_qrels: Qrels passed through normalize_qrels, for the
+            "beir" engine
+        progress: Optional callback receiving queries_evaluated, bytes_read
+            and bytes_total keyword arguments after every batch
+        return_per_query: Also collect the per-query metrics (a few floats
+            per query)
+        batch_queries: Queries per batch (default STREAM_BATCH_QUERIES)
+        latency: Optional LatencyStats collecting the per-query timings
+
+    Returns:
+        Tuple of (metrics, PerQueryMetrics or None)
+    """
+    if engine not in ENGINES:
+        raise ValueError(
+            f"Unknown evaluation engine '{engine}', expected one of {ENGINES}"
+        )
+    if engine == "numpy":
+        score = _numpy_scorer(qrels_index, k_values)
+    else:
+        score = _pytrec_scorer(processed_qrels, k_values)
+
+    bytes_total = os.path.getsize(results_path)
+    sums = {name: np.zeros(len(k_values)) for name in METRIC_PREFIXES}
+    n_scored = 0
+    query_ids = []
+    values = {name: [] for name in METRIC_PREFIXES}
+    if progress is not None:
+        progress(queries_evaluated=0, bytes_read=0, bytes_total=bytes_total)
+
+    for batch, offset in iter_result_batches(results_path, batch_queries, latency):
+        batch_query_ids, batch_values = score(batch)
+        if batch_query_ids:
+            n_scored += len(batch_query_ids)
+            for name in METRIC_PREFIXES:
+                sums[name] += batch_values[name].sum(axis=0)
+            if return_per_query:
+                query_ids.extend(batch_query_ids)
+                for name in METRIC_PREFIXES:
+                    values[name].append(batch_values[name])
+        if progress is not None:
+            progress(
+                queries_evaluated=n_scored, bytes_read=offset, bytes_total=bytes_total
+            )
+
+    if n_scored == 0:
+        logger.error("No common queries between results and qrels")
+        return create_empty_metrics(k_values), None
+    logger.info(f"Streamed and scored {n_scored} queries from {results_path}")
+
+    metrics = {
+        name: {
+            f"{prefix}@{k}": round(float(total / n_scored), 5)
+            for k, total in zip(k_values, sums[name])
+        }
+        for name, prefix in METRIC_PREFIXES.items()
+    }
+    per_query = None
+    if return_per_query:
+        per_query = PerQueryMetrics.from_unsorted(
+            query_ids,
+            k_values,
+            {name: np.concatenate(rows) for name, rows in values.items()},
+        )
+    return metrics, per_query
+
+
+def evaluate_file_stream(
+    results_path,
+    qrels_path,
+    k_values,
+    engine="beir",
+    progress=None,
+    return_per_query=False,
+    latency=None,
+):
+    """
+    evaluate_results_stream with qrels loaded from a qrels.npz or qrels.json
+    file. Raises QrelsError if the qrels cannot be read.
+    """
+    if engine == "numpy":
+        qrels_kwargs = {"qrels_index": read_qrels_index(qrels_path)}
+    else:
+        qrels_kwargs = {"processed_qrels": normalize_qrels(read_qrels(qrels_path))}
+    return evaluate_results_stream(
+        results_path,
+        k_values,
+        engine=engine,
+        progress=progress,
+        return_per_query=return_per_query,
+        latency=latency,
+        **qrels_kwargs,
+    )
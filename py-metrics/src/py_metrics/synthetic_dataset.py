@@ -0,0 +1,790 @@
+"""
+Synthetic BEIR datasets of any size, with runs of known quality.
+
+Scale tests need corpora, queries and qrels far larger than the small BEIR
+datasets, without downloading them. generate_dataset streams a dataset out
+in the layout of the BEIR downloads: a {name}.zip holding corpus.jsonl,
+queries.jsonl and qrels/{split}.tsv. It then converts the zip into the
+indexed layout with convert_beir_zip, as download_beir_dataset does. A zip
+left in the data root is also picked up by download_beir_dataset itself.
+
+A DatasetSpec controls the document and query counts, the distributions of
+title, text and query lengths (see parse_distribution), the number of
+relevant and judged non-relevant documents per query and the mix of
+relevance grades. Texts are drawn from a pseudo-word vocabulary with a
+Zipf-like word frequency. Each query is written from the words of its
+first relevant document, so lexical search engines find some of them.
+
+generate_run writes a results file for the qrels, following a RunSpec:
+results depth, the probability of retrieving each judged document and how
+high relevant documents rank. Since the generator places every judged
+document itself, it also computes the metrics an evaluation of the run
+must return and saves them next to the results as the expected metrics.
+
+Generation is seeded: the same spec and seed give the same files.
+Documents are generated in blocks of GENERATE_BLOCK_DOCS with one random
+stream per block, so memory stays flat however large the corpus. Qrels
+and query texts are held in memory, at a few entries per query.
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import time
+import zipfile
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+from py_metrics.dataset_converter import convert_beir_zip
+from py_metrics.fast_evaluator import METRIC_PREFIXES
+from py_metrics.results_format import ResultsBinaryWriter, ResultsJsonlWriter
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BEIR_DATA_ROOT_PATH = os.getenv("BEIR_DATA_ROOT_PATH", "./beir_data")
+# Distribution name -> number of parameters
+DISTRIBUTIONS = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2, "poisson": 1}
+# Documents generated per block; part of the seeding, so changing it
+# changes the generated texts
+GENERATE_BLOCK_DOCS = 10000
+# Queries between progress log lines
+PROGRESS_INTERVAL_QUERIES = 100000
+SYLLABLES = ("ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "ze", "pa", "du", "fe")
+SPEC_FILE = "synthetic.json"
+RESULTS_FORMATS = ("json", "jsonl", "binary")
+DEFAULT_K_VALUES = [1, 3, 5, 10, 100]
+
+
+def parse_distribution(spec):
+    """
+    Parse a length or count distribution into a sampler.
+
+    Args:
+        spec: "fixed:N", "uniform:LOW,HIGH" (inclusive), "normal:MEAN,STD",
+            "lognormal:MEDIAN,SIGMA" or "poisson:MEAN"
+
+    Returns:
+        Function of a numpy Generator and a size returning an int64 array
+        of non-negative samples
+    """
+    name, _, params = spec.partition(":")
+    if name not in DISTRIBUTIONS:
+        raise ValueError(
+            f"Unknown distribution '{name}', expected one of {list(DISTRIBUTIONS)}"
+        )
+    try:
+        values = [float(value) for value in params.split(",")] if params else []
+    except ValueError:
+        raise ValueError(f"Invalid distribution parameters in '{spec}'")
+    if len(values) != DISTRIBUTIONS[name] or any(v < 0 for v in values):
+        raise ValueError(
+            f"'{name}' takes {DISTRIBUTIONS[name]} non-negative parameter(s), "
+            f"got '{spec}'"
+        )
+
+    if name == "fixed":
+        sample = lambda rng, size: np.full(size, values[0])  # noqa: E731
+    elif name == "uniform":
+        low, high = sorted(values)
+        sample = lambda rng, size: rng.integers(  # noqa: E731
+            math.floor(low), math.floor(high) + 1, size=size
+        )
+    elif name == "normal":
+        sample = lambda rng, size: rng.normal(values[0], values[1], size)  # noqa: E731
+    elif name == "lognormal":
+        mu = math.log(max(values[0], 1e-9))
+        sample = lambda rng, size: rng.lognormal(mu, values[1], size)  # noqa: E731
+    else:
+        sample = lambda rng, size: rng.poisson(values[0], size)  # noqa: E731
+    return lambda rng, size: np.maximum(np.rint(sample(rng, size)), 0).astype(np.int64)
+
+
+def parse_grades(spec):
+    """Parse "GRADE:WEIGHT,..." (e.g. "1:0.6,2:0.3,3:0.1") into {grade: weight}"""
+    grades = {}
+    try:
+        for item in spec.split(","):
+            grade, _, weight = item.partition(":")
+            grades[int(grade)] = float(weight) if weight else 1.0
+    except ValueError:
+        raise ValueError(f"Invalid relevance grades '{spec}'")
+    return grades
+
+
+@dataclass
+class DatasetSpec:
+    """Shape of a synthetic dataset; distributions as in parse_distribution"""
+
+    num_docs: int = 10000
+    num_queries: int = 1000
+    title_words: str = "uniform:2,8"
+    doc_words: str = "lognormal:55,0.5"
+    query_words: str = "uniform:3,12"
+    # Documents with a grade of at least 1 per query; at least 1 is drawn
+    relevant_per_query: str = "poisson:2"
+    # Judged documents with grade 0 per query
+    nonrelevant_per_query: str = "fixed:0"
+    # Relevance grade -> share of the relevant documents
+    grades: Dict[int, float] = field(default_factory=lambda: {1: 0.6, 2: 0.3, 3: 0.1})
+    vocabulary_size: int = 20000
+    # Exponent of the Zipf word frequency, above 1
+    zipf_exponent: float = 1.3
+    # Share of each query's words taken from its first relevant document
+    query_overlap: float = 0.7
+    split: str = "test"
+    seed: int = 42
+
+    def validate(self):
+        if self.num_docs < 1 or self.num_queries < 1:
+            raise ValueError("num_docs and num_queries must be at least 1")
+        if not self.grades or min(self.grades) < 1:
+            raise ValueError("Relevance grades must be at least 1")
+        if self.zipf_exponent <= 1:
+            raise ValueError("zipf_exponent must be above 1")
+        for spec in (
+            self.title_words,
+            self.doc_words,
+            self.query_words,
+            self.relevant_per_query,
+            self.nonrelevant_per_query,
+        ):
+            parse_distribution(spec)
+
+
+@dataclass
+class RunSpec:
+    """Quality of a synthetic run"""
+
+    # Results per query
+    depth: int = 100
+    # Probability of retrieving each relevant document
+    recall: float = 0.8
+    # Probability of retrieving each judged non-relevant document
+    nonrelevant_recall: float = 0.5
+    # Mean rank at which retrieved judged documents are placed, drawn from
+    # a geometric distribution. 0 ranks the retrieved relevant documents
+    # first, highest grade first, then the retrieved non-relevant ones.
+    mean_rank: float = 5.0
+    seed: Optional[int] = None
+
+    def validate(self):
+        if self.depth < 1:
+            raise ValueError("depth must be at least 1")
+        if not 0 <= self.recall <= 1 or not 0 <= self.nonrelevant_recall <= 1:
+            raise ValueError("recall and nonrelevant_recall must be within [0, 1]")
+        if self.mean_rank != 0 and self.mean_rank < 1:
+            raise ValueError("mean_rank must be 0 or at least 1")
+
+
+def doc_id(i):
+    return f"d{i}"
+
+
+def doc_row(doc):
+    """Corpus row of a synthetic document id"""
+    return int(doc[1:])
+
+
+def query_id(i):
+    return f"q{i}"
+
+
+def _vocabulary(spec):
+    rng = np.random.default_rng([spec.seed, 0])
+    syllables = np.array(SYLLABLES)
+    counts = rng.integers(2, 5, size=spec.vocabulary_size)
+    return np.array(["".join(rng.choice(syllables, size=n)) for n in counts])
+
+
+def _word_ids(rng, spec, size):
+    return (rng.zipf(spec.zipf_exponent, size=size) - 1) % spec.vocabulary_size
+
+
+def _join(vocabulary, word_ids, lengths):
+    """Texts of consecutive runs of word_ids of the given lengths"""
+    words = vocabulary[word_ids]
+    ends = np.cumsum(lengths)
+    return [" ".join(words[end - n : end]) for n, end in zip(lengths, ends)]
+
+
+def _draw_qrels(spec):
+    """
+    Draw the judged documents of every query.
+
+    Returns:
+        List of (doc rows, grades) array pairs per query; relevant documents
+        come first and the first of them anchors the query's text
+    """
+    rng = np.random.default_rng([spec.seed, 1])
+    relevant_counts = np.maximum(
+        parse_distribution(spec.relevant_per_query)(rng, spec.num_queries), 1
+    )
+    nonrelevant_counts = parse_distribution(spec.nonrelevant_per_query)(
+        rng, spec.num_queries
+    )
+    grade_values = np.array(sorted(spec.grades))
+    weights = np.array([spec.grades[g] for g in grade_values], dtype=np.float64)
+    weights /= weights.sum()
+
+    qrels = []
+    for relevant, nonrelevant in zip(relevant_counts, nonrelevant_counts):
+        wanted = min(int(relevant + nonrelevant), spec.num_docs)
+        rows = np.unique(rng.integers(spec.num_docs, size=wanted))
+        while len(rows) < wanted:
+            extra = rng.integers(spec.num_docs, size=wanted - len(rows))
+            rows = np.unique(np.concatenate([rows, extra]))
+        rows = rng.permutation(rows)
+        num_relevant = min(int(relevant), len(rows))
+        grades = np.zeros(len(rows), dtype=np.int64)
+        grades[:num_relevant] = rng.choice(grade_values, size=num_relevant, p=weights)
+        qrels.append((rows, grades))
+    return qrels
+
+
+def _write_member(zip_ref, name, lines):
+    """Stream lines into an archive member in chunks"""
+    with zip_ref.open(name, "w") as f:
+        chunk = []
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) >= GENERATE_BLOCK_DOCS:
+                f.write(("\n".join(chunk) + "\n").encode("utf-8"))
+                chunk = []
+        if chunk:
+            f.write(("\n".join(chunk) + "\n").encode("utf-8"))
+
+
+def write_beir_zip(zip_path, name, spec, compress=True):
+    """
+    Stream a synthetic dataset into a zip laid out like the BEIR downloads.
+
+    Args:
+        zip_path: Zip file to write
+        name: Dataset name, the archive's top-level directory
+        spec: DatasetSpec
+        compress: Deflate the members, as the BEIR zips are
+
+    Returns:
+        {query_id: {doc_id: grade}} of the generated qrels
+    """
+    spec.validate()
+    vocabulary = _vocabulary(spec)
+    title_lengths = parse_distribution(spec.title_words)
+    doc_lengths = parse_distribution(spec.doc_words)
+    qrels_rows = _draw_qrels(spec)
+
+    # Anchor documents and the queries written from their words
+    anchors = np.array([rows[0] for rows, _ in qrels_rows], dtype=np.int64)
+    anchor_order = np.argsort(anchors, kind="stable")
+    sorted_anchors = anchors[anchor_order]
+    query_rng = np.random.default_rng([spec.seed, 2])
+    query_lengths = np.maximum(
+        parse_distribution(spec.query_words)(query_rng, spec.num_queries), 1
+    )
+    query_texts = [None] * spec.num_queries
+
+    def corpus_lines():
+        for block, start in enumerate(range(0, spec.num_docs, GENERATE_BLOCK_DOCS)):
+            size = min(GENERATE_BLOCK_DOCS, spec.num_docs - start)
+            rng = np.random.default_rng([spec.seed, 3, block])
+            titles = title_lengths(rng, size)
+            lengths = np.maximum(doc_lengths(rng, size), 1)
+            title_ids = _word_ids(rng, spec, int(titles.sum()))
+            text_ids = _word_ids(rng, spec, int(lengths.sum()))
+            titles = _join(vocabulary, title_ids, titles)
+            texts = _join(vocabulary, text_ids, lengths)
+
+            # Queries anchored on documents of this block
+            text_starts = np.cumsum(lengths) - lengths
+            lo, hi = np.searchsorted(sorted_anchors, [start, start + size])
+            for query in anchor_order[lo:hi]:
+                row = anchors[query] - start
+                words = text_ids[text_starts[row] : text_starts[row] + lengths[row]]
+                n = query_lengths[query]
+                picked = query_rng.choice(words, size=n)
+                own = query_rng.random(n) >= spec.query_overlap
+                picked[own] = _word_ids(query_rng, spec, int(own.sum()))
+                query_texts[query] = " ".join(vocabulary[picked])
+
+            for i, (title, text) in enumerate(zip(titles, texts)):
+                yield json.dumps(
+                    {"_id": doc_id(start + i), "title": title, "text": text}
+                )
+
+    qrels = {
+        query_id(i): {doc_id(row): int(grade) for row, grade in zip(rows, grades)}
+        for i, (rows, grades) in enumerate(qrels_rows)
+    }
+    compression = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+    with zipfile.ZipFile(zip_path, "w", compression=compression) as zip_ref:
+        _write_member(zip_ref, f"{name}/corpus.jsonl", corpus_lines())
+        _write_member(
+            zip_ref,
+            f"{name}/queries.jsonl",
+            (
+                json.dumps({"_id": query_id(i), "text": text})
+                for i, text in enumerate(query_texts)
+            ),
+        )
+        _write_member(
+            zip_ref,
+            f"{name}/qrels/{spec.split}.tsv",
+            [
+                "query-id\tcorpus-id\tscore",
+                *(
+                    f"{qid}\t{did}\t{grade}"
+                    for qid, docs in qrels.items()
+                    for did, grade in docs.items()
+                ),
+            ],
+        )
+    return qrels
+
+
+def _expected_ranks(rng, num_judged, spec):
+    """Ranks (0-based, distinct) of the retrieved judged documents, in order"""
+    if spec.mean_rank == 0:
+        return np.arange(num_judged)
+    # Geometric ranks, moved down to the next free rank on collisions:
+    # rank_i = max(wanted_i, rank_(i-1) + 1)
+    wanted = np.sort(rng.geometric(1 / spec.mean_rank, size=num_judged) - 1)
+    steps = np.arange(num_judged)
+    return steps + np.maximum.accumulate(wanted - steps)
+
+
+def _query_metrics(placed, ideal, num_relevant, k_values, discounts, sums):
+    """
+    Add one query's metrics at every k to sums, following the definitions
+    of fast_evaluator: graded NDCG with a log2 discount, MAP and recall
+    over all relevant documents, precision over k, and the rank metrics.
+
+    Args:
+        placed: (rank, grade) of the judged documents in the run, by rank
+        ideal: Positive grades of the query, highest first
+        num_relevant: Documents with a grade of at least 1
+        k_values: Sorted k values
+        discounts: 1 / log2(rank + 2) of every rank
+        sums: {metric: [sum at each k]} to add to
+    """
+    dcg = avg_prec = 0.0
+    hits = judged = 0
+    first = None
+    # Running totals after each judged document
+    totals = []
+    for rank, grade in placed:
+        judged += 1
+        if grade >= 1:
+            dcg += grade * discounts[rank]
+            hits += 1
+            avg_prec += hits / (rank + 1)
+            first = rank + 1 if first is None else first
+        totals.append((rank, dcg, avg_prec, hits, judged))
+    relevant_ranks = [rank for rank, grade in placed if grade >= 1]
+    ideal_dcg = np.cumsum(np.asarray(ideal) * discounts[: len(ideal)]).tolist()
+
+    for i, k in enumerate(k_values):
+        dcg_k, avg_prec_k, hits_k, judged_k = 0.0, 0.0, 0, 0
+        for rank, *values in totals:
+            if rank >= k:
+                break
+            dcg_k, avg_prec_k, hits_k, judged_k = values
+        idcg_k = ideal_dcg[min(k, len(ideal)) - 1] if ideal else 0.0
+        r_cut = min(num_relevant, k)
+        found = first is not None and first <= k
+        values = {
+            "ndcg": dcg_k / idcg_k if idcg_k > 0 else 0.0,
+            "map": avg_prec_k / num_relevant,
+            "recall": hits_k / num_relevant,
+            "precision": hits_k / k,
+            "mrr": 1.0 / first if found else 0.0,
+            "hit": 1.0 if found else 0.0,
+            "r_precision": (
+                sum(rank < r_cut for rank in relevant_ranks) / r_cut if r_cut else 0.0
+            ),
+            "judged": judged_k / k,
+        }
+        for name, value in values.items():
+            sums[name][i] += value
+
+
+def iter_run(qrels, num_docs, spec=None, k_values=None, expected=None):
+    """
+    Stream a synthetic run over qrels, ranking every query's judged
+    documents as the RunSpec says and filling the remaining ranks with
+    unjudged documents.
+
+    Args:
+        qrels: {query_id: {doc_id: grade}} of a synthetic dataset
+        num_docs: Corpus size of the dataset
+        spec: RunSpec (default RunSpec())
+        k_values: k values of the expected metrics
+        expected: Optional dict that receives the expected metrics, in the
+            shape evaluate_beir_results returns them, once the run is
+            exhausted
+
+    Yields:
+        (query_id, {doc_id: score}) with strictly decreasing scores
+    """
+    spec = spec or RunSpec()
+    spec.validate()
+    k_values = sorted(k_values or DEFAULT_K_VALUES)
+    rng = np.random.default_rng([0 if spec.seed is None else spec.seed, 4])
+    sums = {name: [0.0] * len(k_values) for name in METRIC_PREFIXES}
+    scores = [round((spec.depth - rank) / spec.depth, 6) for rank in range(spec.depth)]
+    ranks = np.arange(max(spec.depth, k_values[-1]))
+    discounts = (1.0 / np.log2(ranks + 2.0)).tolist()
+    evaluated = 0
+
+    # Sorted, so the run only depends on the qrels, not on their order
+    for qid in sorted(qrels):
+        docs = qrels[qid]
+        judged_docs = sorted(docs.items(), key=lambda item: (-item[1], item[0]))
+        grades = np.array([grade for _, grade in judged_docs], dtype=np.int64)
+        keep = rng.random(len(grades)) < np.where(
+            grades >= 1, spec.recall, spec.nonrelevant_recall
+        )
+        retrieved = [doc for doc, kept in zip(judged_docs, keep) if kept]
+        if spec.mean_rank:
+            retrieved = [retrieved[i] for i in rng.permutation(len(retrieved))]
+        wanted_ranks = _expected_ranks(rng, len(retrieved), spec)
+
+        ranking = [None] * spec.depth
+        for (doc, grade), rank in zip(retrieved, wanted_ranks.tolist()):
+            if rank < spec.depth:
+                ranking[rank] = (doc, grade)
+        # Unjudged fillers: distinct documents from the rest of the corpus
+        free = [rank for rank, slot in enumerate(ranking) if slot is None]
+        judged_rows = np.array([doc_row(doc) for doc in docs], dtype=np.int64)
+        fillers = np.empty(0, dtype=np.int64)
+        while len(fillers) < len(free) and len(docs) + len(fillers) < num_docs:
+            drawn = rng.integers(num_docs, size=2 * (len(free) - len(fillers)) + 8)
+            drawn = np.concatenate([fillers, drawn])
+            _, first = np.unique(drawn, return_index=True)
+            drawn = drawn[np.sort(first)]
+            fillers = drawn[~np.isin(drawn, judged_rows)][: len(free)]
+        for rank, row in zip(free, fillers.tolist()):
+            ranking[rank] = (doc_id(row), None)
+        # Short of fillers in a tiny corpus, the run is shorter than depth
+        ranking = [slot for slot in ranking if slot is not None]
+
+        placed = [
+            (rank, grade)
+            for rank, (_, grade) in enumerate(ranking)
+            if grade is not None
+        ]
+        ideal = [float(g) for g in grades if g > 0]
+        num_relevant = int((grades >= 1).sum())
+        _query_metrics(placed, ideal, num_relevant, k_values, discounts, sums)
+        evaluated += 1
+        if evaluated % PROGRESS_INTERVAL_QUERIES == 0:
+            logger.info(f"Generated results of {evaluated}/{len(qrels)} queries")
+        yield qid, {doc: score for (doc, _), score in zip(ranking, scores)}
+
+    if expected is not None and evaluated:
+        expected.update(
+            {
+                name: {
+                    f"{prefix}@{k}": round(total / evaluated, 5)
+                    for k, total in zip(k_values, sums[name])
+                }
+                for name, prefix in METRIC_PREFIXES.items()
+            }
+        )
+
+
+def expected_metrics_path(results_path):
+    """File the expected metrics of a synthetic results file are saved to"""
+    results_path = Path(results_path)
+    return results_path.with_name(results_path.name + ".expected.json")
+
+
+def generate_run(
+    qrels,
+    num_docs,
+    output_path,
+    spec=None,
+    k_values=None,
+    results_format="jsonl",
+    metadata=None,
+):
+    """
+    Write a synthetic run and its expected metrics.
+
+    Args:
+        qrels: {query_id: {doc_id: grade}} of a synthetic dataset
+        num_docs: Corpus size of the dataset
+        output_path: Results file to write
+        spec: RunSpec (default RunSpec())
+        k_values: k values of the expected metrics (default DEFAULT_K_VALUES)
+        results_format: "json" (as written by the search script), "jsonl"
+            or "binary" (see results_format)
+        metadata: Extra members of the results file's metadata
+
+    Returns:
+        Dict of the expected metrics, also saved to
+        expected_metrics_path(output_path)
+    """
+    if results_format not in RESULTS_FORMATS:
+        raise ValueError(
+            f"Unknown results format '{results_format}', expected one of "
+            f"{RESULTS_FORMATS}"
+        )
+    spec = spec or RunSpec()
+    k_values = sorted(k_values or DEFAULT_K_VALUES)
+    metadata = {"synthetic_run": asdict(spec), **(metadata or {})}
+    expected = {}
+    run = iter_run(qrels, num_docs, spec, k_values, expected)
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    if results_format == "json":
+        # The search script's layout, streamed: "results" first, so readers
+        # take the file for the wrapped layout, then the metadata members
+        with open(output_path, "w") as f:
+            f.write('{"results": {')
+            for i, (qid, docs) in enumerate(run):
+                f.write(f"{', ' if i else ''}{json.dumps(qid)}: {json.dumps(docs)}")
+            f.write("}")
+            for key, value in metadata.items():
+                f.write(f", {json.dumps(key)}: {json.dumps(value)}")
+            f.write("}")
+    else:
+        writer_class = (
+            ResultsJsonlWriter if results_format == "jsonl" else ResultsBinaryWriter
+        )
+        with writer_class(output_path, metadata=metadata) as writer:
+            for qid, docs in run:
+                writer.write(qid, docs)
+
+    with open(expected_metrics_path(output_path), "w") as f:
+        json.dump(
+            {"k_values": k_values, "queries": len(qrels), "metrics": expected},
+            f,
+            indent=2,
+        )
+    return expected
+
+
+def generate_dataset(
+    name,
+    spec=None,
+    output_dir=BEIR_DATA_ROOT_PATH,
+    convert=True,
+    legacy_json=False,
+    compress=True,
+    runs=None,
+    k_values=None,
+):
+    """
+    Generate a synthetic dataset, convert it and write runs over it.
+
+    Args:
+        name: Dataset name
+        spec: DatasetSpec (default DatasetSpec())
+        output_dir: Data root; the zip is written to {output_dir}/{name}.zip
+            and the converted dataset to {output_dir}/{name}
+        convert: Convert the zip into the indexed layout
+        legacy_json: Also write corpus.json, queries.json and qrels.json
+        compress: Deflate the zip members
+        runs: Optional list of (results path, RunSpec, results format)
+            to generate
+        k_values: k values of the runs' expected metrics
+
+    Returns:
+        Dict with the zip and dataset paths, the qrels count, the generation
+        time, the conversion stats and the expected metrics of every run
+    """
+    spec = spec or DatasetSpec()
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    zip_path = output_dir / f"{name}.zip"
+    dataset_dir = output_dir / name
+
+    started = time.perf_counter()
+    logger.info(
+        f"Generating {name}: {spec.num_docs} documents, {spec.num_queries} queries"
+    )
+    qrels = write_beir_zip(zip_path, name, spec, compress=compress)
+    summary = {
+        "zip_path": str(zip_path),
+        "dataset_dir": str(dataset_dir),
+        "qrels": sum(len(docs) for docs in qrels.values()),
+        "generate_seconds": round(time.perf_counter() - started, 3),
+    }
+    logger.info(f"Dataset written to {zip_path} in {summary['generate_seconds']}s")
+
+    if convert:
+        summary["conversion"] = convert_beir_zip(
+            zip_path, dataset_dir, legacy_json=legacy_json
+        )
+        with open(dataset_dir / SPEC_FILE, "w") as f:
+            json.dump({"name": name, **asdict(spec)}, f, indent=2)
+
+    summary["runs"] = {}
+    for results_path, run_spec, results_format in runs or []:
+        summary["runs"][str(results_path)] = generate_run(
+            qrels,
+            spec.num_docs,
+            results_path,
+            run_spec,
+            k_values=k_values,
+            results_format=results_format,
+            metadata={"dataset": name},
+        )
+        logger.info(f"Run written to {results_path}")
+    return summary
+
+
+def load_synthetic_qrels(dataset_dir):
+    """
+    Qrels and corpus size of a converted synthetic dataset, for generating
+    more runs over it
+
+    Returns:
+        Tuple of ({query_id: {doc_id: grade}}, number of documents)
+    """
+    # Imported here: only needed for datasets generated earlier
+    from py_metrics.dataset_store import DatasetStore, qrels_index_to_dict
+
+    dataset_dir = Path(dataset_dir)
+    if not (dataset_dir / SPEC_FILE).exists():
+        raise FileNotFoundError(f"{dataset_dir} is not a synthetic dataset")
+    with open(dataset_dir / SPEC_FILE) as f:
+        num_docs = json.load(f)["num_docs"]
+    qrels = qrels_index_to_dict(DatasetStore(dataset_dir).load_qrels_index())
+    return qrels, num_docs
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic BEIR dataset and runs of known quality"
+    )
+    parser.add_argument("name", help="Dataset name")
+    parser.add_argument(
+        "--output-dir", default=BEIR_DATA_ROOT_PATH, help="Data root to write to"
+    )
+    parser.add_argument("--docs", type=int, default=10000, help="Corpus documents")
+    parser.add_argument("--queries", type=int, default=1000, help="Queries")
+    parser.add_argument(
+        "--title-words", default="uniform:2,8", help="Title length distribution"
+    )
+    parser.add_argument(
+        "--doc-words", default="lognormal:55,0.5", help="Text length distribution"
+    )
+    parser.add_argument(
+        "--query-words", default="uniform:3,12", help="Query length distribution"
+    )
+    parser.add_argument(
+        "--relevant",
+        default="poisson:2",
+        help="Relevant documents per query (at least 1)",
+    )
+    parser.add_argument(
+        "--nonrelevant",
+        default="fixed:0",
+        help="Judged non-relevant documents per query",
+    )
+    parser.add_argument(
+        "--grades",
+        default="1:0.6,2:0.3,3:0.1",
+        help="Relevance grades and their shares, GRADE:WEIGHT,...",
+    )
+    parser.add_argument("--vocabulary", type=int, default=20000, help="Distinct words")
+    parser.add_argument("--split", default="test", help="Qrels split name")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--no-convert",
+        action="store_true",
+        help="Only write the zip, without converting it",
+    )
+    parser.add_argument(
+        "--legacy-json",
+        action="store_true",
+        help="Also write corpus.json, queries.json and qrels.json",
+    )
+    parser.add_argument(
+        "--store", action="store_true", help="Write the zip without compression"
+    )
+    parser.add_argument(
+        "--results",
+        nargs="+",
+        default=[],
+        help="Results files to generate, one run per file",
+    )
+    parser.add_argument("--results-format", choices=RESULTS_FORMATS, default="jsonl")
+    parser.add_argument(
+        "--depth", type=int, default=100, help="Results per query (default: 100)"
+    )
+    parser.add_argument(
+        "--recall",
+        nargs="+",
+        type=float,
+        default=[0.8],
+        help="Probability of retrieving each relevant document, one per run",
+    )
+    parser.add_argument(
+        "--nonrelevant-recall",
+        type=float,
+        default=0.5,
+        help="Probability of retrieving each judged non-relevant document",
+    )
+    parser.add_argument(
+        "--mean-rank",
+        nargs="+",
+        type=float,
+        default=[5.0],
+        help="Mean rank of the retrieved judged documents (0: ranked first), "
+        "one per run",
+    )
+    parser.add_argument(
+        "--k-values", nargs="+", type=int, help="k values of the expected metrics"
+    )
+    args = parser.parse_args()
+
+    spec = DatasetSpec(
+        num_docs=args.docs,
+        num_queries=args.queries,
+        title_words=args.title_words,
+        doc_words=args.doc_words,
+        query_words=args.query_words,
+        relevant_per_query=args.relevant,
+        nonrelevant_per_query=args.nonrelevant,
+        grades=parse_grades(args.grades),
+        vocabulary_size=args.vocabulary,
+        split=args.split,
+        seed=args.seed,
+    )
+    runs = []
+    for i, results_path in enumerate(args.results):
+        run_spec = RunSpec(
+            depth=args.depth,
+            recall=args.recall[min(i, len(args.recall) - 1)],
+            nonrelevant_recall=args.nonrelevant_recall,
+            mean_rank=args.mean_rank[min(i, len(args.mean_rank) - 1)],
+            seed=args.seed + i,
+        )
+        runs.append((results_path, run_spec, args.results_format))
+
+    summary = generate_dataset(
+        args.name,
+        spec,
+        output_dir=args.output_dir,
+        convert=not args.no_convert,
+        legacy_json=args.legacy_json,
+        compress=not args.store,
+        runs=runs,
+        k_values=args.k_values,
+    )
+    for results_path, expected in summary["runs"].items():
+        print(f"Expected metrics of {results_path}:")
+        print(json.dumps(expected, indent=4))
+
+
+if __name__ == "__main__":
+    main()
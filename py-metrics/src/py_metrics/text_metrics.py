@@ -0,0 +1,236 @@
+"""
+ROUGE and SQuAD-style token F1 / exact match for generated answers.
+
+ROUGE-1/2/L follow Google's rouge_score package (lowercased alphanumeric
+tokens, optional Porter stemming, best reference by F-measure), and token
+F1 / exact match follow the official SQuAD v1.1 evaluation script (answers
+normalized by lowercasing and dropping punctuation and articles, best
+reference by score).
+
+All metrics of a request share one TokenCache, so each distinct string is
+normalized, tokenized and n-gram counted once no matter how many metrics or
+pairs use it. ROUGE-L computes the longest common subsequence with a
+bit-parallel algorithm over Python integers: one shift-and-add step per
+token of the shorter text instead of a quadratic DP table.
+"""
+
+import re
+import string
+from collections import Counter
+from typing import Dict, List
+
+import numpy as np
+
+ROUGE_METRICS = ("rouge1", "rouge2", "rougeL")
+SQUAD_METRICS = ("token_f1", "exact_match")
+TEXT_METRICS = ROUGE_METRICS + SQUAD_METRICS
+
+_NON_ALPHANUMERIC = re.compile(r"[^a-z0-9]+")
+_ARTICLES = re.compile(r"\b(a|an|the)\b")
+_PUNCTUATION = str.maketrans("", "", string.punctuation)
+# rouge_score only stems tokens longer than this
+_MIN_STEM_LENGTH = 3
+
+
+def normalize_answer(text):
+    """Lowercase and drop punctuation, articles and extra whitespace (SQuAD)"""
+    text = text.lower().translate(_PUNCTUATION)
+    return " ".join(_ARTICLES.sub(" ", text).split())
+
+
+def fmeasure(precision, recall):
+    """Harmonic mean of precision and recall, 0 when both are 0"""
+    if precision + recall > 0:
+        return 2 * precision * recall / (precision + recall)
+    return 0.0
+
+
+class TokenCache:
+    """
+    Normalized tokens of each distinct string, computed once per request.
+
+    Tokens are mapped to integer ids from one shared vocabulary, so n-grams
+    are tuples of ints and LCS match masks are keyed by int.
+    """
+
+    def __init__(self, use_stemmer=False):
+        self._vocabulary = {}
+        self._stems = {}
+        self._stemmer = None
+        if use_stemmer:
+            from nltk.stem import porter
+
+            self._stemmer = porter.PorterStemmer()
+        self._squad = {}
+        self._rouge = {}
+        self._ngrams = {}
+        self._masks = {}
+
+    def _ids(self, tokens):
+        vocabulary = self._vocabulary
+        return tuple(vocabulary.setdefault(token, len(vocabulary)) for token in tokens)
+
+    def _stem(self, token):
+        stem = self._stems.get(token)
+        if stem is None:
+            stem = token
+            if len(token) > _MIN_STEM_LENGTH:
+                stem = self._stemmer.stem(token)
+            self._stems[token] = stem
+        return stem
+
+    def squad(self, text):
+        """SQuAD-normalized text and its token ids"""
+        entry = self._squad.get(text)
+        if entry is None:
+            normalized = normalize_answer(text)
+            entry = (normalized, self._ids(normalized.split()))
+            self._squad[text] = entry
+        return entry
+
+    def rouge(self, text):
+        """Token ids as produced by rouge_score's default tokenizer"""
+        tokens = self._rouge.get(text)
+        if tokens is None:
+            words = _NON_ALPHANUMERIC.sub(" ", text.lower()).split()
+            if self._stemmer is not None:
+                words = [self._stem(word) for word in words]
+                words = [word for word in words if not _NON_ALPHANUMERIC.search(word)]
+            tokens = self._ids(words)
+            self._rouge[text] = tokens
+        return tokens
+
+    def ngram_counts(self, text, n, scheme="rouge"):
+        """Counter of the n-grams of text's tokens under a normalization scheme"""
+        key = (scheme, n, text)
+        counts = self._ngrams.get(key)
+        if counts is None:
+            tokens = self.rouge(text) if scheme == "rouge" else self.squad(text)[1]
+            counts = Counter(zip(*(tokens[i:] for i in range(n))))
+            self._ngrams[key] = counts
+        return counts
+
+    def match_masks(self, text):
+        """
+        Bit mask of the positions of each token in text's ROUGE tokens, the
+        precomputed table of the bit-parallel LCS
+        """
+        masks = self._masks.get(text)
+        if masks is None:
+            masks = {}
+            for position, token in enumerate(self.rouge(text)):
+                masks[token] = masks.get(token, 0) | (1 << position)
+            self._masks[text] = masks
+        return masks
+
+
+def lcs_length(masks, length, tokens):
+    """
+    Length of the longest common subsequence of two token sequences.
+
+    Bit-parallel algorithm of Allison and Dix / Hyyrö: bit i of v is cleared
+    once row i of the LCS table has increased, so each token of the second
+    sequence is processed with a few big-integer operations.
+
+    Args:
+        masks: match_masks of the first sequence
+        length: Length of the first sequence
+        tokens: The second sequence
+    """
+    all_ones = (1 << length) - 1
+    v = all_ones
+    for token in tokens:
+        u = v & masks.get(token, 0)
+        v = ((v + u) | (v - u)) & all_ones
+    return length - v.bit_count()
+
+
+def _rouge_n(cache, prediction, reference, n):
+    prediction_counts = cache.ngram_counts(prediction, n)
+    reference_counts = cache.ngram_counts(reference, n)
+    overlap = (prediction_counts & reference_counts).total()
+    precision = overlap / max(prediction_counts.total(), 1)
+    recall = overlap / max(reference_counts.total(), 1)
+    return fmeasure(precision, recall)
+
+
+def _rouge_l(cache, prediction, reference):
+    prediction_tokens = cache.rouge(prediction)
+    reference_tokens = cache.rouge(reference)
+    if not prediction_tokens or not reference_tokens:
+        return 0.0
+    # Iterate over the shorter sequence, masking the longer one
+    if len(prediction_tokens) < len(reference_tokens):
+        lcs = lcs_length(
+            cache.match_masks(reference), len(reference_tokens), prediction_tokens
+        )
+    else:
+        lcs = lcs_length(
+            cache.match_masks(prediction), len(prediction_tokens), reference_tokens
+        )
+    return fmeasure(lcs / len(prediction_tokens), lcs / len(reference_tokens))
+
+
+def _token_f1(cache, prediction, reference):
+    prediction_tokens = cache.squad(prediction)[1]
+    reference_tokens = cache.squad(reference)[1]
+    if not prediction_tokens or not reference_tokens:
+        return float(prediction_tokens == reference_tokens)
+    overlap = (
+        cache.ngram_counts(prediction, 1, "squad")
+        & cache.ngram_counts(reference, 1, "squad")
+    ).total()
+    if overlap == 0:
+        return 0.0
+    return fmeasure(overlap / len(prediction_tokens), overlap / len(reference_tokens))
+
+
+def _exact_match(cache, prediction, reference):
+    return float(cache.squad(prediction)[0] == cache.squad(reference)[0])
+
+
+_SCORERS = {
+    "rouge1": lambda cache, p, r: _rouge_n(cache, p, r, 1),
+    "rouge2": lambda cache, p, r: _rouge_n(cache, p, r, 2),
+    "rougeL": _rouge_l,
+    "token_f1": _token_f1,
+    "exact_match": _exact_match,
+}
+
+
+def text_metric_scores(
+    predictions: List[str],
+    references: List[List[str]],
+    metrics: List[str],
+    use_stemmer: bool = False,
+) -> Dict[str, np.ndarray]:
+    """
+    Score each prediction against its references.
+
+    Args:
+        predictions: List of predicted answers
+        references: List of reference lists, one per prediction
+        metrics: Names from TEXT_METRICS
+        use_stemmer: Porter-stem tokens longer than 3 characters for ROUGE
+
+    Returns:
+        Dict mapping each metric to an array with one score per prediction,
+        the best over its references (0 without references). ROUGE scores
+        are F-measures.
+    """
+    unknown = set(metrics) - set(TEXT_METRICS)
+    if unknown:
+        raise ValueError(
+            f"Unknown text metrics {sorted(unknown)}, expected {TEXT_METRICS}"
+        )
+
+    cache = TokenCache(use_stemmer)
+    scores = {metric: np.zeros(len(predictions)) for metric in metrics}
+    for row, (prediction, refs) in enumerate(zip(predictions, references)):
+        for metric in metrics:
+            scorer = _SCORERS[metric]
+            scores[metric][row] = max(
+                (scorer(cache, prediction, reference) for reference in refs),
+                default=0.0,
+            )
+    return scores
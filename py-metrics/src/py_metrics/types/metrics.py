@@ -1,12 +1,16 @@
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, Field, field_validator
 from typing import List, Union, Optional, Literal
 
+from py_metrics.text_metrics import TEXT_METRICS
+
 
 # Mirroring ClassificationAverageStrategy
 ClassificationAverageStrategy = Literal[
     "binary", "micro", "macro", "weighted", "samples"
 ]
 ZeroDivisionStrategy = Literal[0, 1, "warn"]
+BleuSmoothing = Literal["none", "method1", "method2", "method3"]
+BleuTokenizer = Literal["whitespace", "word"]
 
 
 class BleuData(BaseModel):
@@ -14,6 +18,27 @@ class BleuData(BaseModel):
 
     predictions: List[str]
     references: List[List[str]]
+    # Score the whole corpus at once instead of averaging sentence scores
+    corpus_level: bool = False
+    # NLTK SmoothingFunction method; "none" is NLTK's default
+    smoothing: BleuSmoothing = "none"
+    max_order: int = Field(default=4, ge=1)
+    tokenizer: BleuTokenizer = "whitespace"
+
+    @field_validator("references")
+    def check_references_length(cls, v, values):
+        if "predictions" in values.data and len(v) != len(values.data["predictions"]):
+            raise ValueError("Length of references must match length of predictions")
+        return v
+
+
+class TextData(BaseModel):
+    """Data required for ROUGE, token F1 and exact match"""
+
+    predictions: List[str]
+    references: List[List[str]]
+    # Porter-stem tokens for ROUGE, as rouge_score's use_stemmer
+    use_stemmer: bool = False
 
     @field_validator("references")
     def check_references_length(cls, v, values):
@@ -55,6 +80,7 @@ class MetricsPayload(BaseModel):
 
     metrics_to_calculate: List[str]
     bleu_data: Optional[BleuData] = None
+    text_data: Optional[TextData] = None
     classification_data: Optional[ClassificationData] = None
 
     @field_validator("bleu_data")
@@ -69,6 +95,18 @@ class MetricsPayload(BaseModel):
             )
         return v
 
+    @field_validator("text_data")
+    def check_text_data_present(cls, v, values):
+        requested_text = any(
+            metric in values.data.get("metrics_to_calculate", [])
+            for metric in TEXT_METRICS
+        )
+        if requested_text and v is None:
+            raise ValueError(
+                f"text_data is required when any of {', '.join(TEXT_METRICS)} are in metrics_to_calculate"
+            )
+        return v
+
     @field_validator("classification_data")
     def check_classification_data_present(cls, v, values):
         requested_classification = any(
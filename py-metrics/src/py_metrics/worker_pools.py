@@ -0,0 +1,311 @@
+"""
+Worker pools that keep blocking work off the FastAPI event loop.
+
+CPU-heavy evaluation runs in a process pool so large runs neither hold the
+GIL nor stall other requests, while file and network I/O (dataset
+downloads, reading corpora/queries/qrels) runs in a thread pool. Each pool
+caps the number of tasks in flight with a semaphore; callers beyond the cap
+wait in the pool's queue, whose depth and timings are reported by stats().
+
+Worker processes keep per-process state such as the qrels cache, so the
+process pool can also broadcast() a function to every worker: each worker
+answers from a control thread, even while it is running a task.
+"""
+
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Number of processes evaluating runs; 0 evaluates in threads of the server process
+EVAL_PROCESS_WORKERS = int(
+    os.getenv("EVAL_PROCESS_WORKERS", str(min(4, os.cpu_count() or 1)))
+)
+# Number of threads for file and network I/O
+IO_THREAD_WORKERS = int(os.getenv("IO_THREAD_WORKERS", "8"))
+# Maximum number of tasks running at once in each pool; others queue
+MAX_CONCURRENT_EVALUATIONS = int(
+    os.getenv("MAX_CONCURRENT_EVALUATIONS", str(max(EVAL_PROCESS_WORKERS, 1)))
+)
+MAX_CONCURRENT_IO = int(os.getenv("MAX_CONCURRENT_IO", str(IO_THREAD_WORKERS)))
+# Processes a cpu_pool task may start for itself (BLEU chunks, result shards,
+# batch runs); None leaves it to each module's default. Process workers
+# already spread requests over the CPUs, so tasks there stay in-process
+# rather than nesting a pool per request
+CPU_TASK_WORKERS = 1 if EVAL_PROCESS_WORKERS > 0 else None
+# Seconds broadcast() waits for each worker process to answer
+WORKER_BROADCAST_TIMEOUT_SECONDS = float(
+    os.getenv("WORKER_BROADCAST_TIMEOUT_SECONDS", "10")
+)
+
+
+class WorkerPool:
+    """
+    An executor with a concurrency limit and queue-depth counters.
+
+    The executor is created lazily on first use so importing the module (or
+    forking an evaluation worker) does not spawn anything.
+    """
+
+    def __init__(self, name, make_executor, max_workers, max_concurrency):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_concurrency = max_concurrency
+        self._make_executor = make_executor
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._semaphore = None
+        self.active = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_wait_seconds = 0.0
+        self.total_run_seconds = 0.0
+
+    @property
+    def executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = self._make_executor(self.max_workers)
+            return self._executor
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) in the pool without blocking the event loop.
+
+        Returns:
+            The return value of fn; exceptions raised by fn propagate
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        self.submitted += 1
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        enqueued = time.perf_counter()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+        started = time.perf_counter()
+        self.total_wait_seconds += started - enqueued
+
+        self.active += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                self.executor, functools.partial(fn, *args, **kwargs)
+            )
+            self.completed += 1
+            return result
+        except BrokenExecutor:
+            # A worker process died; start a fresh executor for the next task
+            self.failed += 1
+            logger.error(f"{self.name} pool is broken, restarting it")
+            self.shutdown()
+            raise
+        except BaseException:
+            self.failed += 1
+            raise
+        finally:
+            self.active -= 1
+            self.total_run_seconds += time.perf_counter() - started
+            self._semaphore.release()
+
+    def broadcast(self, fn, timeout=WORKER_BROADCAST_TIMEOUT_SECONDS):
+        """
+        Run fn() in every worker process of the pool.
+
+        Threads share the calling process, so a thread pool has no workers
+        to broadcast to.
+
+        Returns:
+            List of fn's return values, one per worker process
+        """
+        return []
+
+    def shutdown(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def stats(self):
+        """Limits, queue depth and timing counters of the pool"""
+        finished = self.completed + self.failed
+        return {
+            "max_workers": self.max_workers,
+            "max_concurrency": self.max_concurrency,
+            "active": self.active,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_wait_seconds": (
+                self.total_wait_seconds / finished if finished else 0.0
+            ),
+            "avg_run_seconds": self.total_run_seconds / finished if finished else 0.0,
+        }
+
+
+def _start_control_thread(workers_started, connections):
+    """Executor initializer: claim a control pipe and serve it from a thread"""
+    with workers_started.get_lock():
+        connection = connections[workers_started.value]
+        workers_started.value += 1
+    threading.Thread(
+        target=_serve_control,
+        args=(connection,),
+        name="py-metrics-control",
+        daemon=True,
+    ).start()
+
+
+def _serve_control(connection):
+    while True:
+        try:
+            sequence, fn = connection.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            connection.send((sequence, True, fn()))
+        except Exception as e:
+            connection.send((sequence, False, repr(e)))
+
+
+class ProcessWorkerPool(WorkerPool):
+    """
+    A WorkerPool of processes, each serving a control pipe.
+
+    Worker processes are started by the executor as needed, and each claims
+    one of max_workers pipes when it starts, so broadcast() reaches exactly
+    the workers that exist.
+    """
+
+    def __init__(self, name, max_workers, max_concurrency):
+        super().__init__(
+            name, self._make_executor_with_control, max_workers, max_concurrency
+        )
+        self._connections = []
+        self._workers_started = None
+        self._broadcast_lock = threading.Lock()
+        self._sequence = 0
+
+    def _make_executor_with_control(self, max_workers):
+        context = multiprocessing.get_context()
+        pipes = [context.Pipe() for _ in range(max_workers)]
+        self._connections = [parent for parent, _ in pipes]
+        self._workers_started = context.Value("i", 0)
+        return ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=context,
+            initializer=_start_control_thread,
+            initargs=(self._workers_started, [child for _, child in pipes]),
+        )
+
+    def broadcast(self, fn, timeout=WORKER_BROADCAST_TIMEOUT_SECONDS):
+        """
+        Run fn() in every started worker process, alongside the tasks they
+        are running. fn must pickle and be thread-safe. Blocks until every
+        worker has answered or timeout seconds have passed, so call it
+        through run_io from async code.
+
+        Returns:
+            List of fn's return values, one per worker that answered in time
+        """
+        with self._executor_lock:
+            if self._executor is None:
+                return []
+            connections = self._connections[: self._workers_started.value]
+
+        results = []
+        with self._broadcast_lock:
+            self._sequence += 1
+            deadline = time.monotonic() + timeout
+            sent = []
+            for connection in connections:
+                try:
+                    connection.send((self._sequence, fn))
+                    sent.append(connection)
+                except OSError:
+                    logger.warning(f"A {self.name} worker is gone, skipping it")
+            for connection in sent:
+                while connection.poll(max(deadline - time.monotonic(), 0)):
+                    sequence, ok, value = connection.recv()
+                    if sequence != self._sequence:
+                        # Late answer to an earlier broadcast that timed out
+                        continue
+                    if ok:
+                        results.append(value)
+                    else:
+                        logger.warning(
+                            f"Broadcast failed in a {self.name} worker: {value}"
+                        )
+                    break
+                else:
+                    logger.warning(
+                        f"A {self.name} worker did not answer within {timeout}s"
+                    )
+        return results
+
+    def shutdown(self):
+        super().shutdown()
+        with self._executor_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+
+
+io_pool = WorkerPool(
+    "io",
+    lambda n: ThreadPoolExecutor(max_workers=n, thread_name_prefix="py-metrics-io"),
+    max_workers=IO_THREAD_WORKERS,
+    max_concurrency=MAX_CONCURRENT_IO,
+)
+
+if EVAL_PROCESS_WORKERS > 0:
+    cpu_pool = ProcessWorkerPool(
+        "cpu",
+        max_workers=EVAL_PROCESS_WORKERS,
+        max_concurrency=MAX_CONCURRENT_EVALUATIONS,
+    )
+else:
+    logger.info("EVAL_PROCESS_WORKERS=0, evaluating in server threads")
+    cpu_pool = WorkerPool(
+        "cpu",
+        lambda n: ThreadPoolExecutor(
+            max_workers=n, thread_name_prefix="py-metrics-cpu"
+        ),
+        max_workers=MAX_CONCURRENT_EVALUATIONS,
+        max_concurrency=MAX_CONCURRENT_EVALUATIONS,
+    )
+
+
+async def run_io(fn, *args, **kwargs):
+    """Run blocking file or network I/O in the thread pool"""
+    return await io_pool.run(fn, *args, **kwargs)
+
+
+async def run_cpu(fn, *args, **kwargs):
+    """Run CPU-heavy work in the evaluation pool; fn and its arguments must pickle"""
+    return await cpu_pool.run(fn, *args, **kwargs)
+
+
+def pool_stats():
+    """Stats of every worker pool, keyed by pool name"""
+    return {pool.name: pool.stats() for pool in (cpu_pool, io_pool)}
+
+
+def shutdown_pools():
+    for pool in (cpu_pool, io_pool):
+        pool.shutdown()
@@ -0,0 +1,189 @@
+"""Downloads from a local HTTP server, with and without range support."""
+
+import hashlib
+import io
+import json
+import random
+import re
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from py_metrics import beir_downloader
+from py_metrics.dataset_store import DatasetStore
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(self.server.data)))
+        if self.server.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+
+    def do_GET(self):
+        data = self.server.data
+        match = re.match(r"bytes=(\d+)-(\d+)", self.headers.get("Range") or "")
+        if self.server.ranges and match:
+            start, end = int(match[1]), int(match[2]) + 1
+            self.send_response(206)
+        else:
+            start, end = 0, len(data)
+            self.send_response(200)
+        self.send_header("Content-Length", str(end - start))
+        self.end_headers()
+        for pos in range(start, end, 4096):
+            with self.server.lock:
+                if self.server.fail_after == 0:
+                    # Drop the connection mid-response
+                    return
+                self.server.fail_after -= 1
+                chunk = data[pos : min(pos + 4096, end)]
+                self.server.served += len(chunk)
+            self.wfile.write(chunk)
+
+
+def _dataset_zip(num_docs=2000, corrupt=False):
+    rng = random.Random(0)
+    corpus = "".join(
+        json.dumps({"_id": f"d{i}", "title": "", "text": f"{rng.random()} " * 20})
+        + "\n"
+        for i in range(num_docs)
+    )
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as zf:
+        zf.writestr("toy/corpus.jsonl", corpus)
+        zf.writestr(
+            "toy/queries.jsonl",
+            "".join(json.dumps({"_id": f"q{i}", "text": "q"}) + "\n" for i in range(5)),
+        )
+        zf.writestr(
+            "toy/qrels/test.tsv",
+            "query-id\tcorpus-id\tscore\n"
+            + "".join(f"q{i}\td{i}\t1\n" for i in range(5)),
+        )
+    data = buffer.getvalue()
+    if corrupt:
+        # Flip a byte of the stored corpus, which only the CRC check catches
+        data = bytearray(data)
+        data[len(data) // 4] ^= 0xFF
+        data = bytes(data)
+    return data
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(beir_downloader, "DOWNLOAD_CHUNK_SIZE", 4096)
+    monkeypatch.setattr(beir_downloader, "DOWNLOAD_STATE_INTERVAL_BYTES", 16384)
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    srv.data = _dataset_zip()
+    srv.ranges = True
+    srv.fail_after = -1
+    srv.served = 0
+    srv.lock = threading.Lock()
+    thread = threading.Thread(
+        target=srv.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+    )
+    thread.start()
+    srv.url = f"http://127.0.0.1:{srv.server_port}/toy.zip"
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def _leftovers(output_path):
+    return [
+        p.exists()
+        for p in (
+            output_path.with_name(output_path.name + ".part"),
+            output_path.with_name(output_path.name + ".part.json"),
+        )
+    ]
+
+
+def test_parallel_range_download(server, tmp_path):
+    output_path = tmp_path / "toy.zip"
+    calls = []
+    beir_downloader.http_get(
+        server.url,
+        output_path,
+        num_parts=4,
+        expected_md5=hashlib.md5(server.data).hexdigest(),
+        progress=lambda **kwargs: calls.append(kwargs),
+    )
+    assert output_path.read_bytes() == server.data
+    assert server.served == len(server.data)
+    assert calls[-1] == {
+        "bytes_downloaded": len(server.data),
+        "bytes_total": len(server.data),
+    }
+    assert _leftovers(output_path) == [False, False]
+
+
+def test_resume_after_interrupted_part(server, tmp_path):
+    output_path = tmp_path / "toy.zip"
+    server.fail_after = len(server.data) // 4096 // 2
+    with pytest.raises(requests.RequestException):
+        beir_downloader.http_get(server.url, output_path, num_parts=4)
+    assert _leftovers(output_path) == [True, True]
+    state_path = tmp_path / "toy.zip.part.json"
+    done = sum(part["done"] for part in json.loads(state_path.read_text())["parts"])
+    assert done > 0
+
+    server.fail_after = -1
+    server.served = 0
+    beir_downloader.http_get(server.url, output_path, num_parts=4)
+    assert output_path.read_bytes() == server.data
+    # Only the bytes missing from the saved state are fetched again
+    assert server.served == len(server.data) - done
+    assert _leftovers(output_path) == [False, False]
+
+
+def test_server_without_range_support(server, tmp_path):
+    server.ranges = False
+    output_path = tmp_path / "toy.zip"
+    beir_downloader.http_get(server.url, output_path, num_parts=4)
+    assert output_path.read_bytes() == server.data
+    assert _leftovers(output_path) == [False, False]
+
+
+@pytest.mark.parametrize("ranges", [True, False])
+def test_checksum_failure_discards_partial_download(server, tmp_path, ranges):
+    server.ranges = ranges
+    output_path = tmp_path / "toy.zip"
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        beir_downloader.http_get(server.url, output_path, expected_md5="0" * 32)
+    assert not output_path.exists()
+    assert _leftovers(output_path) == [False, False]
+
+
+def test_crc_failure_discards_partial_download(server, tmp_path):
+    server.data = _dataset_zip(corrupt=True)
+    output_path = tmp_path / "toy.zip"
+    with pytest.raises(ValueError, match="Corrupt"):
+        beir_downloader.http_get(server.url, output_path)
+    assert not output_path.exists()
+    assert _leftovers(output_path) == [False, False]
+
+
+def test_download_beir_dataset(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        beir_downloader, "BEIR_DATASETS_URL", server.url.rsplit("/", 1)[0]
+    )
+    paths = beir_downloader.download_beir_dataset("toy", output_dir=tmp_path)
+    assert DatasetStore.is_indexed(tmp_path / "toy")
+    assert all(
+        (tmp_path / "toy" / name).exists() for name in ("corpus.jsonl", "queries.jsonl")
+    )
+    assert paths["qrels_path"] == str(tmp_path / "toy" / "qrels.npz")
+
+    # The dataset is indexed already, so nothing is fetched again
+    server.served = 0
+    beir_downloader.download_beir_dataset("toy", output_dir=tmp_path)
+    assert server.served == 0
@@ -0,0 +1,112 @@
+"""Agreement of the batched BLEU scores with NLTK."""
+
+import random
+import warnings
+
+import numpy as np
+import pytest
+from nltk.translate.bleu_score import SmoothingFunction, corpus_bleu, sentence_bleu
+
+from py_metrics import bleu
+from py_metrics.bleu import (
+    SMOOTHING_METHODS,
+    TOKENIZERS,
+    corpus_bleu_score,
+    sentence_bleu_scores,
+)
+
+_SMOOTHING = SmoothingFunction()
+NLTK_SMOOTHING = {
+    "none": None,
+    "method1": _SMOOTHING.method1,
+    "method2": _SMOOTHING.method2,
+    "method3": _SMOOTHING.method3,
+}
+VOCABULARY = [f"w{i}" for i in range(10)] + ["the", "a", "Paris.", "Paris"]
+
+
+def _pairs(n, seed=0):
+    rng = random.Random(seed)
+
+    def sentence():
+        return " ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(0, 12)))
+
+    predictions = [sentence() for _ in range(n)]
+    references = [[sentence() for _ in range(rng.randint(1, 3))] for _ in range(n)]
+    # Exact matches and a prediction without any shared n-gram
+    predictions[:2] = [references[0][0], "unmatched words only"]
+    return predictions, references
+
+
+PREDICTIONS, REFERENCES = _pairs(300)
+
+
+def _nltk_scores(predictions, references, max_order, smoothing, tokenizer):
+    tokenize = TOKENIZERS[tokenizer]
+    weights = (1 / max_order,) * max_order
+    hypotheses = [tokenize(p) for p in predictions]
+    reference_lists = [[tokenize(r) for r in refs] for refs in references]
+    with warnings.catch_warnings():
+        # NLTK warns about zero n-gram matches without smoothing
+        warnings.simplefilter("ignore")
+        sentence = [
+            sentence_bleu(
+                refs, hyp, weights=weights, smoothing_function=NLTK_SMOOTHING[smoothing]
+            )
+            for hyp, refs in zip(hypotheses, reference_lists)
+        ]
+        corpus = corpus_bleu(
+            reference_lists,
+            hypotheses,
+            weights=weights,
+            smoothing_function=NLTK_SMOOTHING[smoothing],
+        )
+    return np.array(sentence), corpus
+
+
+@pytest.mark.parametrize("tokenizer", sorted(TOKENIZERS))
+@pytest.mark.parametrize("max_order", [1, 2, 3, 4])
+@pytest.mark.parametrize("smoothing", SMOOTHING_METHODS)
+def test_matches_nltk(smoothing, max_order, tokenizer):
+    expected_sentence, expected_corpus = _nltk_scores(
+        PREDICTIONS, REFERENCES, max_order, smoothing, tokenizer
+    )
+    options = {
+        "max_order": max_order,
+        "smoothing": smoothing,
+        "tokenizer": tokenizer,
+        "workers": 1,
+    }
+    np.testing.assert_allclose(
+        sentence_bleu_scores(PREDICTIONS, REFERENCES, **options),
+        expected_sentence,
+        rtol=0,
+        atol=1e-12,
+    )
+    assert corpus_bleu_score(PREDICTIONS, REFERENCES, **options) == pytest.approx(
+        expected_corpus, abs=1e-12
+    )
+
+
+@pytest.mark.parametrize("smoothing", SMOOTHING_METHODS)
+def test_parallel_matches_nltk(monkeypatch, smoothing):
+    monkeypatch.setattr(bleu, "BLEU_PARALLEL_MIN_PAIRS", 100)
+    expected_sentence, expected_corpus = _nltk_scores(
+        PREDICTIONS, REFERENCES, 4, smoothing, "whitespace"
+    )
+    sentence = sentence_bleu_scores(
+        PREDICTIONS, REFERENCES, smoothing=smoothing, workers=3
+    )
+    np.testing.assert_allclose(sentence, expected_sentence, rtol=0, atol=1e-12)
+    np.testing.assert_array_equal(
+        sentence,
+        sentence_bleu_scores(PREDICTIONS, REFERENCES, smoothing=smoothing, workers=1),
+    )
+    assert corpus_bleu_score(
+        PREDICTIONS, REFERENCES, smoothing=smoothing, workers=3
+    ) == pytest.approx(expected_corpus, abs=1e-12)
+
+
+def test_empty_payload():
+    assert len(sentence_bleu_scores([], [], workers=1)) == 0
+    assert corpus_bleu_score([], [], workers=1) == 0.0
@@ -0,0 +1,93 @@
+"""Agreement of the NumPy engine with pytrec_eval through BEIR."""
+
+import random
+
+import pytest
+
+from py_metrics.beir_evaluator import evaluate_beir_results
+from py_metrics.fast_evaluator import METRIC_PREFIXES
+
+K_VALUES = [1, 2, 3, 5, 10, 100]
+
+QRELS = {
+    "q1": {"d1": 2, "d2": 0, "d3": 1, "d4": 3},
+    "q2": {"d9": 1},
+    "q3": {"d1": -1, "d5": 1, "d6": 2},
+    "q4": {"d2": 0, "d3": 0},
+    # Judges itself, which is dropped from the results like pytrec does
+    "q5": {"q5": 2, "d7": 1},
+}
+
+
+def evaluate_both(results, qrels=QRELS, k_values=K_VALUES):
+    return [
+        evaluate_beir_results(
+            {q: dict(docs) for q, docs in results.items()},
+            qrels=qrels,
+            k_values=k_values,
+            engine=engine,
+        )
+        for engine in ("beir", "numpy")
+    ]
+
+
+def assert_same(results, qrels=QRELS, k_values=K_VALUES):
+    expected, got = evaluate_both(results, qrels, k_values)
+    assert set(got) == set(METRIC_PREFIXES)
+    assert got == expected
+
+
+def test_ties_are_broken_like_pytrec():
+    assert_same(
+        {
+            "q1": {"d1": 1.0, "d2": 1.0, "d3": 1.0, "d4": 0.5, "d8": 1.0},
+            "q2": {"d0": 2.0, "d9": 2.0, "d8": 2.0},
+        }
+    )
+
+
+def test_graded_and_negative_qrels():
+    assert_same(
+        {
+            "q1": {"d4": 0.1, "d1": 0.9, "d3": 0.8, "d2": 0.7},
+            "q3": {"d1": 3.0, "d5": 2.0, "d6": 1.0},
+        }
+    )
+
+
+def test_only_nonrelevant_judgements():
+    assert_same({"q1": {"d1": 1.0}, "q4": {"d2": 2.0, "d3": 1.0}})
+
+
+def test_query_id_equal_to_doc_id():
+    assert_same({"q5": {"q5": 10.0, "d7": 1.0, "d8": 5.0}, "q2": {"q2": 1.0}})
+
+
+def test_queries_missing_from_qrels():
+    assert_same({"q1": {"d1": 1.0}, "unjudged": {"d1": 1.0, "d2": 0.5}})
+
+
+def test_no_common_queries():
+    assert_same({"unjudged": {"d1": 1.0}})
+
+
+@pytest.mark.parametrize("results", [{}, {"q1": {}}, {"q1": {}, "q2": {"d9": 1.0}}])
+def test_empty_results(results):
+    assert_same(results)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_runs(seed):
+    rng = random.Random(seed)
+    docs = [f"d{i}" for i in range(40)]
+    qrels = {
+        f"q{q}": {d: rng.choice([-1, 0, 1, 1, 2, 3]) for d in rng.sample(docs, 8)}
+        for q in range(30)
+    }
+    results = {
+        f"q{q}": {
+            d: round(rng.random(), 1) for d in rng.sample(docs, rng.randint(0, 30))
+        }
+        for q in range(35)
+    }
+    assert_same(results, qrels)
@@ -1,10 +1,15 @@
-import { downloadBeirDataset, fetchBeirCorpus } from "./utils/config";
+import {
+  downloadBeirDataset,
+  fetchBeirCorpusCount,
+  fetchBeirCorpusPages,
+} from "./utils/config";
 import { batchAddMemories } from "./api/supermemory";
 import type { AddMemoryRequest } from "./types/supermemory";
 import type { BeirCorpusDoc } from "./types/beir";
 import { env } from "./utils/config";
 
 const BATCH_SIZE = env.batchSize; // Number of documents to process in each batch
+const PAGE_SIZE = 1000; // Number of documents fetched from the corpus at a time
 
 const datasetName = env.datasetName;
 /**
@@ -41,55 +46,59 @@ async function loadBeirDatasetToSupermemory() {
   console.log(`Ensuring dataset ${datasetName} is downloaded...`);
   await downloadBeirDataset();
 
-  // Step 2: Fetch the corpus
-  console.log(`Fetching corpus for ${datasetName}...`);
-  const corpus = await fetchBeirCorpus();
-
-  // Log corpus size
-  const corpusSize = Object.keys(corpus).length;
+  // Step 2: Count the corpus
+  console.log(`Counting corpus for ${datasetName}...`);
+  const corpusSize = await fetchBeirCorpusCount();
   console.log(`Corpus contains ${corpusSize} documents`);
 
-  // Step 3: Process corpus documents in batches
+  // Step 3: Stream corpus pages and process them in batches
   console.log(
     `Starting to process corpus documents in batches of ${BATCH_SIZE}...`
   );
-  const documents = Object.values(corpus);
   let totalProcessed = 0;
   let successCount = 0;
   let errorCount = 0;
 
-  // Process in batches to avoid overwhelming the API
-  for (let i = 0; i < documents.length; i += BATCH_SIZE) {
-    const batch = documents.slice(i, i + BATCH_SIZE);
-
-    // Transform BEIR documents to memories
-    const memories = batch.map(beirDocToMemory);
-
-    try {
-      // Add the batch to Supermemory
-      const result = await batchAddMemories(memories);
-
-      // Count successful additions
-      successCount += result.length;
-      errorCount += batch.length - result.length;
-
-      // Log batch progress
-      totalProcessed += batch.length;
-      const percentComplete = ((totalProcessed / corpusSize) * 100).toFixed(2);
-      console.log(
-        `Processed ${totalProcessed}/${corpusSize} documents (${percentComplete}%)`
-      );
-      console.log(`Batch success: ${result.length}/${batch.length}`);
-    } catch (error) {
-      console.error(
-        `Error processing batch (documents ${i} to ${i + batch.length - 1}):`,
-        error
-      );
-      errorCount += batch.length;
+  for await (const documents of fetchBeirCorpusPages(PAGE_SIZE)) {
+    // Process in batches to avoid overwhelming the API
+    for (let i = 0; i < documents.length; i += BATCH_SIZE) {
+      const batch = documents.slice(i, i + BATCH_SIZE);
+      const batchStart = totalProcessed;
+
+      // Transform BEIR documents to memories
+      const memories = batch.map(beirDocToMemory);
+
+      try {
+        // Add the batch to Supermemory
+        const result = await batchAddMemories(memories);
+
+        // Count successful additions
+        successCount += result.length;
+        errorCount += batch.length - result.length;
+
+        // Log batch progress
+        totalProcessed += batch.length;
+        const percentComplete = ((totalProcessed / corpusSize) * 100).toFixed(
+          2
+        );
+        console.log(
+          `Processed ${totalProcessed}/${corpusSize} documents (${percentComplete}%)`
+        );
+        console.log(`Batch success: ${result.length}/${batch.length}`);
+      } catch (error) {
+        console.error(
+          `Error processing batch (documents ${batchStart} to ${
+            batchStart + batch.length - 1
+          }):`,
+          error
+        );
+        totalProcessed += batch.length;
+        errorCount += batch.length;
+      }
+
+      // Small delay to avoid overwhelming the API
+      await new Promise((resolve) => setTimeout(resolve, 100));
     }
-
-    // Small delay to avoid overwhelming the API
-    await new Promise((resolve) => setTimeout(resolve, 100));
   }
 
   // Final summary
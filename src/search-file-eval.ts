@@ -2,10 +2,9 @@ import fs from "fs";
 import path from "path";
 import { batchSearchMemories } from "./api/supermemory";
 import type { SearchRequest } from "./types/supermemory";
-import { env } from "./utils/config";
+import { env, fetchBeirQueries } from "./utils/config";
 
 const datasetName = env.datasetName;
-const beirDatasetPath = env.beirDatasetPath;
 
 let limit = 20;
 if (env.lgDatasets.includes(datasetName)) {
@@ -31,20 +30,9 @@ export async function searchAndSaveResults() {
   console.log(`Starting BEIR search for dataset: ${datasetName}`);
 
   try {
-    // Step 1: Fetch queries and qrels
-    console.log("Reading queries and relevance judgments from local files...");
-    const queriesFilePath = path.join(
-      beirDatasetPath,
-      datasetName,
-      "queries.json"
-    );
-
-    if (!fs.existsSync(queriesFilePath)) {
-      throw new Error(`Queries file not found: ${queriesFilePath}`);
-    }
-
-    const queriesString = fs.readFileSync(queriesFilePath, "utf8");
-    const queries = JSON.parse(queriesString); // Crucial: Parse the JSON string
+    // Step 1: Fetch queries
+    console.log("Fetching queries from the metrics server...");
+    const queries = await fetchBeirQueries();
 
     // Log basic stats
     const queryCount = Object.keys(queries).length;
@@ -7,6 +7,11 @@ export interface BeirCorpusDoc {
 
 export type BeirCorpus = Record<string, BeirCorpusDoc>;
 
+export interface BeirCorpusPage {
+  documents: BeirCorpusDoc[];
+  next_cursor: string | null;
+}
+
 export interface BeirQuery {
   _id: string;
   text: string;
@@ -37,6 +42,10 @@ export interface BeirEvaluationResults {
     map: Record<string, number>;
     recall: Record<string, number>;
     precision: Record<string, number>;
+    mrr?: Record<string, number>;
+    hit?: Record<string, number>;
+    r_precision?: Record<string, number>;
+    judged?: Record<string, number>;
   };
   dataset_name: string;
 }
@@ -1,4 +1,10 @@
-export type TextMetricName = "bleu";
+export type TextMetricName =
+  | "bleu"
+  | "rouge1"
+  | "rouge2"
+  | "rougeL"
+  | "token_f1"
+  | "exact_match";
 export type ClassificationMetricName = "f1" | "recall" | "precision";
 export type MetricName = TextMetricName | ClassificationMetricName;
 
@@ -9,9 +15,22 @@ export type ClassificationAverageStrategy =
   | "weighted"
   | "samples";
 
+export type BleuSmoothing = "none" | "method1" | "method2" | "method3";
+export type BleuTokenizer = "whitespace" | "word";
+
 export interface BleuData {
   predictions: string[];
   references: string[][];
+  corpus_level?: boolean;
+  smoothing?: BleuSmoothing;
+  max_order?: number;
+  tokenizer?: BleuTokenizer;
+}
+
+export interface TextData {
+  predictions: string[];
+  references: string[][];
+  use_stemmer?: boolean;
 }
 
 export interface ClassificationData {
@@ -26,5 +45,6 @@ export interface ClassificationData {
 export interface MetricsServicePayload {
   metrics_to_calculate: MetricName[];
   bleu_data?: BleuData;
+  text_data?: TextData;
   classification_data?: ClassificationData;
 }
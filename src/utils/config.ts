@@ -1,5 +1,11 @@
 import { config } from "dotenv";
-import type { BeirCorpus, BeirQueries, BeirQrels } from "../types/beir";
+import type {
+  BeirCorpus,
+  BeirCorpusDoc,
+  BeirCorpusPage,
+  BeirQueries,
+  BeirQrels,
+} from "../types/beir";
 import fs from "fs";
 
 // Load environment variables from .env file
@@ -146,6 +152,50 @@ export async function fetchBeirCorpus(): Promise<BeirCorpus> {
   }
 }
 
+export async function fetchBeirCorpusCount(): Promise<number> {
+  try {
+    const response = await fetch(
+      `${env.pymetricsApiUrl}/beir/corpus/${env.datasetName}/count`
+    );
+
+    if (!response.ok) {
+      throw new Error(`Failed to count corpus: ${response.statusText}`);
+    }
+
+    const body = await response.json();
+    return body.count;
+  } catch (error) {
+    console.error(`Error counting BEIR corpus for ${env.datasetName}:`, error);
+    throw error;
+  }
+}
+
+// Fetch the corpus page by page so only one page is held in memory at a time
+export async function* fetchBeirCorpusPages(
+  pageSize: number
+): AsyncGenerator<BeirCorpusDoc[]> {
+  let cursor: string | null = null;
+
+  do {
+    const params = new URLSearchParams({ limit: String(pageSize) });
+    if (cursor) {
+      params.set("cursor", cursor);
+    }
+
+    const response = await fetch(
+      `${env.pymetricsApiUrl}/beir/corpus/${env.datasetName}?${params}`
+    );
+
+    if (!response.ok) {
+      throw new Error(`Failed to fetch corpus page: ${response.statusText}`);
+    }
+
+    const page: BeirCorpusPage = await response.json();
+    yield page.documents;
+    cursor = page.next_cursor;
+  } while (cursor);
+}
+
 export async function fetchBeirQueries(): Promise<BeirQueries> {
   try {
     const response = await fetch(